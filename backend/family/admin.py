@@ -1,17 +1,104 @@
 from django.contrib import admin
-from .models import Person, FamilyRelationship
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils.functional import cached_property
+from .models import Person, FamilyRelationship, FamilyTree, Job, TreeSnapshot
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that avoids exact ``COUNT(*)`` over large tables.
+
+    Unfiltered changelists use the database's row estimate once the table is
+    larger than ``count_limit``; filtered ones count at most ``count_limit``
+    matching rows.
+    """
+
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.has_filters():
+            estimate = self._estimate_table_rows(connections[queryset.db], queryset.model._meta.db_table)
+            if estimate is not None and estimate > self.count_limit:
+                return estimate
+        return queryset[:self.count_limit].count()
+
+    @staticmethod
+    def _estimate_table_rows(connection, table):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [table])
+            elif connection.vendor == 'sqlite':
+                cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+            else:
+                return None
+            row = cursor.fetchone()
+        return int(row[0]) if row and row[0] is not None else None
+
+
+# Sorts after every character, closing the range of names with a given prefix.
+PREFIX_RANGE_END = '\U0010ffff'
+
+
+def name_prefix_search(queryset, term):
+    """Persons whose lower-cased name starts with ``term``.
+
+    ``LIKE`` on an expression cannot use an index on SQLite, and on
+    PostgreSQL only with a pattern operator class, so the prefix is also
+    given as a range, which the ``Lower('full_name')`` index serves on both.
+    """
+    prefix = term.lower()
+    return queryset.alias(name_lower=Lower('full_name')).filter(
+        name_lower__gte=prefix, name_lower__lt=prefix + PREFIX_RANGE_END, name_lower__startswith=prefix
+    )
+
+
+class NamePrefixSearchMixin:
+    """Admin search on person names that uses the name index.
+
+    A search matches names starting with the text. Starting it with ``*``
+    searches ``search_fields`` for the text anywhere in the name instead,
+    which scans the table; the paginator caps the count that follows.
+    """
+
+    substring_prefix = '*'
+    search_help_text = 'Finds names starting with the text. Start with * to match anywhere in the name (slow).'
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if term.startswith(self.substring_prefix):
+            return super().get_search_results(request, queryset, term[len(self.substring_prefix):].strip())
+        if not term:
+            return queryset, False
+        return self.name_prefix_results(queryset, term), False
+
+    def name_prefix_results(self, queryset, term):
+        raise NotImplementedError
+
+
+@admin.register(FamilyTree)
+class FamilyTreeAdmin(admin.ModelAdmin):
+    list_display = ['name', 'created_at', 'updated_at']
+    search_fields = ['name']
+    readonly_fields = ['id', 'created_at', 'updated_at']
 
 
 @admin.register(Person)
-class PersonAdmin(admin.ModelAdmin):
+class PersonAdmin(NamePrefixSearchMixin, admin.ModelAdmin):
     list_display = ['full_name', 'gender', 'date_of_birth', 'date_of_death', 'is_alive', 'age']
-    list_filter = ['gender', 'date_of_birth', 'date_of_death']
+    list_filter = ['tree', 'gender', 'date_of_birth', 'date_of_death']
+    # Used by ``*`` substring searches only.
     search_fields = ['full_name']
     readonly_fields = ['id', 'created_at', 'updated_at', 'age', 'is_alive']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     fieldsets = (
         ('Basic Information', {
-            'fields': ('full_name', 'gender', 'profile_photo')
+            'fields': ('tree', 'full_name', 'gender', 'profile_photo')
         }),
         ('Dates', {
             'fields': ('date_of_birth', 'date_of_death')
@@ -25,17 +112,29 @@ class PersonAdmin(admin.ModelAdmin):
         }),
     )
 
+    def name_prefix_results(self, queryset, term):
+        return name_prefix_search(queryset, term)
+
 
 @admin.register(FamilyRelationship)
-class FamilyRelationshipAdmin(admin.ModelAdmin):
+class FamilyRelationshipAdmin(NamePrefixSearchMixin, admin.ModelAdmin):
     list_display = ['relationship_type', 'person1', 'person2', 'marriage_date', 'divorce_date']
-    list_filter = ['relationship_type', 'marriage_date', 'divorce_date']
+    list_filter = ['tree', 'relationship_type', 'marriage_date', 'divorce_date']
+    list_select_related = ['person1', 'person2']
+    # Used by ``*`` substring searches only.
     search_fields = ['person1__full_name', 'person2__full_name']
+    autocomplete_fields = ['person1', 'person2']
     readonly_fields = ['id', 'created_at', 'updated_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def name_prefix_results(self, queryset, term):
+        persons = name_prefix_search(Person.objects.all(), term).values('pk')
+        return queryset.filter(Q(person1__in=persons) | Q(person2__in=persons))
 
     fieldsets = (
         ('Relationship Information', {
-            'fields': ('relationship_type', 'person1', 'person2')
+            'fields': ('tree', 'relationship_type', 'person1', 'person2')
         }),
         ('Marriage Information', {
             'fields': ('marriage_date', 'divorce_date'),
@@ -46,3 +145,27 @@ class FamilyRelationshipAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['task', 'status', 'attempts', 'max_attempts', 'run_after', 'updated_at']
+    list_filter = ['status', 'task']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    readonly_fields = [
+        'id', 'task', 'payload', 'attempts', 'locked_by', 'locked_at', 'result', 'error',
+        'created_at', 'updated_at'
+    ]
+
+
+@admin.register(TreeSnapshot)
+class TreeSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['root', 'generations', 'status', 'pinned', 'hits', 'size', 'built_at']
+    list_filter = ['status', 'pinned', 'tree']
+    list_select_related = ['root']
+    exclude = ['content', 'persons']
+    readonly_fields = [
+        'tree', 'root', 'generations', 'base_url', 'status', 'hits', 'size', 'built_at',
+        'created_at', 'updated_at'
+    ]
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FamilyConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'family'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,314 @@
+"""Duplicate person detection and merging.
+
+Candidates are blocked by tree and the Soundex code of the surname and compared only
+with people born within ``year_window`` years of each other (sorted
+neighbourhood), which keeps the number of comparisons close to linear.
+People without a birth date are further grouped by the Soundex code of their
+first name. Pairs are scored on name similarity, dates and shared relatives' names.
+"""
+import logging
+import unicodedata
+from bisect import bisect_right
+from collections import defaultdict, namedtuple
+from difflib import SequenceMatcher
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import snapshots
+from .models import ChangeLog, FamilyRelationship, LifeEvent, Person, Union
+
+logger = logging.getLogger(__name__)
+
+Candidate = namedtuple('Candidate', ['id', 'name', 'gender', 'date_of_birth', 'date_of_death'])
+DuplicatePair = namedtuple('DuplicatePair', ['person1', 'person2', 'score'])
+# ``skipped`` counts undated persons in groups too large to compare.
+DuplicateSearch = namedtuple('DuplicateSearch', ['pairs', 'skipped'])
+
+SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'),
+    **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'),
+    'l': '4',
+    **dict.fromkeys('mn', '5'),
+    'r': '6',
+}
+
+NAME_WEIGHT = 0.5
+DATE_WEIGHT = 0.3
+RELATIVE_WEIGHT = 0.2
+
+# People without a birth date are compared with everyone sharing their first
+# name key, so cap the number of them per key.
+MAX_UNDATED_GROUP_SIZE = 200
+
+
+def normalize_name(name):
+    """Lowercase, strip accents and punctuation, and collapse whitespace."""
+    decomposed = unicodedata.normalize('NFKD', name)
+    letters = ''.join(
+        char if char.isalpha() else ' '
+        for char in decomposed if not unicodedata.combining(char)
+    )
+    return ' '.join(letters.lower().split())
+
+
+def soundex(word):
+    """American Soundex code of ``word`` (e.g. ``robert`` -> ``R163``)."""
+    word = ''.join(char for char in word.lower() if char.isalpha())
+    if not word:
+        return ''
+
+    code = word[0].upper()
+    previous = SOUNDEX_CODES.get(word[0], '')
+    for char in word[1:]:
+        digit = SOUNDEX_CODES.get(char, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # 'h' and 'w' do not separate letters with the same code; vowels do.
+        if char not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+def blocking_key(normalized_name):
+    """Soundex code of the surname (last name token)."""
+    tokens = normalized_name.split()
+    return soundex(tokens[-1]) if tokens else ''
+
+
+def first_name_key(normalized_name):
+    """Soundex code of the first name, or ``''`` for a single-word name."""
+    tokens = normalized_name.split()
+    return soundex(tokens[0]) if len(tokens) > 1 else ''
+
+
+def _genders_compatible(first, second):
+    return first == second or 'O' in (first, second)
+
+
+def _date_score(first, second, year_window, both_missing=0.5):
+    """Similarity of two optional dates in 0..1; a date missing on one side is neutral."""
+    if first is None and second is None:
+        return both_missing
+    if first is None or second is None:
+        return 0.5
+    if first == second:
+        return 1.0
+    difference = abs(first.year - second.year)
+    if difference == 0:
+        return 0.8
+    if difference <= year_window:
+        return 0.4
+    return 0.0
+
+
+def candidate_pairs(candidates, year_window, skipped=None):
+    """Yield pairs of candidates that share a block and are close enough in birth year.
+
+    Candidates without a birth date are paired with everyone in the block
+    that shares their ``first_name_key``. Groups with more than
+    ``MAX_UNDATED_GROUP_SIZE`` undated candidates are not compared; their
+    undated candidates are appended to ``skipped``.
+    """
+    dated = sorted(
+        (candidate for candidate in candidates if candidate.date_of_birth),
+        key=lambda candidate: candidate.date_of_birth,
+    )
+
+    years = [candidate.date_of_birth.year for candidate in dated]
+    for index, candidate in enumerate(dated):
+        end = bisect_right(years, candidate.date_of_birth.year + year_window, lo=index + 1)
+        for other in dated[index + 1:end]:
+            yield candidate, other
+
+    undated_groups = defaultdict(list)
+    for candidate in candidates:
+        if not candidate.date_of_birth:
+            undated_groups[first_name_key(candidate.name)].append(candidate)
+    if not undated_groups:
+        return
+
+    dated_groups = defaultdict(list)
+    for candidate in dated:
+        dated_groups[first_name_key(candidate.name)].append(candidate)
+
+    for key, undated in undated_groups.items():
+        if len(undated) > MAX_UNDATED_GROUP_SIZE:
+            if skipped is not None:
+                skipped.extend(undated)
+            continue
+        for index, candidate in enumerate(undated):
+            for other in undated[index + 1:]:
+                yield candidate, other
+            for other in dated_groups.get(key, ()):
+                yield candidate, other
+
+
+def _relative_names(person_ids):
+    """Map each person to the normalized names of their spouses, parents and children."""
+    relatives = defaultdict(set)
+    person_ids = list(person_ids)
+    for start in range(0, len(person_ids), 500):
+        chunk = person_ids[start:start + 500]
+        for person1_id, person2_id, name1, name2 in FamilyRelationship.objects.filter(
+            Q(person1__in=chunk) | Q(person2__in=chunk)
+        ).values_list('person1', 'person2', 'person1__full_name', 'person2__full_name'):
+            relatives[person1_id].add(normalize_name(name2))
+            relatives[person2_id].add(normalize_name(name1))
+    return relatives
+
+
+def find_duplicates(queryset=None, threshold=0.8, year_window=2, name_threshold=0.75):
+    """Find likely duplicate persons and return a ``DuplicateSearch``, best matches first.
+
+    Streams ``(id, name, gender, dates)`` rows, scores name and date
+    similarity within each block, and loads relatives only for pairs whose
+    names are similar enough to matter.
+    """
+    if queryset is None:
+        queryset = Person.objects.all()
+
+    blocks = defaultdict(list)
+    for person_id, tree_id, full_name, gender, date_of_birth, date_of_death in queryset.order_by().values_list(
+        'id', 'tree', 'full_name', 'gender', 'date_of_birth', 'date_of_death'
+    ).iterator(chunk_size=5000):
+        name = normalize_name(full_name)
+        key = blocking_key(name)
+        if key:
+            # Never pair people from different trees.
+            blocks[tree_id, key].append(Candidate(person_id, name, gender, date_of_birth, date_of_death))
+
+    scored = []
+    skipped = []
+    for block in blocks.values():
+        if len(block) < 2:
+            continue
+        for first, second in candidate_pairs(block, year_window, skipped):
+            if not _genders_compatible(first.gender, second.gender):
+                continue
+            name_score = SequenceMatcher(None, first.name, second.name).ratio()
+            if name_score < name_threshold:
+                continue
+            date_score = (
+                _date_score(first.date_of_birth, second.date_of_birth, year_window)
+                # Two missing death dates agree: both people are presumably alive.
+                + _date_score(first.date_of_death, second.date_of_death, year_window, both_missing=1.0)
+            ) / 2
+            scored.append((first.id, second.id, name_score, date_score))
+
+    relatives = _relative_names({person_id for pair in scored for person_id in pair[:2]})
+    pairs = []
+    for first_id, second_id, name_score, date_score in scored:
+        first_relatives = relatives.get(first_id, set())
+        second_relatives = relatives.get(second_id, set())
+        if first_relatives and second_relatives:
+            relative_score = len(first_relatives & second_relatives) / len(first_relatives | second_relatives)
+        else:
+            relative_score = 0.5
+        score = NAME_WEIGHT * name_score + DATE_WEIGHT * date_score + RELATIVE_WEIGHT * relative_score
+        if score >= threshold:
+            pairs.append(DuplicatePair(first_id, second_id, round(score, 3)))
+
+    pairs.sort(key=lambda pair: pair.score, reverse=True)
+    if skipped:
+        logger.warning(
+            "Skipped %s persons without a birth date in name groups of more than %s", len(skipped),
+            MAX_UNDATED_GROUP_SIZE,
+        )
+    return DuplicateSearch(pairs, len(skipped))
+
+
+def merge_persons(keep_id, duplicate_id):
+    """Merge ``duplicate_id`` into ``keep_id`` and delete the duplicate.
+
+    Relationships are re-pointed with bulk updates. Edges that would become
+    self-references or repeat an existing edge of the kept person are deleted
+    instead. Blank fields on the kept person are filled from the duplicate.
+    """
+    if keep_id == duplicate_id:
+        raise ValueError('Cannot merge a person into themselves')
+
+    with transaction.atomic():
+        keep = Person.objects.select_for_update().get(pk=keep_id)
+        duplicate = Person.objects.select_for_update().get(pk=duplicate_id)
+        if keep.tree_id != duplicate.tree_id:
+            raise ValueError('Cannot merge persons from different family trees')
+
+        existing = set()
+        for relationship_type, person1_id, person2_id in FamilyRelationship.objects.filter(
+            Q(person1=keep) | Q(person2=keep)
+        ).values_list('relationship_type', 'person1', 'person2'):
+            existing.add((relationship_type, person1_id, person2_id))
+            if relationship_type == 'spouse':
+                existing.add((relationship_type, person2_id, person1_id))
+
+        to_delete = []
+        repoint_person1 = []
+        repoint_person2 = []
+        for rel_id, relationship_type, person1_id, person2_id in FamilyRelationship.objects.filter(
+            Q(person1=duplicate) | Q(person2=duplicate)
+        ).values_list('id', 'relationship_type', 'person1', 'person2'):
+            new_person1 = keep.pk if person1_id == duplicate.pk else person1_id
+            new_person2 = keep.pk if person2_id == duplicate.pk else person2_id
+            if new_person1 == new_person2 or (relationship_type, new_person1, new_person2) in existing:
+                to_delete.append(rel_id)
+                continue
+
+            existing.add((relationship_type, new_person1, new_person2))
+            if relationship_type == 'spouse':
+                existing.add((relationship_type, new_person2, new_person1))
+            if person1_id == duplicate.pk:
+                repoint_person1.append(rel_id)
+            else:
+                repoint_person2.append(rel_id)
+
+        FamilyRelationship.objects.filter(pk__in=to_delete).delete()
+        now = timezone.now()
+        FamilyRelationship.objects.filter(pk__in=repoint_person1).update(person1=keep, updated_at=now)
+        FamilyRelationship.objects.filter(pk__in=repoint_person2).update(person2=keep, updated_at=now)
+        ChangeLog.record('relationship', repoint_person1 + repoint_person2, 'update', tree_id=keep.tree_id)
+        LifeEvent.objects.filter(person=duplicate, relationship__isnull=False).update(person=keep)
+        LifeEvent.objects.filter(spouse=duplicate).update(spouse=keep)
+        Union.sync_persons([keep.pk])
+        # The bulk updates above skip the signals that keep snapshots current.
+        snapshots.invalidate([keep.pk, duplicate.pk])
+
+        update_fields = [
+            field for field in ('date_of_birth', 'date_of_death', 'profile_photo', 'notes')
+            if not getattr(keep, field) and getattr(duplicate, field)
+        ]
+        for field in update_fields:
+            setattr(keep, field, getattr(duplicate, field))
+        if update_fields:
+            keep.save(update_fields=[*update_fields, 'updated_at'])
+
+        duplicate.delete()
+
+    return keep
+
+
+def merge_pairs(pairs):
+    """Merge each pair's second person into its first, following earlier merges.
+
+    Returns the number of persons removed.
+    """
+    merged_into = {}
+
+    def resolve(person_id):
+        while person_id in merged_into:
+            person_id = merged_into[person_id]
+        return person_id
+
+    removed = 0
+    for pair in pairs:
+        keep_id, duplicate_id = resolve(pair.person1), resolve(pair.person2)
+        if keep_id == duplicate_id:
+            continue
+        merge_persons(keep_id, duplicate_id)
+        merged_into[duplicate_id] = keep_id
+        removed += 1
+    return removed
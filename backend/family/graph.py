@@ -0,0 +1,348 @@
+"""Batched loading and traversal of the family relationship graph."""
+from collections import namedtuple
+
+from django.db.models import Q
+
+from .models import FamilyRelationship, Person, Union
+
+
+class RelationshipIndex:
+    """Spouse, parent and child relationships for a set of persons, loaded in one query.
+
+    Each mapping goes from a person id to ``FamilyRelationship`` instances
+    (with both persons selected) in the model's default ordering.
+    """
+
+    def __init__(self, person_ids):
+        person_ids = list(person_ids)
+        self.spouses = {person_id: [] for person_id in person_ids}
+        self.parents = {person_id: [] for person_id in person_ids}
+        self.children = {person_id: [] for person_id in person_ids}
+
+        relationships = FamilyRelationship.objects.filter(
+            Q(person1__in=person_ids) | Q(person2__in=person_ids)
+        ).select_related('person1', 'person2')
+
+        for rel in relationships:
+            if rel.relationship_type == 'spouse':
+                if rel.person1_id in self.spouses:
+                    self.spouses[rel.person1_id].append(rel)
+                if rel.person2_id in self.spouses and rel.person2_id != rel.person1_id:
+                    self.spouses[rel.person2_id].append(rel)
+            else:
+                if rel.person1_id in self.children:
+                    self.children[rel.person1_id].append(rel)
+                if rel.person2_id in self.parents:
+                    self.parents[rel.person2_id].append(rel)
+
+
+def _load_edge_map(person_ids, max_generations, from_field, to_field):
+    """Load ``from_field -> [to_field]`` parent-child edges breadth-first, one query per generation."""
+    edges = {}
+    frontier = set(person_ids)
+
+    for _ in range(max_generations):
+        frontier -= edges.keys()
+        if not frontier:
+            break
+        for person_id in frontier:
+            edges[person_id] = []
+        for source_id, target_id in FamilyRelationship.objects.filter(
+            relationship_type='parent_child',
+            **{f'{from_field}__in': frontier},
+        ).values_list(from_field, to_field):
+            edges[source_id].append(target_id)
+        frontier = {target_id for person_id in frontier for target_id in edges[person_id]}
+
+    return edges
+
+
+def load_parent_map(person_ids, max_generations):
+    """Map each person to their parents, up to ``max_generations`` above ``person_ids``."""
+    return _load_edge_map(person_ids, max_generations, 'person2', 'person1')
+
+
+def load_child_map(person_ids, max_generations):
+    """Map each person to their children, up to ``max_generations`` below ``person_ids``."""
+    return _load_edge_map(person_ids, max_generations, 'person1', 'person2')
+
+
+def walk(edges, start, max_generations):
+    """Breadth-first generation distances from ``start`` over an in-memory edge map."""
+    distances = {start: 0}
+    frontier = [start]
+
+    for generation in range(1, max_generations + 1):
+        next_frontier = []
+        for person_id in frontier:
+            for related_id in edges.get(person_id, ()):
+                if related_id not in distances:
+                    distances[related_id] = generation
+                    next_frontier.append(related_id)
+        if not next_frontier:
+            break
+        frontier = next_frontier
+
+    return distances
+
+
+def common_ancestors(person_ids, max_generations):
+    """Most recent common ancestors of ``person_ids``.
+
+    Returns ``{ancestor_id: {person_id: generations}}``. A person who is an
+    ancestor of all the others counts as their own common ancestor, at
+    generation 0. Common ancestors that are ancestors of another common
+    ancestor are dropped.
+    """
+    parents = load_parent_map(person_ids, max_generations)
+    distances = {person_id: walk(parents, person_id, max_generations) for person_id in person_ids}
+
+    common = set.intersection(*(set(found) for found in distances.values()))
+
+    # Everything reachable upwards from a common ancestor's parents is not "most recent".
+    above = set()
+    frontier = [parent_id for ancestor_id in common for parent_id in parents.get(ancestor_id, ())]
+    while frontier:
+        next_frontier = []
+        for person_id in frontier:
+            if person_id not in above:
+                above.add(person_id)
+                next_frontier.extend(parents.get(person_id, ()))
+        frontier = next_frontier
+
+    return {
+        ancestor_id: {person_id: distances[person_id][ancestor_id] for person_id in person_ids}
+        for ancestor_id in common - above
+    }
+
+
+def shared_descendants(person_ids, max_generations):
+    """Descendants shared by all of ``person_ids``.
+
+    Returns ``{descendant_id: {person_id: generations}}``.
+    """
+    children = load_child_map(person_ids, max_generations)
+    distances = {person_id: walk(children, person_id, max_generations) for person_id in person_ids}
+
+    shared = set.intersection(*(set(found) for found in distances.values())) - set(person_ids)
+    return {
+        descendant_id: {person_id: distances[person_id][descendant_id] for person_id in person_ids}
+        for descendant_id in shared
+    }
+
+
+def parent_unions(person_ids):
+    """Map each of ``person_ids`` to the set of unions they are a child of, in one query."""
+    unions = {person_id: set() for person_id in person_ids}
+    for person_id, union_id in Union.children.through.objects.filter(
+        person__in=list(unions)
+    ).values_list('person', 'union'):
+        unions[person_id].add(union_id)
+    return unions
+
+
+def is_full_sibling(own_unions, sibling_unions):
+    """Whether two children of a shared parent have all their parents in common.
+
+    A child of two or more parents is in the union of each pair of them, so
+    equal sets of parent unions mean equal sets of parents. Two children of
+    a shared parent without any union both have only that parent.
+    """
+    return own_unions == sibling_unions
+
+
+def siblings(person_id):
+    """Full and half sibling ids of ``person_id``, in one query.
+
+    Loads every child of the person's parents together with the unions it
+    is a child of.
+    """
+    unions = {}
+    for child_id, union_id in FamilyRelationship.objects.filter(
+        relationship_type='parent_child',
+        person1__in=FamilyRelationship.objects.filter(
+            relationship_type='parent_child', person2=person_id
+        ).values('person1'),
+    ).values_list('person2', 'person2__parent_unions'):
+        found = unions.setdefault(child_id, set())
+        if union_id is not None:
+            found.add(union_id)
+
+    own_unions = unions.pop(person_id, None)
+    if own_unions is None:
+        return [], []
+    full = [child_id for child_id, found in unions.items() if is_full_sibling(own_unions, found)]
+    half = [child_id for child_id, found in unions.items() if not is_full_sibling(own_unions, found)]
+    return full, half
+
+
+RELATION_GROUPS = (
+    'spouses', 'parents', 'children', 'siblings', 'half_siblings', 'grandparents',
+    'grandchildren', 'aunts_uncles', 'nieces_nephews', 'cousins', 'in_laws',
+)
+
+
+def kinship(path):
+    """Relation group for a path of ``'up'``, ``'down'`` and ``'spouse'`` steps.
+
+    Going down to a child and back up to its other parent counts as a
+    spouse step, so co-parents are treated like spouses. Any path through a
+    spouse other than the spouse themselves is an in-law.
+    """
+    steps = []
+    for step in path:
+        if step == 'up' and steps and steps[-1] == 'down':
+            steps[-1] = 'spouse'
+        else:
+            steps.append(step)
+
+    if 'spouse' in steps:
+        return 'spouses' if steps == ['spouse'] else 'in_laws'
+
+    # Without spouse steps the path is always some ups followed by some downs.
+    ups = steps.count('up')
+    downs = len(steps) - ups
+    if not downs:
+        return 'parents' if ups == 1 else 'grandparents'
+    if not ups:
+        return 'children' if downs == 1 else 'grandchildren'
+    if ups == 1:
+        return 'siblings' if downs == 1 else 'nieces_nephews'
+    return 'aunts_uncles' if downs == 1 else 'cousins'
+
+
+def neighborhood(person_id, radius, max_nodes):
+    """Relatives within ``radius`` relationship steps of ``person_id``, grouped by relation.
+
+    Every spouse or parent-child relationship is one step. The walk is
+    breadth-first with one relationship query per step, plus one loading the
+    parent unions of siblings, and stops once ``max_nodes`` relatives are found. Returns ``(groups, distances,
+    truncated)``: ``groups`` maps each of ``RELATION_GROUPS`` to relative ids
+    in the order they were reached, and ``distances`` maps each relative to
+    their number of steps.
+    """
+    paths = {person_id: ()}
+    frontier = [person_id]
+    truncated = False
+
+    for distance in range(1, radius + 1):
+        if not frontier or truncated:
+            break
+        frontier_set = set(frontier)
+        steps = {source_id: [] for source_id in frontier}
+        for relationship_type, person1_id, person2_id in FamilyRelationship.objects.filter(
+            Q(person1__in=frontier) | Q(person2__in=frontier)
+        ).values_list('relationship_type', 'person1', 'person2'):
+            if relationship_type == 'spouse':
+                forward, backward = 'spouse', 'spouse'
+            else:
+                forward, backward = 'down', 'up'
+            if person1_id in frontier_set:
+                steps[person1_id].append((person2_id, forward))
+            if person2_id in frontier_set:
+                steps[person2_id].append((person1_id, backward))
+
+        reached = {}
+        for source_id in frontier:
+            for target_id, step in steps[source_id]:
+                if target_id in paths:
+                    continue
+                path = paths[source_id] + (step,)
+                # Of several shortest paths prefer the one by blood.
+                if target_id not in reached or (
+                    kinship(reached[target_id]) == 'in_laws' and kinship(path) != 'in_laws'
+                ):
+                    reached[target_id] = path
+
+        frontier = []
+        for target_id, path in reached.items():
+            if len(paths) > max_nodes:
+                truncated = True
+                break
+            paths[target_id] = path
+            frontier.append(target_id)
+
+    del paths[person_id]
+    groups = {group: [] for group in RELATION_GROUPS}
+    for relative_id, path in paths.items():
+        groups[kinship(path)].append(relative_id)
+
+    # The walk may not have reached a sibling's other parents; their unions tell.
+    if groups['siblings']:
+        unions = parent_unions([person_id, *groups['siblings']])
+        candidates = groups['siblings']
+        groups['siblings'] = [
+            sibling_id for sibling_id in candidates if is_full_sibling(unions[person_id], unions[sibling_id])
+        ]
+        groups['half_siblings'] = [
+            sibling_id for sibling_id in candidates
+            if not is_full_sibling(unions[person_id], unions[sibling_id])
+        ]
+    distances = {relative_id: len(path) for relative_id, path in paths.items()}
+    return groups, distances, truncated
+
+
+TreeData = namedtuple('TreeData', ['expanded', 'spouses', 'children', 'rows'])
+
+
+def collect_tree(root_id, generations, fields):
+    """Collect couples and children ``generations`` levels below ``root_id``.
+
+    Issues two queries per generation, one for the married unions of the
+    generation with their children and one for its parent-child edges, plus
+    one loading ``fields`` for every person in the tree. ``expanded`` lists
+    the persons whose spouses and children were loaded, in breadth-first
+    order. ``spouses`` maps each of them to ``(spouse_id, couple)`` pairs
+    where ``couple`` holds the marriage dates and the ids of the children of
+    that marriage.
+    """
+    expanded = {}
+    spouses = {}
+    children = {}
+    frontier = [root_id]
+
+    for _ in range(generations):
+        frontier = [person_id for person_id in dict.fromkeys(frontier) if person_id not in expanded]
+        if not frontier:
+            break
+        expanded.update(dict.fromkeys(frontier))
+
+        frontier_set = set(frontier)
+        couples = {}
+        # One row per child of each union; a union without children gives a single row with None.
+        for union_id, partner1_id, partner2_id, marriage_date, divorce_date, child_id in Union.objects.filter(
+            Q(partner1__in=frontier) | Q(partner2__in=frontier),
+            relationship__isnull=False,
+        ).order_by('-relationship__created_at').values_list(
+            'id', 'partner1', 'partner2', 'relationship__marriage_date', 'relationship__divorce_date', 'children'
+        ):
+            if union_id not in couples:
+                couple = couples[union_id] = {
+                    'marriage_date': marriage_date, 'divorce_date': divorce_date, 'children': set()
+                }
+                if partner1_id in frontier_set:
+                    spouses.setdefault(partner1_id, []).append((partner2_id, couple))
+                if partner2_id in frontier_set:
+                    spouses.setdefault(partner2_id, []).append((partner1_id, couple))
+            if child_id is not None:
+                couples[union_id]['children'].add(child_id)
+
+        for person_id in frontier:
+            children[person_id] = []
+        for parent_id, child_id in FamilyRelationship.objects.filter(
+            relationship_type='parent_child',
+            person1__in=frontier,
+        ).values_list('person1', 'person2'):
+            children[parent_id].append(child_id)
+
+        frontier = [child_id for person_id in frontier for child_id in children[person_id]]
+
+    person_ids = {root_id}
+    for person_id in expanded:
+        person_ids.update(spouse_id for spouse_id, _ in spouses.get(person_id, ()))
+        person_ids.update(children[person_id])
+    rows = {
+        row['id']: row
+        for row in Person.objects.filter(pk__in=person_ids).values(*fields)
+    }
+    return TreeData(list(expanded), spouses, children, rows)
@@ -0,0 +1,147 @@
+"""Server-side layered layout for descendant trees.
+
+Each generation is a row. A person and their spouses sit side by side as one
+unit, centered over the combined width of their children's subtrees. Results
+are cached as rendered JSON per (root, generations, tree data version) in a
+per-process LRU cache bounded by ``FAMILY_LAYOUT_CACHE_BYTES``.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .graph import collect_tree
+from .models import ChangeLog
+from .renderers import FastJSONRenderer
+from .serializers import PERSON_SUMMARY_FIELDS, person_summary
+
+NODE_WIDTH = 160
+NODE_GAP = 40
+LEVEL_HEIGHT = 200
+
+
+class LayoutCache:
+    """Thread-safe LRU cache of byte strings with a total size budget."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            content = self._entries.get(key)
+            if content is not None:
+                self._entries.move_to_end(key)
+            return content
+
+    def set(self, key, content):
+        if len(content) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous)
+            self._entries[key] = content
+            self.current_bytes += len(content)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+
+layout_cache = LayoutCache(settings.FAMILY_LAYOUT_CACHE_BYTES)
+
+
+def compute_layout(root_id, generations):
+    """Compute x/y positions for ``root_id`` and ``generations`` levels of descendants.
+
+    ``x`` is the horizontal center of a node and ``y`` its row. Each person is
+    placed once, at their first position in depth-first order.
+    """
+    tree = collect_tree(root_id, generations, PERSON_SUMMARY_FIELDS)
+    expanded = set(tree.expanded)
+    placed = set()
+    nodes = []
+    links = []
+
+    def add_node(person_id, x, depth):
+        node = person_summary(tree.rows[person_id])
+        node.update({'x': x, 'y': depth * LEVEL_HEIGHT, 'generation': depth})
+        nodes.append(node)
+
+    def place(person_id, depth, left):
+        """Lay out ``person_id``'s unit and subtree starting at ``left``; returns the right edge."""
+        placed.add(person_id)
+        expand = depth < generations and person_id in expanded
+        couples = {
+            spouse_id: couple for spouse_id, couple in tree.spouses.get(person_id, ())
+            if spouse_id not in placed
+        } if expand else {}
+        spouse_ids = list(couples)
+        placed.update(spouse_ids)
+        unit_width = (1 + len(spouse_ids)) * NODE_WIDTH + len(spouse_ids) * NODE_GAP
+
+        first_child_node = len(nodes)
+        cursor = left
+        child_ids = []
+        for child_id in (tree.children.get(person_id, ()) if expand else ()):
+            if child_id not in placed:
+                cursor = place(child_id, depth + 1, cursor) + NODE_GAP
+                child_ids.append(child_id)
+        children_width = cursor - NODE_GAP - left if child_ids else 0
+
+        if children_width >= unit_width:
+            unit_left = left + (children_width - unit_width) / 2
+        else:
+            # Center the narrower children block under the unit.
+            unit_left = left
+            offset = (unit_width - children_width) / 2
+            for node in nodes[first_child_node:]:
+                node['x'] += offset
+
+        for index, member_id in enumerate([person_id, *spouse_ids]):
+            add_node(member_id, unit_left + index * (NODE_WIDTH + NODE_GAP) + NODE_WIDTH / 2, depth)
+
+        for spouse_id in spouse_ids:
+            links.append({'type': 'spouse', 'source': person_id, 'target': spouse_id})
+        links.extend({'type': 'child', 'source': person_id, 'target': child_id} for child_id in child_ids)
+        for spouse_id, couple in couples.items():
+            links.extend(
+                {'type': 'child', 'source': spouse_id, 'target': child_id}
+                for child_id in child_ids if child_id in couple['children']
+            )
+
+        return left + max(unit_width, children_width)
+
+    width = place(root_id, 0, 0)
+    return {
+        'root': root_id,
+        'generations': generations,
+        'width': width,
+        'height': max(node['y'] for node in nodes) + LEVEL_HEIGHT,
+        'nodes': nodes,
+        'links': links,
+    }
+
+
+def get_layout(root_id, generations, tree_id):
+    """Rendered layout JSON for ``root_id`` at its tree's current data version, memoized.
+
+    Versioning by tree means writes to other trees don't invalidate the layout.
+    """
+    version = ChangeLog.latest_cursor(ChangeLog.objects.filter(tree_id=tree_id))
+    key = (root_id, generations, version)
+
+    content = layout_cache.get(key)
+    if content is None:
+        layout = compute_layout(root_id, generations)
+        layout['version'] = version
+        content = FastJSONRenderer().render(layout)
+        layout_cache.set(key, content)
+    return content
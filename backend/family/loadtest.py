@@ -0,0 +1,274 @@
+"""Asyncio HTTP load generator for replaying a mix of API traffic.
+
+Each virtual user keeps one HTTP/1.1 keep-alive connection open and sends
+requests back to back, picking a scenario by weight for every request. The
+client only uses the standard library, so it can run anywhere the backend
+runs and compare servers (WSGI or ASGI), database settings and caches on
+equal terms.
+"""
+import asyncio
+import json
+import math
+import random
+import time
+from collections import defaultdict
+from urllib.parse import quote, urlencode, urlsplit
+
+DEFAULT_MIX = {'search': 40, 'retrieve': 30, 'tree': 20, 'create': 10}
+
+
+class HTTPConnection:
+    """Minimal HTTP/1.1 client connection on asyncio streams.
+
+    With ``keepalive`` the connection is reused between requests; otherwise
+    every request opens a new one.
+    """
+
+    def __init__(self, host, port, keepalive=True):
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=None, form=False):
+        """Send a request and return ``(status, body bytes)``.
+
+        ``body`` is sent as JSON, or form-encoded with ``form``. If the server
+        closed a reused keep-alive connection before answering, the request is
+        sent once more on a new connection.
+        """
+        head = [
+            f'{method} {path} HTTP/1.1',
+            f'Host: {self.host}:{self.port}',
+            'Accept: application/json',
+        ]
+        if body is None:
+            payload = b''
+        elif form:
+            payload = urlencode(body).encode()
+            head.append('Content-Type: application/x-www-form-urlencoded')
+        else:
+            payload = json.dumps(body).encode()
+            head.append('Content-Type: application/json')
+        head.append(f'Content-Length: {len(payload)}')
+        if not self.keepalive:
+            head.append('Connection: close')
+        message = ('\r\n'.join(head) + '\r\n\r\n').encode() + payload
+
+        reused = self.writer is not None
+        try:
+            status_line = await self._send(message)
+        except ConnectionError:
+            if not reused:
+                raise
+            # Idle keep-alive connections may be closed by the server at any
+            # time; no response was started, so nothing was processed.
+            await self.close()
+            status_line = await self._send(message)
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            content = b''
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                content += chunk[:-2]
+        elif 'content-length' in headers:
+            content = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            content = await self.reader.read()
+            headers['connection'] = 'close'
+
+        if not self.keepalive or headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, content
+
+    async def _send(self, message):
+        """Write ``message``, opening the connection if needed, and return the status line."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(message)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Server closed the connection')
+        return status_line
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        self.reader = self.writer = None
+
+
+class Scenarios:
+    """Requests for each scenario name, drawn from a sample of existing persons.
+
+    Each scenario is a coroutine that sends one or more requests and records
+    every response under an endpoint label.
+    """
+
+    def __init__(self, persons, prefix='/api', tree=None, seed=None):
+        # persons: list of (id, full_name, tree_id) rows to build requests from.
+        # prefix is the API root; with tree, requests go to that tree's routes.
+        self.persons = persons
+        self.api_prefix = prefix.rstrip('/')
+        self.prefix = self.tree_prefix(tree) if tree else self.api_prefix
+        self.rng = random.Random(seed)
+
+    def tree_prefix(self, tree_id):
+        return f'{self.api_prefix}/trees/{tree_id}'
+
+    async def search(self, send):
+        _, full_name, _ = self.rng.choice(self.persons)
+        term = full_name.split()[-1][:4]
+        await send('search', 'GET', f'{self.prefix}/persons/?name={quote(term)}')
+
+    async def retrieve(self, send):
+        person_id, _, _ = self.rng.choice(self.persons)
+        await send('retrieve', 'GET', f'{self.prefix}/persons/{person_id}/')
+
+    async def tree(self, send):
+        person_id, _, _ = self.rng.choice(self.persons)
+        await send('tree', 'GET', f'{self.prefix}/persons/{person_id}/family_tree/?generations=3')
+
+    async def layout(self, send):
+        person_id, _, _ = self.rng.choice(self.persons)
+        await send('layout', 'GET', f'{self.prefix}/persons/{person_id}/layout/')
+
+    async def create(self, send):
+        """Add a child to a random person: one person insert and one relationship insert.
+
+        Always uses the parent's tree routes, so the child lands in the same tree.
+        """
+        parent_id, full_name, tree_id = self.rng.choice(self.persons)
+        tree_prefix = self.tree_prefix(tree_id)
+        # Person create accepts form data only (multipart for photo uploads).
+        status, content = await send('create_person', 'POST', f'{tree_prefix}/persons/', {
+            'full_name': f'Load Test {full_name.split()[-1]}',
+            'gender': self.rng.choice('MF'),
+        }, form=True)
+        if status == 201:
+            child_id = json.loads(content)['id']
+            await send(
+                'create_relationship', 'POST',
+                f'{tree_prefix}/relationships/create_parent_child_relationship/',
+                {'parent': str(parent_id), 'child': child_id},
+            )
+
+
+class LoadTest:
+    """Run weighted scenarios from ``concurrency`` virtual users and collect latencies."""
+
+    def __init__(self, base_url, scenarios, mix, concurrency, duration=None, requests=None, keepalive=True):
+        url = urlsplit(base_url)
+        self.host = url.hostname or '127.0.0.1'
+        self.port = url.port or 80
+        self.scenarios = scenarios
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.concurrency = concurrency
+        self.duration = duration
+        self.requests = requests
+        self.keepalive = keepalive
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.sent = 0
+        self.elapsed = 0
+
+    def _should_continue(self, deadline):
+        if self.requests is not None and self.sent >= self.requests:
+            return False
+        return deadline is None or time.perf_counter() < deadline
+
+    async def _user(self, deadline):
+        connection = HTTPConnection(self.host, self.port, keepalive=self.keepalive)
+
+        async def send(label, method, path, body=None, form=False):
+            self.sent += 1
+            started = time.perf_counter()
+            try:
+                status, content = await connection.request(method, path, body, form)
+            except (ConnectionError, OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                await connection.close()
+                self.errors[label] += 1
+                return 0, b''
+            self.latencies[label].append(time.perf_counter() - started)
+            if status >= 400:
+                self.errors[label] += 1
+            return status, content
+
+        try:
+            while self._should_continue(deadline):
+                name = self.scenarios.rng.choices(self.names, self.weights)[0]
+                await getattr(self.scenarios, name)(send)
+        finally:
+            await connection.close()
+
+    async def run(self):
+        started = time.perf_counter()
+        deadline = started + self.duration if self.duration else None
+        await asyncio.gather(*(self._user(deadline) for _ in range(self.concurrency)))
+        self.elapsed = time.perf_counter() - started
+        return self.report()
+
+    def report(self):
+        """Per-endpoint request counts, errors, throughput and latency percentiles in milliseconds."""
+        rows = [
+            self._summary(label, self.latencies[label], self.errors[label])
+            for label in sorted(set(self.latencies) | set(self.errors))
+        ]
+        all_latencies = [latency for values in self.latencies.values() for latency in values]
+        rows.append(self._summary('total', all_latencies, sum(self.errors.values())))
+        return rows
+
+    def _summary(self, label, latencies, errors):
+        latencies = sorted(latencies)
+        return {
+            'endpoint': label,
+            'requests': len(latencies),
+            'errors': errors,
+            'throughput': len(latencies) / self.elapsed if self.elapsed else 0,
+            'p50': percentile(latencies, 50) * 1000,
+            'p95': percentile(latencies, 95) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'max': (latencies[-1] if latencies else 0) * 1000,
+        }
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list; 0 for an empty list."""
+    if not sorted_values:
+        return 0
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def parse_mix(value):
+    """Parse ``search=40,retrieve=30`` into a weight per scenario name."""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if not hasattr(Scenarios, name) or name.startswith('_'):
+            raise ValueError(f'Unknown scenario: {name}')
+        mix[name] = int(weight) if weight else 1
+        if mix[name] < 0:
+            raise ValueError(f'Weight for {name} must not be negative')
+    if not any(mix.values()):
+        raise ValueError('At least one scenario needs a positive weight')
+    return mix
@@ -0,0 +1,72 @@
+import csv
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from family.audit import CHECKS, audit
+from family.models import Person
+
+
+class Command(BaseCommand):
+    help = (
+        'Check every person and relationship for impossible dates, too many parents, duplicate '
+        'spouses and unlinked persons, and report what was found'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tree',
+            help='Only audit the family tree with this id (default: all trees)'
+        )
+        parser.add_argument(
+            '--check', action='append', choices=list(CHECKS), dest='checks',
+            help='Run only this check; repeat for several (default: all checks)'
+        )
+        parser.add_argument(
+            '--output', metavar='PATH',
+            help='Write every issue to this CSV file (default: only print the summary)'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=5,
+            help='Examples to print per check (default: 5)'
+        )
+
+    def handle(self, *args, **options):
+        if options['limit'] < 0:
+            raise CommandError('--limit must not be negative')
+        if options['tree']:
+            try:
+                uuid.UUID(options['tree'])
+            except ValueError:
+                raise CommandError(f"--tree must be a family tree id, not {options['tree']!r}")
+
+        started = time.monotonic()
+        persons, relationships, issues = audit(tree_id=options['tree'], checks=options['checks'])
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(f'Audited {persons} persons and {relationships} relationships in {elapsed:.1f}s')
+        examples = {name: found[:options['limit']] for name, found in issues.items()}
+        names = dict(Person.objects.filter(
+            pk__in={
+                person_id for found in examples.values() for issue in found
+                for person_id in (issue.person, issue.other) if person_id
+            }
+        ).values_list('id', 'full_name'))
+
+        for name, found in issues.items():
+            style = self.style.WARNING if found else self.style.SUCCESS
+            self.stdout.write(style(f'{len(found):8d}  {CHECKS[name].__doc__.rstrip(".")} ({name})'))
+            for issue in examples[name]:
+                people = f'{names.get(issue.person)} ({issue.person})'
+                if issue.other:
+                    people += f' / {names.get(issue.other)} ({issue.other})'
+                self.stdout.write(f'          {people}: {issue.detail}')
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as report:
+                writer = csv.writer(report)
+                writer.writerow(['check', 'person', 'other', 'relationship', 'detail'])
+                for found in issues.values():
+                    writer.writerows(found)
+            self.stdout.write(f"Wrote {sum(map(len, issues.values()))} issues to {options['output']}")
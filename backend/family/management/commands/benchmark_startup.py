@@ -0,0 +1,136 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Each run is a fresh interpreter that loads the application the way a new
+# worker does and serves two requests in-process, without a network server.
+WORKER_SCRIPT = '''
+import time
+
+started_at = time.time()
+started = time.perf_counter()
+
+import importlib
+import json
+import os
+import sys
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings_module!r})
+path, interface, application_path = sys.argv[1:4]
+module_name, attribute = application_path.rsplit('.', 1)
+application = getattr(importlib.import_module(module_name), attribute)
+
+if interface == 'asgi':
+    import asyncio
+
+    def serve():
+        messages = []
+        body_sent = []
+
+        async def receive():
+            if body_sent:
+                # Nothing more to send; the server cancels this once it has responded.
+                await asyncio.Future()
+            body_sent.append(True)
+            return {{'type': 'http.request', 'body': b'', 'more_body': False}}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {{
+            'type': 'http', 'asgi': {{'version': '3.0'}}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+            'query_string': b'', 'headers': [(b'host', b'localhost')],
+            'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+        }}
+        asyncio.run(application(scope, receive, send))
+        return messages[0]['status']
+else:
+    from wsgiref.util import setup_testing_defaults
+
+    def serve():
+        environ = {{'PATH_INFO': path, 'HTTP_HOST': 'localhost'}}
+        setup_testing_defaults(environ)
+        statuses = []
+        b''.join(application(environ, lambda status, headers, exc_info=None: statuses.append(status)))
+        return int(statuses[0].split()[0])
+
+loaded = time.perf_counter()
+status = serve()
+first = time.perf_counter()
+serve()
+second = time.perf_counter()
+print(json.dumps({{
+    'started_at': started_at,
+    'status': status,
+    'load': loaded - started,
+    'first_request': first - loaded,
+    'warm_request': second - first,
+}}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measure worker cold start: application load time and time to first request'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs', type=int, default=5,
+            help='Number of fresh worker processes to start (default: 5)'
+        )
+        parser.add_argument(
+            '--path', default='/api/persons/',
+            help='Path requested by each worker (default: /api/persons/)'
+        )
+        parser.add_argument(
+            '--asgi', action='store_true',
+            help='Load the ASGI application instead of the WSGI one'
+        )
+        parser.add_argument(
+            '--preload', action='store_true',
+            help='Start workers with FAMILY_PRELOAD_URLCONF=1, importing the URLconf at load time'
+        )
+
+    def handle(self, *args, **options):
+        interface = 'asgi' if options['asgi'] else 'wsgi'
+        application_path = settings.ASGI_APPLICATION if options['asgi'] else settings.WSGI_APPLICATION
+        script = WORKER_SCRIPT.format(settings_module=os.environ['DJANGO_SETTINGS_MODULE'])
+        env = {**os.environ, 'FAMILY_PRELOAD_URLCONF': '1' if options['preload'] else '0'}
+
+        samples = {
+            'interpreter': [], 'load': [], 'first_request': [], 'time_to_first_request': [], 'warm_request': []
+        }
+        runs = max(options['runs'], 1)
+        for _ in range(runs):
+            spawned_at = time.time()
+            completed = subprocess.run(
+                [sys.executable, '-c', script, options['path'], interface, application_path],
+                capture_output=True, text=True, cwd=settings.BASE_DIR, env=env,
+            )
+            if completed.returncode != 0:
+                raise CommandError(f'Worker failed to start:\n{completed.stderr}')
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            if result['status'] >= 400:
+                self.stderr.write(self.style.WARNING(f"{options['path']} returned {result['status']}"))
+
+            interpreter = max(result['started_at'] - spawned_at, 0)
+            samples['interpreter'].append(interpreter)
+            samples['load'].append(result['load'])
+            samples['first_request'].append(result['first_request'])
+            samples['time_to_first_request'].append(interpreter + result['load'] + result['first_request'])
+            samples['warm_request'].append(result['warm_request'])
+
+        preload = ', URLconf preloaded' if options['preload'] else ''
+        self.stdout.write(f"{interface.upper()} cold start over {runs} run(s), GET {options['path']}{preload}")
+        self.stdout.write(f'{"":<22}{"min ms":>9}{"median ms":>11}{"max ms":>9}')
+        for name, values in samples.items():
+            self.stdout.write(
+                f'{name:<22}{min(values) * 1000:9.1f}{statistics.median(values) * 1000:11.1f}'
+                f'{max(values) * 1000:9.1f}'
+            )
@@ -0,0 +1,36 @@
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from family.models import PhotoUpload
+
+
+class Command(BaseCommand):
+    help = 'Delete photo uploads that have not changed for a while, along with their temporary files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=float, default=24,
+            help='Delete uploads, finished or not, last written more than this many hours ago (default: 24)'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        # Deleting the rows removes their part files (see signals.remove_upload_part).
+        deleted, _ = PhotoUpload.objects.filter(updated_at__lt=cutoff).delete()
+
+        # Part files without an upload, e.g. left by a crashed worker.
+        known = {str(upload_id) for upload_id in PhotoUpload.objects.values_list('id', flat=True)}
+        orphans = 0
+        for path in Path(settings.FAMILY_PHOTO_UPLOAD_DIR).glob('*.part'):
+            if path.stem not in known and path.stat().st_mtime < time.time() - options['hours'] * 3600:
+                path.unlink(missing_ok=True)
+                orphans += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} uploads and {orphans} orphaned part files'
+        ))
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+
+from family.dedupe import find_duplicates, merge_pairs
+from family.models import Person
+
+
+class Command(BaseCommand):
+    help = 'Find likely duplicate persons and optionally merge them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold', type=float, default=0.8,
+            help='Minimum match score between 0 and 1 (default: 0.8)'
+        )
+        parser.add_argument(
+            '--year-window', type=int, default=2,
+            help='Only compare people born within this many years of each other (default: 2)'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=50,
+            help='Number of pairs to print (default: 50)'
+        )
+        parser.add_argument(
+            '--tree',
+            help='Only search the family tree with this id (default: all trees)'
+        )
+        parser.add_argument(
+            '--merge', action='store_true',
+            help='Merge every pair above the threshold into the earlier-created person'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Searching for duplicate persons...')
+        queryset = Person.objects.filter(tree_id=options['tree']) if options['tree'] else None
+        pairs, skipped = find_duplicates(
+            queryset, threshold=options['threshold'], year_window=options['year_window']
+        )
+        self.stdout.write(f'Found {len(pairs)} candidate pair(s)')
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f'Skipped {skipped} person(s) without a birth date: too many share their surname and first name keys'
+            ))
+
+        names = dict(
+            Person.objects.filter(
+                pk__in={person_id for pair in pairs[:options['limit']] for person_id in pair[:2]}
+            ).values_list('id', 'full_name')
+        )
+        for pair in pairs[:options['limit']]:
+            self.stdout.write(
+                f'{pair.score:.3f}  {names.get(pair.person1)} ({pair.person1})  '
+                f'<->  {names.get(pair.person2)} ({pair.person2})'
+            )
+
+        if options['merge'] and pairs:
+            created = dict(
+                Person.objects.filter(
+                    pk__in={person_id for pair in pairs for person_id in pair[:2]}
+                ).values_list('id', 'created_at')
+            )
+            ordered = [
+                pair if created[pair.person1] <= created[pair.person2]
+                else pair._replace(person1=pair.person2, person2=pair.person1)
+                for pair in pairs
+            ]
+            removed = merge_pairs(ordered)
+            self.stdout.write(self.style.SUCCESS(f'Merged {removed} duplicate person(s)'))
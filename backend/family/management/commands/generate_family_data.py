@@ -0,0 +1,147 @@
+import random
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from family.models import ChangeLog, FamilyRelationship, FamilyTree, LifeEvent, Person, Union
+
+FIRST_NAMES = {
+    'M': [
+        'James', 'John', 'Robert', 'Michael', 'William', 'David', 'Richard', 'Joseph', 'Thomas',
+        'Charles', 'Daniel', 'Matthew', 'Anthony', 'Mark', 'Paul', 'Steven', 'Andrew', 'Peter',
+        'George', 'Edward', 'Henry', 'Samuel', 'Benjamin', 'Arthur', 'Walter', 'Frank',
+    ],
+    'F': [
+        'Mary', 'Patricia', 'Jennifer', 'Linda', 'Elizabeth', 'Barbara', 'Susan', 'Jessica',
+        'Sarah', 'Karen', 'Nancy', 'Margaret', 'Emma', 'Dorothy', 'Helen', 'Anna', 'Ruth',
+        'Alice', 'Grace', 'Rose', 'Clara', 'Evelyn', 'Frances', 'Martha', 'Lucy', 'Julia',
+    ],
+}
+
+SURNAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Wilson',
+    'Anderson', 'Taylor', 'Thomas', 'Moore', 'Martin', 'Jackson', 'Thompson', 'White', 'Harris',
+    'Clark', 'Lewis', 'Walker', 'Hall', 'Allen', 'Young', 'King', 'Wright', 'Scott', 'Green',
+    'Baker', 'Adams', 'Nelson', 'Hill', 'Campbell', 'Mitchell', 'Roberts', 'Carter', 'Phillips',
+    'Evans', 'Turner', 'Parker', 'Collins', 'Edwards', 'Stewart', 'Morris', 'Murphy', 'Cook',
+]
+
+
+class Command(BaseCommand):
+    help = 'Generate a large synthetic family tree for load and performance testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--persons', type=int, default=10000,
+            help='Approximate number of persons to create (default: 10000)'
+        )
+        parser.add_argument(
+            '--generations', type=int, default=6,
+            help='Generations below each founding couple (default: 6)'
+        )
+        parser.add_argument(
+            '--tree-name', default='Generated',
+            help='Name of the new family tree the data is created in (default: Generated)'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed, so runs can be reproduced (default: 0)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Rows per bulk insert (default: 2000)'
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.persons = []
+        self.relationships = []
+        target = options['persons']
+
+        tree = FamilyTree.objects.create(name=options['tree_name'])
+        self.tree_id = tree.pk
+        self.stdout.write(f'Generating about {target} persons in tree "{tree.name}" ({tree.pk})...')
+
+        while len(self.persons) < target:
+            founder_birth = date(1700, 1, 1) + timedelta(days=self.rng.randrange(250 * 365))
+            founder = self.new_person(self.rng.choice(SURNAMES), founder_birth)
+            self.expand(founder, options['generations'], target)
+
+        # Bulk inserts skip the model signals, so life events, unions and
+        # change log entries are written here in bulk as well.
+        with transaction.atomic():
+            Person.objects.bulk_create(self.persons, batch_size=self.batch_size)
+            FamilyRelationship.objects.bulk_create(self.relationships, batch_size=self.batch_size)
+
+            events = [event for person in self.persons for event in LifeEvent.events_for_person(person)]
+            events.extend(
+                event for relationship in self.relationships
+                for event in LifeEvent.events_for_relationship(relationship)
+            )
+            LifeEvent.objects.bulk_create(events, batch_size=self.batch_size)
+            Union.rebuild(tree_id=tree.pk)
+
+            ChangeLog.record('person', [person.pk for person in self.persons], 'create', tree_id=tree.pk)
+            ChangeLog.record(
+                'relationship', [relationship.pk for relationship in self.relationships], 'create',
+                tree_id=tree.pk
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(self.persons)} persons, {len(self.relationships)} relationships '
+            f'and {len(events)} life events in tree {tree.pk}'
+        ))
+
+    def new_person(self, surname, date_of_birth, gender=None):
+        gender = gender or self.rng.choice('MF')
+        lifespan = timedelta(days=self.rng.randrange(40 * 365, 95 * 365))
+        date_of_death = date_of_birth + lifespan
+        person = Person(
+            tree_id=self.tree_id,
+            full_name=f'{self.rng.choice(FIRST_NAMES[gender])} {surname}',
+            gender=gender,
+            date_of_birth=date_of_birth,
+            date_of_death=date_of_death if date_of_death < date.today() else None,
+        )
+        self.persons.append(person)
+        return person
+
+    def expand(self, person, generations, target):
+        """Give ``person`` a spouse and children, recursing ``generations`` levels down."""
+        if generations <= 0 or len(self.persons) >= target or self.rng.random() > 0.8:
+            return
+
+        spouse_birth = person.date_of_birth + timedelta(days=self.rng.randrange(-5 * 365, 5 * 365))
+        spouse = self.new_person(
+            self.rng.choice(SURNAMES), spouse_birth, gender='F' if person.gender == 'M' else 'M'
+        )
+        marriage_date = max(person.date_of_birth, spouse_birth) + timedelta(
+            days=self.rng.randrange(18 * 365, 35 * 365)
+        )
+        divorce_date = None
+        if self.rng.random() < 0.1:
+            divorce_date = marriage_date + timedelta(days=self.rng.randrange(365, 20 * 365))
+        self.relationships.append(FamilyRelationship(
+            tree_id=self.tree_id,
+            relationship_type='spouse',
+            person1=person,
+            person2=spouse,
+            marriage_date=marriage_date,
+            divorce_date=divorce_date if divorce_date and divorce_date < date.today() else None,
+        ))
+
+        # Children take their father's surname.
+        father = person if person.gender == 'M' else spouse
+        surname = father.full_name.rsplit(' ', 1)[-1]
+        for _ in range(self.rng.choice([1, 2, 2, 3, 3, 4])):
+            child_birth = marriage_date + timedelta(days=self.rng.randrange(300, 20 * 365))
+            if child_birth > date.today():
+                break
+            child = self.new_person(surname, child_birth)
+            for parent in (person, spouse):
+                self.relationships.append(FamilyRelationship(
+                    tree_id=self.tree_id, relationship_type='parent_child', person1=parent, person2=child
+                ))
+            self.expand(child, generations - 1, target)
@@ -0,0 +1,104 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from family.loadtest import DEFAULT_MIX, LoadTest, Scenarios, parse_mix
+from family.models import Person
+
+
+class Command(BaseCommand):
+    help = 'Replay a mix of API traffic against a running server and report latency per endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://127.0.0.1:8000',
+            help='Base URL of the server under test (default: http://127.0.0.1:8000)'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=10,
+            help='Number of virtual users, each with its own connection (default: 10)'
+        )
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Seconds to run for (default: 30)'
+        )
+        parser.add_argument(
+            '--requests', type=int,
+            help='Stop after this many requests instead of after --duration'
+        )
+        parser.add_argument(
+            '--mix', default=','.join(f'{name}={weight}' for name, weight in DEFAULT_MIX.items()),
+            help='Scenario weights: search, retrieve, tree, layout, create '
+                 '(default: %(default)s)'
+        )
+        parser.add_argument(
+            '--prefix', default='/api',
+            help='Path of the API root on the server (default: /api)'
+        )
+        parser.add_argument(
+            '--tree',
+            help='Send requests to the <prefix>/trees/<id>/ routes and sample persons from that tree'
+        )
+        parser.add_argument(
+            '--sample-size', type=int, default=1000,
+            help='Number of existing persons to draw request targets from (default: 1000)'
+        )
+        parser.add_argument(
+            '--seed', type=int,
+            help='Random seed for the request sequence'
+        )
+        parser.add_argument(
+            '--no-keepalive', action='store_false', dest='keepalive',
+            help='Open a new connection for every request. Use this with runserver, whose '
+                 'keep-alive responses are delayed by about 40 ms by TCP acknowledgement timing'
+        )
+        parser.add_argument(
+            '--json', action='store_true',
+            help='Print the results as JSON, e.g. to compare runs in a script'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        # Targets come straight from the database the server under test uses.
+        persons = Person.objects.all()
+        if options['tree']:
+            persons = persons.filter(tree_id=options['tree'])
+        sample = list(persons.order_by('?').values_list('id', 'full_name', 'tree_id')[:options['sample_size']])
+        if not sample:
+            raise CommandError('No persons to send requests for; run generate_family_data first')
+
+        load_test = LoadTest(
+            options['url'],
+            Scenarios(sample, prefix=options['prefix'], tree=options['tree'], seed=options['seed']),
+            mix,
+            concurrency=max(options['concurrency'], 1),
+            duration=None if options['requests'] else options['duration'],
+            requests=options['requests'],
+            keepalive=options['keepalive'],
+        )
+        if not options['json']:
+            self.stdout.write(
+                f"Running {load_test.concurrency} virtual user(s) against {options['url']} "
+                f"({options['mix']})..."
+            )
+        rows = asyncio.run(load_test.run())
+
+        if options['json']:
+            self.stdout.write(json.dumps({'elapsed': load_test.elapsed, 'endpoints': rows}, indent=2))
+            return
+
+        self.stdout.write(
+            f'{"endpoint":<22}{"requests":>9}{"errors":>8}{"req/s":>9}'
+            f'{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"max ms":>9}'
+        )
+        for row in rows:
+            self.stdout.write(
+                f"{row['endpoint']:<22}{row['requests']:9d}{row['errors']:8d}{row['throughput']:9.1f}"
+                f"{row['p50']:9.1f}{row['p95']:9.1f}{row['p99']:9.1f}{row['max']:9.1f}"
+            )
+        self.stdout.write(f'Elapsed: {load_test.elapsed:.1f} s')
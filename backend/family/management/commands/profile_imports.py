@@ -0,0 +1,93 @@
+import os
+import re
+import subprocess
+import sys
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter, since this process has already imported everything.
+STARTUP_SCRIPT = '''
+import importlib
+import os
+import sys
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings_module!r})
+import django
+django.setup()
+for name in sys.argv[1:]:
+    importlib.import_module(name)
+'''
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| \s*(\S+)$')
+
+
+class Command(BaseCommand):
+    help = 'Report which modules take the longest to import at startup (python -X importtime)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--module', action='append', dest='modules',
+            help='Module to import after django.setup(); repeatable (default: the ROOT_URLCONF)'
+        )
+        parser.add_argument(
+            '--setup-only', action='store_true',
+            help='Only profile django.setup(), as a management command sees it'
+        )
+        parser.add_argument(
+            '--sort', choices=['self', 'cumulative'], default='cumulative',
+            help='Order modules by their own import time or including their imports (default: cumulative)'
+        )
+        parser.add_argument(
+            '--packages', action='store_true',
+            help='Sum import time per top-level package instead of listing modules'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=25,
+            help='Number of rows to print (default: 25)'
+        )
+
+    def handle(self, *args, **options):
+        modules = [] if options['setup_only'] else (options['modules'] or [settings.ROOT_URLCONF])
+        script = STARTUP_SCRIPT.format(settings_module=os.environ['DJANGO_SETTINGS_MODULE'])
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script, *modules],
+            capture_output=True, text=True, cwd=settings.BASE_DIR,
+        )
+        if completed.returncode != 0:
+            raise CommandError(f'Startup failed:\n{completed.stderr}')
+
+        # (self microseconds, cumulative microseconds, module name) per import.
+        imports = []
+        for line in completed.stderr.splitlines():
+            match = IMPORT_TIME_LINE.match(line)
+            if match:
+                self_us, cumulative_us, name = match.groups()
+                imports.append((int(self_us), int(cumulative_us), name))
+
+        total_us = sum(self_us for self_us, _, _ in imports)
+        self.stdout.write(
+            f'Imported {len(imports)} modules in {total_us / 1000:.1f} ms '
+            f'(django.setup(){"".join(f" + {name}" for name in modules)})'
+        )
+
+        if options['packages']:
+            packages = Counter()
+            counts = Counter()
+            for self_us, _, name in imports:
+                package = name.split('.')[0]
+                packages[package] += self_us
+                counts[package] += 1
+            self.stdout.write(f'{"ms":>9}  {"share":>6}  {"modules":>7}  package')
+            for package, package_us in packages.most_common(options['limit']):
+                self.stdout.write(
+                    f'{package_us / 1000:9.1f}  {package_us / total_us:6.1%}  {counts[package]:7d}  {package}'
+                )
+            return
+
+        column = 0 if options['sort'] == 'self' else 1
+        imports.sort(key=lambda row: row[column], reverse=True)
+        self.stdout.write(f'{"self ms":>9}  {"cumul ms":>9}  module')
+        for self_us, cumulative_us, name in imports[:options['limit']]:
+            self.stdout.write(f'{self_us / 1000:9.1f}  {cumulative_us / 1000:9.1f}  {name}')
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from family.models import FamilyRelationship, LifeEvent, Person
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the life event table from person and relationship dates'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Rows to read and insert per batch (default: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            LifeEvent.objects.all().delete()
+            events = []
+            created = 0
+
+            people = Person.objects.only('id', 'date_of_birth', 'date_of_death').order_by()
+            spouse_relationships = FamilyRelationship.objects.filter(
+                relationship_type='spouse'
+            ).only(
+                'id', 'relationship_type', 'person1_id', 'person2_id', 'marriage_date', 'divorce_date'
+            ).order_by()
+
+            for person in people.iterator(chunk_size=batch_size):
+                events.extend(LifeEvent.events_for_person(person))
+                if len(events) >= batch_size:
+                    created += len(LifeEvent.objects.bulk_create(events))
+                    events = []
+            for relationship in spouse_relationships.iterator(chunk_size=batch_size):
+                events.extend(LifeEvent.events_for_relationship(relationship))
+                if len(events) >= batch_size:
+                    created += len(LifeEvent.objects.bulk_create(events))
+                    events = []
+            created += len(LifeEvent.objects.bulk_create(events))
+
+        self.stdout.write(self.style.SUCCESS(f'Created {created} life events'))
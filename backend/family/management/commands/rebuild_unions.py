@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from family.models import Union
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the union (couple) table from spouse and parent-child relationships'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tree',
+            help='Only rebuild the unions of the family tree with this id (default: all trees)'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = Union.rebuild(tree_id=options['tree'])
+
+        self.stdout.write(self.style.SUCCESS(f'Created {created} unions'))
@@ -0,0 +1,44 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary SQLite database over the read replica, standing in for replication '
+        'when trying out replica routing locally'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            help='Alias of the replica to overwrite (default: FAMILY_REPLICA_DATABASE)'
+        )
+
+    def handle(self, *args, **options):
+        alias = options['database'] or settings.FAMILY_REPLICA_DATABASE
+        if not alias:
+            raise CommandError('No replica configured; set FAMILY_REPLICA_DATABASE or pass --database')
+        if alias == 'default' or alias not in settings.DATABASES:
+            raise CommandError(f'{alias!r} is not a replica alias in DATABASES')
+
+        engines = {settings.DATABASES[name]['ENGINE'] for name in ('default', alias)}
+        if engines != {'django.db.backends.sqlite3'}:
+            raise CommandError('Only SQLite databases can be copied; use the database\'s own replication')
+
+        # Close the replica's connection in this process before its file is replaced.
+        connections[alias].close()
+        primary = connections['default']
+        primary.ensure_connection()
+        replica = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+        try:
+            # The backup API gives a consistent copy even while the primary is being written.
+            primary.connection.backup(replica)
+        finally:
+            replica.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Copied {settings.DATABASES['default']['NAME']} to {settings.DATABASES[alias]['NAME']}"
+        ))
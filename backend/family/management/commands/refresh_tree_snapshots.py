@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from family import snapshots
+from family.models import Person, TreeSnapshot
+
+
+class Command(BaseCommand):
+    help = (
+        'Pin family tree snapshots by hand, or rebalance the automatic ones: keep the most '
+        'requested roots built and drop snapshots that fell out of the top'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pin', metavar='PERSON_ID',
+            help='Always keep a snapshot of this root, regardless of hits'
+        )
+        parser.add_argument(
+            '--unpin', metavar='PERSON_ID',
+            help='Let this root compete on hits again'
+        )
+        parser.add_argument(
+            '--generations', type=int, default=1,
+            help='Generations of the snapshot to pin or unpin, as in ?generations=N (default: 1)'
+        )
+        parser.add_argument(
+            '--base-url',
+            help=(
+                'Scheme and host clients use for the API, e.g. https://example.com/ (required with '
+                '--pin; with --unpin, only the snapshot for this host)'
+            )
+        )
+        parser.add_argument(
+            '--decay', action='store_true',
+            help='Halve every hit count afterwards, so roots that stop being popular lose their snapshot'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['pin']:
+                self.pin(options['pin'], options['generations'], options['base_url'])
+            elif options['unpin']:
+                unpinned = TreeSnapshot.objects.filter(root=options['unpin'], generations=options['generations'])
+                if options['base_url']:
+                    unpinned = unpinned.filter(base_url=options['base_url'])
+                unpinned.update(pinned=False)
+            self.rebalance()
+            if options['decay']:
+                TreeSnapshot.objects.update(hits=F('hits') / 2)
+
+        counts = dict(TreeSnapshot.objects.values_list('status').annotate(count=Count('id')))
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts.get('ready', 0)} snapshots ready, {counts.get('queued', 0)} queued for building"
+        ))
+
+    def pin(self, person_id, generations, base_url):
+        if not base_url:
+            raise CommandError('--base-url is required with --pin')
+        person = Person.objects.filter(pk=person_id).first()
+        if person is None:
+            raise CommandError(f'Person {person_id} not found')
+        TreeSnapshot.objects.update_or_create(
+            root=person, generations=generations, base_url=base_url,
+            defaults={'pinned': True}, create_defaults={'tree_id': person.tree_id, 'pinned': True},
+        )
+
+    def rebalance(self):
+        """Drop unpinned snapshots outside the most requested roots, then queue the missing ones."""
+        keep = set(TreeSnapshot.objects.filter(
+            pinned=False, hits__gte=settings.FAMILY_SNAPSHOT_MIN_HITS
+        ).order_by('-hits', 'pk').values_list('id', flat=True)[:settings.FAMILY_SNAPSHOT_MAX_COUNT])
+
+        dropped = [
+            snapshot_id for snapshot_id in TreeSnapshot.objects.filter(pinned=False).exclude(
+                status='candidate'
+            ).values_list('id', flat=True)
+            if snapshot_id not in keep
+        ]
+        TreeSnapshot.persons.through.objects.filter(treesnapshot__in=dropped).delete()
+        TreeSnapshot.objects.filter(pk__in=dropped).update(
+            status='candidate', content=None, size=0, built_at=None
+        )
+
+        # Queued rows are queued again in case their build job gave up.
+        snapshots.queue(TreeSnapshot.objects.filter(
+            Q(pk__in=keep, status='candidate') | Q(pinned=True, status='candidate') | Q(status='queued')
+        ).values_list('id', flat=True))
@@ -0,0 +1,90 @@
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from family import tasks
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the database queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=4,
+            help='Number of jobs to run at once (default: 4)'
+        )
+        parser.add_argument(
+            '--processes', action='store_true',
+            help='Run jobs in a process pool instead of a thread pool'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait between polls when the queue is empty (default: 1.0)'
+        )
+        parser.add_argument(
+            '--lock-timeout', type=int, default=600,
+            help='Seconds after which a running job is assumed abandoned and requeued (default: 600)'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once the queue is drained instead of polling forever'
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(options['concurrency'], 1)
+        poll_interval = options['poll_interval']
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = False
+
+        def request_stop(signum, frame):
+            self.stdout.write('Stopping after running jobs finish...')
+            self.stopping = True
+
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+
+        if options['processes']:
+            # Forked children must not share the parent's database connections.
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=concurrency, initializer=tasks.init_worker_process)
+        else:
+            executor = ThreadPoolExecutor(max_workers=concurrency)
+
+        self.stdout.write(f'Worker {worker_id} started with concurrency {concurrency}')
+        in_flight = set()
+        processed = 0
+
+        with executor:
+            while not self.stopping:
+                requeued = tasks.requeue_stale(options['lock_timeout'])
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f'Requeued {requeued} abandoned job(s)'))
+
+                while len(in_flight) < concurrency:
+                    job = tasks.claim_next(worker_id)
+                    if job is None:
+                        break
+                    self.stdout.write(f'Running {job.task} job {job.pk} (attempt {job.attempts})')
+                    in_flight.add(executor.submit(tasks.run_job, job.pk, worker_id))
+
+                if not in_flight:
+                    if options['once']:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                done, in_flight = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                processed += len(done)
+                for future in done:
+                    if future.exception() is not None:
+                        self.stderr.write(f'Worker error: {future.exception()}')
+
+            wait(in_flight)
+            processed += len(in_flight)
+
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker_id} stopped after {processed} job(s)'))
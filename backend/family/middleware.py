@@ -0,0 +1,118 @@
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+from . import replicas
+from .querybudget import QueryBudgetExceeded, QueryRecorder
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+re_accepts_brotli = _lazy_re_compile(r'\bbr\b')
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """Compress responses with brotli when the client accepts it, gzip otherwise.
+
+    Brotli is only used for non-streaming JSON responses and only when the
+    ``brotli`` package is installed; everything else is handled by Django's
+    ``GZipMiddleware``. Unlike gzip, a brotli stream has no header field to
+    hold the random padding Django adds against BREACH, so brotli is limited
+    to API data, which carries no CSRF tokens or other secrets. HTML pages
+    (admin, browsable API) keep padded gzip.
+    """
+
+    brotli_quality = 5
+    brotli_content_types = ('application/json', 'application/vnd.familytree.compact+json')
+
+    def process_response(self, request, response):
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if (
+            brotli is None
+            or response.streaming
+            or content_type not in self.brotli_content_types
+            or not re_accepts_brotli.search(accept_encoding)
+        ):
+            return super().process_response(request, response)
+
+        if len(response.content) < 200 or response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed_content = brotli.compress(response.content, quality=self.brotli_quality)
+        if len(compressed_content) >= len(response.content):
+            return response
+
+        response.content = compressed_content
+        response.headers['Content-Length'] = str(len(response.content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+
+class QueryBudgetMiddleware:
+    """Check requests to ``family`` views against the configured query budget.
+
+    Only active when ``FAMILY_QUERY_BUDGET_ENABLED`` is set (by default when
+    ``DEBUG`` is). Violations are logged, or raised as ``QueryBudgetExceeded``
+    when ``FAMILY_QUERY_BUDGET_ACTION`` is ``'raise'``. Every checked response
+    carries an ``X-Query-Count`` header.
+    """
+
+    def __init__(self, get_response):
+        if not settings.FAMILY_QUERY_BUDGET_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.max_queries = settings.FAMILY_QUERY_BUDGET
+        self.max_repeats = settings.FAMILY_QUERY_REPEAT_LIMIT
+        self.action = settings.FAMILY_QUERY_BUDGET_ACTION
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        view = getattr(match.func, 'cls', match.func) if match else None
+        if view is None or not view.__module__.startswith('family.'):
+            return response
+
+        response.headers['X-Query-Count'] = str(len(recorder.queries))
+        problems = recorder.problems(self.max_queries, self.max_repeats)
+        if problems:
+            message = f'{request.method} {request.get_full_path()}: ' + '\n'.join(problems)
+            if self.action == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+class ReadYourWritesMiddleware:
+    """Pin a client that just wrote to the primary database (see ``family.replicas``).
+
+    Only active when ``FAMILY_REPLICA_DATABASE`` is set.
+    """
+
+    safe_methods = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def __init__(self, get_response):
+        if not replicas.replica_alias():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in self.safe_methods and response.status_code < 400:
+            replicas.pin_to_primary(response)
+        return response
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('family', '0003_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='familyrelationship',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='familyrelationship',
+            name='divorce_date',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='familyrelationship',
+            name='marriage_date',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='person',
+            name='date_of_birth',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='person',
+            name='date_of_death',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='person',
+            name='full_name',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('family', '0004_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LifeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('birth', 'Birth'), ('death', 'Death'), ('marriage', 'Marriage'), ('divorce', 'Divorce')], max_length=10)),
+                ('date', models.DateField()),
+                ('person', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='life_events', to='family.person')),
+                ('relationship', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='life_events', to='family.familyrelationship')),
+                ('spouse', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='family.person')),
+            ],
+            options={
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['date'], name='family_life_date_526c16_idx'), models.Index(fields=['event_type', 'date'], name='family_life_event_t_e7bcfd_idx')],
+            },
+        ),
+    ]
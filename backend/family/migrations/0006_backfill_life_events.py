@@ -0,0 +1,42 @@
+from django.db import migrations
+
+
+def backfill_life_events(apps, schema_editor):
+    Person = apps.get_model('family', 'Person')
+    FamilyRelationship = apps.get_model('family', 'FamilyRelationship')
+    LifeEvent = apps.get_model('family', 'LifeEvent')
+
+    events = []
+    for person_id, date_of_birth, date_of_death in Person.objects.values_list(
+        'id', 'date_of_birth', 'date_of_death'
+    ).iterator(chunk_size=5000):
+        if date_of_birth:
+            events.append(LifeEvent(event_type='birth', date=date_of_birth, person_id=person_id))
+        if date_of_death:
+            events.append(LifeEvent(event_type='death', date=date_of_death, person_id=person_id))
+
+    for rel_id, person1_id, person2_id, marriage_date, divorce_date in FamilyRelationship.objects.filter(
+        relationship_type='spouse'
+    ).values_list('id', 'person1_id', 'person2_id', 'marriage_date', 'divorce_date').iterator(chunk_size=5000):
+        for event_type, date in (('marriage', marriage_date), ('divorce', divorce_date)):
+            if date:
+                events.append(LifeEvent(
+                    event_type=event_type,
+                    date=date,
+                    person_id=person1_id,
+                    spouse_id=person2_id,
+                    relationship_id=rel_id,
+                ))
+
+    LifeEvent.objects.bulk_create(events, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('family', '0005_lifeevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_life_events, migrations.RunPython.noop),
+    ]
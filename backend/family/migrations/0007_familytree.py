@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:42
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+def assign_default_tree(apps, schema_editor):
+    FamilyTree = apps.get_model('family', 'FamilyTree')
+    Person = apps.get_model('family', 'Person')
+    FamilyRelationship = apps.get_model('family', 'FamilyRelationship')
+    ChangeLog = apps.get_model('family', 'ChangeLog')
+
+    if not Person.objects.exists() and not FamilyRelationship.objects.exists():
+        return
+
+    tree = FamilyTree.objects.create(name='Default')
+    Person.objects.update(tree=tree)
+    FamilyRelationship.objects.update(tree=tree)
+    ChangeLog.objects.update(tree=tree)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('family', '0006_backfill_life_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FamilyTree',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='changelog',
+            name='tree',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='family.familytree'),
+        ),
+        migrations.AddField(
+            model_name='familyrelationship',
+            name='tree',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='relationships', to='family.familytree'),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='tree',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='persons', to='family.familytree'),
+        ),
+        migrations.RunPython(assign_default_tree, migrations.RunPython.noop),
+    ]
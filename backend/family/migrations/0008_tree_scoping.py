@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('family', '0007_familytree'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='familyrelationship',
+            name='tree',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='relationships', to='family.familytree'),
+        ),
+        migrations.AlterField(
+            model_name='person',
+            name='tree',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='persons', to='family.familytree'),
+        ),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['tree', 'id'], name='family_chan_tree_id_3201d1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='familyrelationship',
+            index=models.Index(fields=['tree', 'relationship_type', 'person1'], name='family_fami_tree_id_be0de5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='familyrelationship',
+            index=models.Index(fields=['tree', 'relationship_type', 'person2'], name='family_fami_tree_id_3f3f14_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['tree', 'full_name'], name='family_pers_tree_id_602588_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:55
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('family', '0008_tree_scoping'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Union',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('children', models.ManyToManyField(blank=True, related_name='parent_unions', to='family.person')),
+                ('partner1', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='family.person')),
+                ('partner2', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='family.person')),
+                ('relationship', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='union', to='family.familyrelationship')),
+                ('tree', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unions', to='family.familytree')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('partner1', 'partner2'), name='unique_union_partners')],
+            },
+        ),
+    ]
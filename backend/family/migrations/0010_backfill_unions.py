@@ -0,0 +1,50 @@
+from collections import defaultdict
+from itertools import combinations
+
+from django.db import migrations
+
+
+def backfill_unions(apps, schema_editor):
+    FamilyRelationship = apps.get_model('family', 'FamilyRelationship')
+    Union = apps.get_model('family', 'Union')
+    Membership = Union.children.through
+
+    couples = {}
+    for rel_id, person1_id, person2_id, tree_id in FamilyRelationship.objects.filter(
+        relationship_type='spouse'
+    ).values_list('id', 'person1_id', 'person2_id', 'tree_id').iterator(chunk_size=5000):
+        if person1_id != person2_id:
+            partner1_id, partner2_id = sorted((person1_id, person2_id), key=str)
+            couples.setdefault((partner1_id, partner2_id), Union(
+                tree_id=tree_id, partner1_id=partner1_id, partner2_id=partner2_id, relationship_id=rel_id
+            ))
+
+    parents = defaultdict(set)
+    trees = {}
+    for parent_id, child_id, tree_id in FamilyRelationship.objects.filter(
+        relationship_type='parent_child'
+    ).values_list('person1_id', 'person2_id', 'tree_id').iterator(chunk_size=5000):
+        parents[child_id].add(parent_id)
+        trees[child_id] = tree_id
+
+    memberships = []
+    for child_id, parent_ids in parents.items():
+        for partner1_id, partner2_id in combinations(sorted(parent_ids, key=str), 2):
+            union = couples.setdefault((partner1_id, partner2_id), Union(
+                tree_id=trees[child_id], partner1_id=partner1_id, partner2_id=partner2_id
+            ))
+            memberships.append(Membership(union_id=union.pk, person_id=child_id))
+
+    Union.objects.bulk_create(couples.values(), batch_size=5000)
+    Membership.objects.bulk_create(memberships, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('family', '0009_union'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_unions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('family', '0011_photoupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TreeSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generations', models.PositiveSmallIntegerField()),
+                ('base_url', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('candidate', 'Candidate'), ('queued', 'Queued'), ('ready', 'Ready')], default='candidate', max_length=10)),
+                ('pinned', models.BooleanField(default=False)),
+                ('hits', models.PositiveBigIntegerField(default=0)),
+                ('content', models.BinaryField(blank=True, null=True)),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('built_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('persons', models.ManyToManyField(blank=True, related_name='+', to='family.person')),
+                ('root', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='family.person')),
+                ('tree', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='family.familytree')),
+            ],
+            options={
+                'ordering': ['-hits'],
+                'constraints': [models.UniqueConstraint(fields=('root', 'generations'), name='unique_snapshot_root_generations')],
+            },
+        ),
+    ]
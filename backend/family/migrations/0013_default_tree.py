@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:19
+
+from django.db import migrations, models
+
+
+def mark_default_tree(apps, schema_editor):
+    """Flag the tree 0007 created for existing data, or create an empty default tree."""
+    FamilyTree = apps.get_model('family', 'FamilyTree')
+    tree = FamilyTree.objects.filter(name='Default').order_by('created_at').first()
+    if tree is None:
+        FamilyTree.objects.create(name='Default', is_default=True)
+    else:
+        tree.is_default = True
+        tree.save(update_fields=['is_default'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('family', '0012_treesnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='familytree',
+            name='is_default',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddConstraint(
+            model_name='familytree',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_default', True)), fields=('is_default',), name='family_single_default_tree'),
+        ),
+        migrations.RunPython(mark_default_tree, migrations.RunPython.noop),
+    ]
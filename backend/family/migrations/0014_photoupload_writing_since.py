@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('family', '0013_default_tree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photoupload',
+            name='writing_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
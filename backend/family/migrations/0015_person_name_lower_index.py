@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:30
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('family', '0014_photoupload_writing_since'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(django.db.models.functions.text.Lower('full_name'), name='family_person_name_lower'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('family', '0015_person_name_lower_index'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='treesnapshot',
+            name='unique_snapshot_root_generations',
+        ),
+        migrations.AddConstraint(
+            model_name='treesnapshot',
+            constraint=models.UniqueConstraint(fields=('root', 'generations', 'base_url'), name='unique_snapshot_root_generations_host'),
+        ),
+    ]
@@ -1,7 +1,59 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 import uuid
+from collections import defaultdict
+from itertools import combinations
+
+
+def calculate_age(date_of_birth, date_of_death=None):
+    """Calculate current age, or age at death, from raw date values."""
+    if not date_of_birth:
+        return None
+
+    end_date = date_of_death if date_of_death else timezone.now().date()
+    age = end_date.year - date_of_birth.year
+    if end_date.month < date_of_birth.month or (
+        end_date.month == date_of_birth.month and end_date.day < date_of_birth.day
+    ):
+        age -= 1
+    return age
+
+
+class FamilyTree(models.Model):
+    """An independent family tree that owns its persons and relationships."""
+
+    DEFAULT_NAME = 'Default'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=255)
+    # The tree unscoped API routes write to; at most one tree has it set.
+    is_default = models.BooleanField(default=False, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_default'], condition=models.Q(is_default=True), name='family_single_default_tree'
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def get_default(cls):
+        """The default tree, created on first use; unscoped API routes write to it.
+
+        If it is deleted, a new empty default tree is created rather than
+        another tree taking its place.
+        """
+        # The unique constraint makes concurrent first uses agree on one tree.
+        tree, _ = cls.objects.get_or_create(is_default=True, defaults={'name': cls.DEFAULT_NAME})
+        return tree
 
 
 class Person(models.Model):
@@ -14,10 +66,15 @@ class Person(models.Model):
     ]
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    full_name = models.CharField(max_length=255)
+    tree = models.ForeignKey(
+        FamilyTree,
+        on_delete=models.CASCADE,
+        related_name='persons'
+    )
+    full_name = models.CharField(max_length=255, db_index=True)
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES)
-    date_of_birth = models.DateField(null=True, blank=True)
-    date_of_death = models.DateField(null=True, blank=True)
+    date_of_birth = models.DateField(null=True, blank=True, db_index=True)
+    date_of_death = models.DateField(null=True, blank=True, db_index=True)
     profile_photo = models.ImageField(upload_to='profile_photos/', null=True, blank=True)
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -25,10 +82,20 @@ class Person(models.Model):
 
     class Meta:
         ordering = ['full_name']
+        indexes = [
+            models.Index(fields=['tree', 'full_name']),
+            # Case-insensitive name prefix search (``admin.name_prefix_search``).
+            models.Index(Lower('full_name'), name='family_person_name_lower'),
+        ]
 
     def __str__(self):
         return self.full_name
 
+    def save(self, *args, **kwargs):
+        if self.tree_id is None:
+            self.tree = FamilyTree.get_default()
+        super().save(*args, **kwargs)
+
     @property
     def is_alive(self):
         """Check if the person is alive."""
@@ -39,16 +106,7 @@ class Person(models.Model):
     @property
     def age(self):
         """Calculate current age or age at death."""
-        if not self.date_of_birth:
-            return None
-
-        end_date = self.date_of_death if self.date_of_death else timezone.now().date()
-        age = end_date.year - self.date_of_birth.year
-        if end_date.month < self.date_of_birth.month or (
-            end_date.month == self.date_of_birth.month and end_date.day < self.date_of_birth.day
-        ):
-            age -= 1
-        return age
+        return calculate_age(self.date_of_birth, self.date_of_death)
 
 
 class FamilyRelationship(models.Model):
@@ -60,6 +118,11 @@ class FamilyRelationship(models.Model):
     ]
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tree = models.ForeignKey(
+        FamilyTree,
+        on_delete=models.CASCADE,
+        related_name='relationships'
+    )
     relationship_type = models.CharField(max_length=20, choices=RELATIONSHIP_TYPES)
 
     # For spouse relationships
@@ -75,10 +138,10 @@ class FamilyRelationship(models.Model):
     )
 
     # For parent-child relationships, person1 is the parent, person2 is the child
-    marriage_date = models.DateField(null=True, blank=True)
-    divorce_date = models.DateField(null=True, blank=True)
+    marriage_date = models.DateField(null=True, blank=True, db_index=True)
+    divorce_date = models.DateField(null=True, blank=True, db_index=True)
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
@@ -86,6 +149,10 @@ class FamilyRelationship(models.Model):
             ('person1', 'person2', 'relationship_type'),
         ]
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tree', 'relationship_type', 'person1']),
+            models.Index(fields=['tree', 'relationship_type', 'person2']),
+        ]
 
     def __str__(self):
         if self.relationship_type == 'spouse':
@@ -93,9 +160,447 @@ class FamilyRelationship(models.Model):
         else:
             return f"{self.person1.full_name} -> {self.person2.full_name} (Parent-Child)"
 
+    def save(self, *args, **kwargs):
+        if self.tree_id is None:
+            self.tree_id = self.person1.tree_id
+        super().save(*args, **kwargs)
+
     @property
     def active_marriage_status(self):
         """Check if this is an active marriage (no divorce date)."""
         if self.relationship_type != 'spouse':
             return False
         return self.divorce_date is None
+
+
+class ChangeLog(models.Model):
+    """Append-only log of writes to persons and relationships.
+
+    The auto-incrementing ``id`` doubles as the change feed cursor.
+    """
+
+    MODEL_CHOICES = [
+        ('person', 'Person'),
+        ('relationship', 'Family Relationship'),
+    ]
+
+    ACTION_CHOICES = [
+        ('create', 'Create'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+    ]
+
+    tree = models.ForeignKey(FamilyTree, on_delete=models.CASCADE, null=True, blank=True)
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.UUIDField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['tree', 'id']),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.action} {self.model} {self.object_id}"
+
+    @classmethod
+    def latest_cursor(cls, queryset=None):
+        """Id of the newest entry, which also serves as a global data version."""
+        if queryset is None:
+            queryset = cls.objects.all()
+        return queryset.order_by('-id').values_list('id', flat=True).first() or 0
+
+    @classmethod
+    def record(cls, model, object_ids, action, tree_id=None):
+        """Record changes for writes that bypass model signals (bulk updates and deletes)."""
+        cls.objects.bulk_create([
+            cls(tree_id=tree_id, model=model, object_id=object_id, action=action)
+            for object_id in object_ids
+        ])
+
+
+class Job(models.Model):
+    """Background job stored in the database and executed by ``manage.py run_worker``."""
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"{self.task} ({self.status})"
+
+
+class LifeEvent(models.Model):
+    """Dated birth, death, marriage or divorce, kept in sync with Person and FamilyRelationship.
+
+    Mirrors the date fields into one indexed table so range and timeline
+    queries do not scan persons and relationships.
+    """
+
+    EVENT_TYPES = [
+        ('birth', 'Birth'),
+        ('death', 'Death'),
+        ('marriage', 'Marriage'),
+        ('divorce', 'Divorce'),
+    ]
+
+    event_type = models.CharField(max_length=10, choices=EVENT_TYPES)
+    date = models.DateField()
+    person = models.ForeignKey(
+        Person,
+        on_delete=models.CASCADE,
+        related_name='life_events'
+    )
+    # For marriages and divorces, the other spouse and the spouse relationship
+    spouse = models.ForeignKey(
+        Person,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    relationship = models.ForeignKey(
+        FamilyRelationship,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='life_events'
+    )
+
+    class Meta:
+        ordering = ['date']
+        indexes = [
+            models.Index(fields=['date']),
+            models.Index(fields=['event_type', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_event_type_display()} of {self.person_id} on {self.date}"
+
+    @classmethod
+    def events_for_person(cls, person):
+        """Unsaved birth and death events for ``person``."""
+        return [
+            cls(event_type=event_type, date=date, person_id=person.pk)
+            for event_type, date in (('birth', person.date_of_birth), ('death', person.date_of_death))
+            if date
+        ]
+
+    @classmethod
+    def events_for_relationship(cls, relationship):
+        """Unsaved marriage and divorce events for a spouse ``relationship``."""
+        if relationship.relationship_type != 'spouse':
+            return []
+        return [
+            cls(
+                event_type=event_type,
+                date=date,
+                person_id=relationship.person1_id,
+                spouse_id=relationship.person2_id,
+                relationship_id=relationship.pk,
+            )
+            for event_type, date in (
+                ('marriage', relationship.marriage_date),
+                ('divorce', relationship.divorce_date),
+            )
+            if date
+        ]
+
+    @classmethod
+    def sync_person(cls, person):
+        """Replace the birth and death events of ``person``."""
+        cls.objects.filter(person=person, event_type__in=['birth', 'death']).delete()
+        cls.objects.bulk_create(cls.events_for_person(person))
+
+    @classmethod
+    def sync_relationship(cls, relationship):
+        """Replace the marriage and divorce events of ``relationship``."""
+        cls.objects.filter(relationship=relationship).delete()
+        cls.objects.bulk_create(cls.events_for_relationship(relationship))
+
+
+class Union(models.Model):
+    """A couple and the children they share, derived from FamilyRelationship rows.
+
+    There is one union per spouse relationship and one per pair of people
+    recorded as parents of the same child, so children of a marriage and
+    half-siblings are plain joins. Partners are stored lower id first. Kept
+    in sync by signals; ``manage.py rebuild_unions`` rebuilds the table.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tree = models.ForeignKey(
+        FamilyTree,
+        on_delete=models.CASCADE,
+        related_name='unions'
+    )
+    partner1 = models.ForeignKey(
+        Person,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    partner2 = models.ForeignKey(
+        Person,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    # The spouse relationship, if the partners are (or were) married
+    relationship = models.OneToOneField(
+        FamilyRelationship,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='union'
+    )
+    children = models.ManyToManyField(Person, related_name='parent_unions', blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['partner1', 'partner2'], name='unique_union_partners'),
+        ]
+
+    def __str__(self):
+        return f"Union of {self.partner1_id} and {self.partner2_id}"
+
+    @staticmethod
+    def ordered(person_a, person_b):
+        """The two partner ids in stored order."""
+        return tuple(sorted((person_a, person_b), key=str))
+
+    @classmethod
+    def for_person(cls, person_id):
+        """Unions in which ``person_id`` is a partner."""
+        return cls.objects.filter(models.Q(partner1=person_id) | models.Q(partner2=person_id))
+
+    @classmethod
+    def prune(cls, union_ids):
+        """Delete unions that have neither a spouse relationship nor children left."""
+        cls.objects.filter(pk__in=union_ids, relationship__isnull=True, children__isnull=True).delete()
+
+    @classmethod
+    def sync_children(cls, child_ids):
+        """Recompute the unions ``child_ids`` belong to from their parent-child relationships."""
+        Membership = cls.children.through
+        child_ids = set(child_ids)
+
+        parents = defaultdict(set)
+        trees = {}
+        for parent_id, child_id, tree_id in FamilyRelationship.objects.filter(
+            relationship_type='parent_child', person2__in=child_ids
+        ).values_list('person1', 'person2', 'tree'):
+            parents[child_id].add(parent_id)
+            trees[child_id] = tree_id
+        wanted = {
+            (couple, child_id)
+            for child_id, parent_ids in parents.items()
+            for couple in combinations(sorted(parent_ids, key=str), 2)
+        }
+
+        current = {
+            ((partner1_id, partner2_id), child_id): (membership_id, union_id)
+            for membership_id, union_id, partner1_id, partner2_id, child_id in Membership.objects.filter(
+                person__in=child_ids
+            ).values_list('id', 'union', 'union__partner1', 'union__partner2', 'person')
+        }
+        stale = [current[key] for key in current.keys() - wanted]
+        Membership.objects.filter(pk__in=[membership_id for membership_id, _ in stale]).delete()
+
+        union_ids = {}
+        memberships = []
+        for couple, child_id in wanted - current.keys():
+            if couple not in union_ids:
+                union, _ = cls.objects.get_or_create(
+                    partner1_id=couple[0], partner2_id=couple[1], defaults={'tree_id': trees[child_id]}
+                )
+                union_ids[couple] = union.pk
+            memberships.append(Membership(union_id=union_ids[couple], person_id=child_id))
+        Membership.objects.bulk_create(memberships)
+
+        cls.prune([union_id for _, union_id in stale])
+
+    @classmethod
+    def sync_relationship(cls, relationship):
+        """Attach a spouse relationship to its couple's union, detaching it from any other."""
+        previous = cls.objects.filter(relationship=relationship)
+        couple = None
+        if relationship.relationship_type == 'spouse' and relationship.person1_id != relationship.person2_id:
+            couple = cls.ordered(relationship.person1_id, relationship.person2_id)
+            previous = previous.exclude(partner1=couple[0], partner2=couple[1])
+
+        stale = list(previous.values_list('id', flat=True))
+        if stale:
+            cls.objects.filter(pk__in=stale).update(relationship=None)
+        if couple:
+            cls.objects.update_or_create(
+                partner1_id=couple[0],
+                partner2_id=couple[1],
+                defaults={'tree_id': relationship.tree_id, 'relationship': relationship},
+            )
+        cls.prune(stale)
+
+    @classmethod
+    def sync_persons(cls, person_ids):
+        """Resync the unions around ``person_ids`` after their relationships changed in bulk."""
+        person_ids = set(person_ids)
+        child_ids = person_ids | set(FamilyRelationship.objects.filter(
+            relationship_type='parent_child', person1__in=person_ids
+        ).values_list('person2', flat=True))
+        cls.sync_children(child_ids)
+        for relationship in FamilyRelationship.objects.filter(
+            models.Q(person1__in=person_ids) | models.Q(person2__in=person_ids),
+            relationship_type='spouse',
+        ):
+            cls.sync_relationship(relationship)
+
+    @classmethod
+    def rebuild(cls, tree_id=None):
+        """Recreate all unions, or those of one tree, from the relationship table in bulk.
+
+        Returns the number of unions created.
+        """
+        Membership = cls.children.through
+        relationships = FamilyRelationship.objects.order_by()
+        unions = cls.objects.all()
+        if tree_id is not None:
+            relationships = relationships.filter(tree_id=tree_id)
+            unions = unions.filter(tree_id=tree_id)
+        unions.delete()
+
+        couples = {}
+        for relationship_id, person1_id, person2_id, rel_tree_id in relationships.filter(
+            relationship_type='spouse'
+        ).values_list('id', 'person1', 'person2', 'tree').iterator(chunk_size=5000):
+            if person1_id != person2_id:
+                partner1_id, partner2_id = cls.ordered(person1_id, person2_id)
+                couples.setdefault((partner1_id, partner2_id), cls(
+                    tree_id=rel_tree_id,
+                    partner1_id=partner1_id,
+                    partner2_id=partner2_id,
+                    relationship_id=relationship_id,
+                ))
+
+        parents = defaultdict(set)
+        trees = {}
+        for parent_id, child_id, rel_tree_id in relationships.filter(
+            relationship_type='parent_child'
+        ).values_list('person1', 'person2', 'tree').iterator(chunk_size=5000):
+            parents[child_id].add(parent_id)
+            trees[child_id] = rel_tree_id
+
+        memberships = []
+        for child_id, parent_ids in parents.items():
+            for partner1_id, partner2_id in combinations(sorted(parent_ids, key=str), 2):
+                union = couples.setdefault((partner1_id, partner2_id), cls(
+                    tree_id=trees[child_id], partner1_id=partner1_id, partner2_id=partner2_id
+                ))
+                memberships.append(Membership(union_id=union.pk, person_id=child_id))
+
+        cls.objects.bulk_create(couples.values(), batch_size=5000)
+        Membership.objects.bulk_create(memberships, batch_size=5000)
+        return len(couples)
+
+
+class PhotoUpload(models.Model):
+    """A resumable profile photo upload, received in chunks into a temporary file.
+
+    Each chunk is appended at ``received`` bytes. Once ``size`` bytes have
+    arrived the file is moved into storage as the person's profile photo and
+    ``completed_at`` is set. See ``family.uploads``.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    person = models.ForeignKey(
+        Person,
+        on_delete=models.CASCADE,
+        related_name='photo_uploads'
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    # Set while a request is writing a chunk, so only one writes at a time.
+    writing_since = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+
+class TreeSnapshot(models.Model):
+    """A stored, gzip-compressed ``family_tree`` payload for a frequently viewed root.
+
+    Rows start as candidates that only count hits. Roots that are requested
+    often, or pinned by hand, are queued and built by a background job.
+    Writes that touch one of ``persons`` queue the snapshot for a rebuild.
+    See ``family.snapshots``.
+    """
+
+    STATUS_CHOICES = [
+        ('candidate', 'Candidate'),
+        ('queued', 'Queued'),
+        ('ready', 'Ready'),
+    ]
+
+    tree = models.ForeignKey(
+        FamilyTree,
+        on_delete=models.CASCADE,
+        related_name='snapshots'
+    )
+    root = models.ForeignKey(
+        Person,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    generations = models.PositiveSmallIntegerField()
+    # Scheme and host that photo URLs in the content were built with; each host
+    # that requests a root gets its own snapshot.
+    base_url = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='candidate')
+    pinned = models.BooleanField(default=False)
+    hits = models.PositiveBigIntegerField(default=0)
+    content = models.BinaryField(null=True, blank=True)
+    size = models.PositiveIntegerField(default=0)
+    persons = models.ManyToManyField(Person, related_name='+', blank=True)
+    built_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-hits']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['root', 'generations', 'base_url'], name='unique_snapshot_root_generations_host'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.root_id} x{self.generations} ({self.status})"
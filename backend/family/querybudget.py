@@ -0,0 +1,94 @@
+"""SQL query budgets for catching query regressions in development and tests.
+
+``QueryRecorder`` records every query run on any database connection while
+it is active, along with the innermost project source line that issued it.
+Queries with the same SQL text differ only in their parameters, so the same
+text repeated many times in one request is the signature of an N+1 loop.
+``family.middleware.QueryBudgetMiddleware`` checks every request to a
+``family`` view against ``FAMILY_QUERY_BUDGET`` and
+``FAMILY_QUERY_REPEAT_LIMIT``; tests can use ``assert_query_budget``.
+"""
+import traceback
+from collections import Counter, namedtuple
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+RecordedQuery = namedtuple('RecordedQuery', ['sql', 'location'])
+
+PROJECT_ROOT = str(Path(settings.BASE_DIR).resolve())
+THIS_FILE = str(Path(__file__).resolve())
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a request or block runs more queries than its budget allows."""
+
+
+def query_location():
+    """``path:line in function`` of the innermost project frame, outside this module."""
+    for frame in reversed(traceback.extract_stack()):
+        filename = str(Path(frame.filename).resolve())
+        if filename.startswith(PROJECT_ROOT) and filename != THIS_FILE and '/site-packages/' not in filename:
+            return f'{Path(filename).relative_to(PROJECT_ROOT)}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+class QueryRecorder:
+    """Context manager recording the queries run on all database connections."""
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(RecordedQuery(sql, query_location()))
+        return execute(sql, params, many, context)
+
+    def problems(self, max_queries=None, max_repeats=None):
+        """Describe how the recorded queries break the budget; an empty list if they don't."""
+        problems = []
+        if max_queries is not None and len(self.queries) > max_queries:
+            locations = Counter(query.location for query in self.queries)
+            problems.append(
+                f'{len(self.queries)} queries, budget is {max_queries}. Issued from:\n'
+                + '\n'.join(f'  {count:4d}x {location}' for location, count in locations.most_common(10))
+            )
+        if max_repeats is not None:
+            repeated = Counter(query.sql for query in self.queries)
+            for sql, count in repeated.most_common():
+                if count <= max_repeats:
+                    break
+                locations = sorted({query.location for query in self.queries if query.sql == sql})
+                problems.append(
+                    f'Same query run {count} times (limit {max_repeats}), likely N+1, from '
+                    f'{", ".join(locations)}:\n  {sql[:300]}'
+                )
+        return problems
+
+
+@contextmanager
+def assert_query_budget(max_queries=None, max_repeats=None):
+    """Fail with ``QueryBudgetExceeded`` if the block breaks the query budget.
+
+    ::
+
+        with assert_query_budget(max_queries=10, max_repeats=2):
+            client.get(f'/api/persons/{person.pk}/')
+    """
+    with QueryRecorder() as recorder:
+        yield recorder
+    problems = recorder.problems(max_queries, max_repeats)
+    if problems:
+        raise QueryBudgetExceeded('\n'.join(problems))
+
@@ -0,0 +1,40 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSON renderer backed by orjson when it is installed.
+
+    Falls back to DRF's stdlib ``json`` renderer when orjson is missing or
+    when the client asks for indented output (e.g. the browsable API).
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # orjson handles UUIDs, dates and datetimes natively; anything else
+        # (lazy strings, Decimals, querysets) goes through DRF's encoder.
+        return orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS,
+        )
+
+
+class CompactJSONRenderer(FastJSONRenderer):
+    """Renderer for the compact, index-based tree representation.
+
+    Selected with ``Accept: application/vnd.familytree.compact+json`` or
+    ``?format=compact``; views check ``request.accepted_renderer.format``.
+    """
+
+    media_type = 'application/vnd.familytree.compact+json'
+    format = 'compact'
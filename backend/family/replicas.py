@@ -0,0 +1,88 @@
+"""Routing of heavy read-only requests to a read replica.
+
+Viewset actions declared with ``read_replica=True`` (tree traversals and
+reports) read from the database alias named by ``FAMILY_REPLICA_DATABASE``
+when one is configured; everything else, and every write, uses ``default``.
+A client that writes gets a cookie pinning its reads to ``default`` for
+``FAMILY_REPLICA_PIN_SECONDS``, so it sees its own writes while the replica
+catches up. Clients on another origin, which do not send cookies, get the
+same pin as an ``X-Primary-Until`` response header and send it back as a
+request header.
+
+Tree snapshots are read from ``default`` even inside ``use_replica()``:
+``family_tree`` requests count their hits and queue builds on the primary,
+and have to see the counts and statuses they compare against there too.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+_read_alias = ContextVar('family_read_alias', default=None)
+
+PIN_HEADER = 'X-Primary-Until'
+
+# Models that replica requests also write; reading them stays on the primary.
+PRIMARY_MODELS = {'family.treesnapshot', 'family.treesnapshot_persons'}
+
+
+def replica_alias():
+    """Alias of the configured read replica, or ``None``."""
+    return settings.FAMILY_REPLICA_DATABASE or None
+
+
+def pinned_to_primary(request):
+    """Whether the client wrote recently enough that the replica may not have its writes yet."""
+    for value in (request.COOKIES.get(settings.FAMILY_REPLICA_PIN_COOKIE), request.headers.get(PIN_HEADER)):
+        try:
+            if value and float(value) > time.time():
+                return True
+        except ValueError:
+            pass
+    return False
+
+
+def pin_to_primary(response):
+    """Pin the client's reads to the primary after it wrote, by cookie and by header."""
+    seconds = settings.FAMILY_REPLICA_PIN_SECONDS
+    pinned_until = f'{time.time() + seconds:.3f}'
+    response.set_cookie(
+        settings.FAMILY_REPLICA_PIN_COOKIE, pinned_until, max_age=seconds, httponly=True, samesite='Lax',
+    )
+    response.headers[PIN_HEADER] = pinned_until
+
+
+@contextmanager
+def use_replica():
+    """Send the reads in the block to the replica, if one is configured."""
+    token = _read_alias.set(replica_alias())
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """Database router sending reads inside ``use_replica()`` to the replica alias."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower in PRIMARY_MODELS:
+            return 'default'
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # Also for instances that were read from the replica.
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {'default', replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The replica gets its schema from the primary.
+        if db == replica_alias():
+            return False
+        return None
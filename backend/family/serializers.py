@@ -1,8 +1,131 @@
+import os
+from datetime import date
+
+from django.conf import settings
+from django.db import models
 from rest_framework import serializers
-from .models import Person, FamilyRelationship
+from .graph import RelationshipIndex, collect_tree
+from .models import (
+    Person, FamilyRelationship, FamilyTree, Job, LifeEvent, PhotoUpload, Union, calculate_age
+)
+
+
+def photo_url(name, request=None):
+    """Resolve a stored profile photo name (as found in ``.values()`` rows) to a URL."""
+    if not name:
+        return None
+    url = Person._meta.get_field('profile_photo').storage.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def person_summary(row, request=None):
+    """Build the nested person payload used for spouses and children from a ``.values()`` row."""
+    return {
+        'id': row['id'],
+        'full_name': row['full_name'],
+        'gender': row['gender'],
+        'date_of_birth': row['date_of_birth'],
+        'date_of_death': row['date_of_death'],
+        'profile_photo': photo_url(row['profile_photo'], request),
+        'age': calculate_age(row['date_of_birth'], row['date_of_death']),
+        'is_alive': row['date_of_death'] is None,
+    }
+
+
+PERSON_SUMMARY_FIELDS = (
+    'id', 'full_name', 'gender', 'date_of_birth', 'date_of_death', 'profile_photo'
+)
+
+
+def person_unions(person_id, request=None):
+    """Build the couples of a person, each with the partner and their shared children.
+
+    Uses three queries regardless of the number of unions and children.
+    """
+    unions = list(Union.for_person(person_id).values(
+        'id', 'partner1', 'partner2', 'relationship',
+        'relationship__marriage_date', 'relationship__divorce_date',
+    ))
+    children = {union['id']: [] for union in unions}
+    for union_id, child_id in Union.children.through.objects.filter(
+        union__in=children
+    ).values_list('union', 'person'):
+        children[union_id].append(child_id)
+
+    person_ids = {union['partner1'] for union in unions} | {union['partner2'] for union in unions}
+    person_ids.update(child_id for child_ids in children.values() for child_id in child_ids)
+    rows = {row['id']: row for row in Person.objects.filter(pk__in=person_ids).values(*PERSON_SUMMARY_FIELDS)}
+
+    def birth_order(child_id):
+        row = rows[child_id]
+        return (row['date_of_birth'] is None, row['date_of_birth'] or date.min, row['full_name'])
+
+    # Marriages in date order, then couples without a recorded marriage.
+    unions.sort(key=lambda union: (
+        union['relationship__marriage_date'] is None, union['relationship__marriage_date'] or date.min
+    ))
+    return [{
+        'id': union['id'],
+        'partner': person_summary(
+            rows[union['partner2'] if union['partner1'] == person_id else union['partner1']], request
+        ),
+        'relationship': union['relationship'],
+        'marriage_date': union['relationship__marriage_date'],
+        'divorce_date': union['relationship__divorce_date'],
+        'active_marriage_status': union['relationship'] is not None and union['relationship__divorce_date'] is None,
+        'children': [
+            person_summary(rows[child_id], request) for child_id in sorted(children[union['id']], key=birth_order)
+        ],
+    } for union in unions]
+
+
+class ChangedFieldsMixin:
+    """Model serializer whose updates write only the columns that changed.
+
+    An update that changes nothing skips the save entirely, so it does not
+    take the database write lock, bump ``updated_at`` or add a change log
+    entry. ``changed_fields`` lists the fields the last update wrote.
+    """
+
+    changed_fields = ()
+
+    def update(self, instance, validated_data):
+        serializers.raise_errors_on_nested_writes('update', self, validated_data)
+
+        changed = []
+        for attr, value in validated_data.items():
+            field = instance._meta.get_field(attr)
+            if isinstance(field, models.FileField):
+                # A newly uploaded file is always a change.
+                changed.append(field.name)
+            elif field.is_relation:
+                if getattr(instance, field.attname) != getattr(value, 'pk', value):
+                    changed.append(field.name)
+            elif getattr(instance, field.attname) != value:
+                changed.append(field.name)
+            setattr(instance, attr, value)
+
+        if changed:
+            auto_now = [
+                field.name for field in instance._meta.concrete_fields if getattr(field, 'auto_now', False)
+            ]
+            instance.save(update_fields=[*changed, *auto_now])
+        self.changed_fields = changed
+        return instance
+
+
+class TreeSerializer(serializers.ModelSerializer):
+    """Serializer for FamilyTree model."""
+
+    class Meta:
+        model = FamilyTree
+        fields = ['id', 'name', 'is_default', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'is_default', 'created_at', 'updated_at']
 
 
-class PersonSerializer(serializers.ModelSerializer):
+class PersonSerializer(ChangedFieldsMixin, serializers.ModelSerializer):
     """Serializer for Person model."""
 
     age = serializers.SerializerMethodField()
@@ -17,10 +140,10 @@ class PersonSerializer(serializers.ModelSerializer):
     class Meta:
         model = Person
         fields = [
-            'id', 'full_name', 'gender', 'date_of_birth', 'date_of_death',
+            'id', 'tree', 'full_name', 'gender', 'date_of_birth', 'date_of_death',
             'profile_photo', 'notes', 'age', 'is_alive', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'tree', 'created_at', 'updated_at']
 
 
 class PersonListSerializer(serializers.ModelSerializer):
@@ -30,8 +153,18 @@ class PersonListSerializer(serializers.ModelSerializer):
         model = Person
         fields = ['id', 'full_name', 'gender', 'profile_photo']
 
+    @classmethod
+    def from_rows(cls, rows, request=None):
+        """Serialize ``Person.objects.values(*Meta.fields)`` rows without field introspection."""
+        return [{
+            'id': row['id'],
+            'full_name': row['full_name'],
+            'gender': row['gender'],
+            'profile_photo': photo_url(row['profile_photo'], request),
+        } for row in rows]
+
 
-class FamilyRelationshipSerializer(serializers.ModelSerializer):
+class FamilyRelationshipSerializer(ChangedFieldsMixin, serializers.ModelSerializer):
     """Serializer for FamilyRelationship model."""
 
     person1_name = serializers.CharField(source='person1.full_name', read_only=True)
@@ -41,13 +174,27 @@ class FamilyRelationshipSerializer(serializers.ModelSerializer):
     def get_active_marriage_status(self, obj):
         return obj.active_marriage_status
 
+    def validate(self, attrs):
+        """Both persons must belong to the same tree, and to the route's tree when scoped."""
+        person1 = attrs.get('person1', getattr(self.instance, 'person1', None))
+        person2 = attrs.get('person2', getattr(self.instance, 'person2', None))
+        if person1.tree_id != person2.tree_id:
+            raise serializers.ValidationError('Both persons must belong to the same family tree')
+
+        tree = self.context.get('tree')
+        if tree is not None and person1.tree_id != tree.pk:
+            raise serializers.ValidationError('Persons must belong to this family tree')
+
+        attrs['tree_id'] = person1.tree_id
+        return attrs
+
     class Meta:
         model = FamilyRelationship
         fields = [
-            'id', 'relationship_type', 'person1', 'person2', 'person1_name', 'person2_name',
+            'id', 'tree', 'relationship_type', 'person1', 'person2', 'person1_name', 'person2_name',
             'marriage_date', 'divorce_date', 'created_at', 'updated_at', 'active_marriage_status'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'active_marriage_status']
+        read_only_fields = ['id', 'tree', 'created_at', 'updated_at', 'active_marriage_status']
 
 
 class PersonDetailSerializer(serializers.ModelSerializer):
@@ -65,19 +212,21 @@ class PersonDetailSerializer(serializers.ModelSerializer):
     def get_is_alive(self, obj):
         return obj.is_alive
 
+    def _relationships(self, obj):
+        """Relationship index from the serializer context, or one loaded for ``obj``."""
+        index = self.context.get('relationship_index')
+        if index is None or obj.pk not in index.spouses:
+            index = RelationshipIndex([obj.pk])
+            self.context['relationship_index'] = index
+        return index
+
     def get_spouses(self, obj):
         """Get spouse relationships."""
-        spouse_relationships = FamilyRelationship.objects.filter(
-            relationship_type='spouse',
-            person1=obj
-        ) | FamilyRelationship.objects.filter(
-            relationship_type='spouse',
-            person2=obj
-        )
+        spouse_relationships = self._relationships(obj).spouses[obj.pk]
 
         spouses_data = []
         for rel in spouse_relationships:
-            spouse = rel.person2 if rel.person1 == obj else rel.person1
+            spouse = rel.person2 if rel.person1_id == obj.pk else rel.person1
             spouses_data.append({
                 'id': spouse.id,
                 'full_name': spouse.full_name,
@@ -97,10 +246,7 @@ class PersonDetailSerializer(serializers.ModelSerializer):
 
     def get_parents(self, obj):
         """Get parent relationships."""
-        parent_relationships = FamilyRelationship.objects.filter(
-            relationship_type='parent_child',
-            person2=obj
-        )
+        parent_relationships = self._relationships(obj).parents[obj.pk]
 
         parents_data = []
         for rel in parent_relationships:
@@ -116,10 +262,7 @@ class PersonDetailSerializer(serializers.ModelSerializer):
 
     def get_children(self, obj):
         """Get children relationships."""
-        children_relationships = FamilyRelationship.objects.filter(
-            relationship_type='parent_child',
-            person1=obj
-        )
+        children_relationships = self._relationships(obj).children[obj.pk]
 
         children_data = []
         for rel in children_relationships:
@@ -150,81 +293,154 @@ class PersonDetailSerializer(serializers.ModelSerializer):
 class FamilyTreeSerializer(serializers.ModelSerializer):
     """Serializer for family tree data structure."""
 
-    spouses = serializers.SerializerMethodField()
-    children = serializers.SerializerMethodField()
+    spouses = serializers.ListField(read_only=True)
+    children = serializers.ListField(read_only=True)
 
     class Meta:
         model = Person
         fields = ['id', 'full_name', 'gender', 'profile_photo', 'spouses', 'children']
 
-    def get_spouses(self, obj):
-        """Get spouse relationships with their children."""
-        spouse_relationships = FamilyRelationship.objects.filter(
-            relationship_type='spouse',
-            person1=obj
-        ) | FamilyRelationship.objects.filter(
-            relationship_type='spouse',
-            person2=obj
-        )
+    @classmethod
+    def build(cls, person, request=None, generations=1):
+        """Build the tree payload (also used for ``data``) from ``.values()`` rows.
+
+        Runs two queries per generation instead of several per spouse and
+        child; each spouse's ``children`` are the children of that union.
+        With ``generations`` above 1, each child is expanded with its own
+        ``spouses`` and ``children`` down to that depth.
+        """
+        tree = collect_tree(person.pk, generations, PERSON_SUMMARY_FIELDS)
+
+        def node(person_id, depth):
+            data = person_summary(tree.rows[person_id], request)
+            if depth < generations and person_id in tree.expanded:
+                data.update(branches(person_id, depth))
+            return data
+
+        def branches(person_id, depth):
+            child_ids = tree.children.get(person_id, [])
+            children_data = [node(child_id, depth + 1) for child_id in child_ids]
+
+            spouses_data = []
+            for spouse_id, couple in tree.spouses.get(person_id, []):
+                spouse_data = person_summary(tree.rows[spouse_id], request)
+                spouse_data.update({
+                    'marriage_date': couple['marriage_date'],
+                    'divorce_date': couple['divorce_date'],
+                    'active_marriage_status': couple['divorce_date'] is None,
+                    'children': [
+                        child for child_id, child in zip(child_ids, children_data)
+                        if child_id in couple['children']
+                    ],
+                })
+                spouses_data.append(spouse_data)
+
+            return {'spouses': spouses_data, 'children': children_data}
+
+        return {
+            'id': person.pk,
+            'full_name': person.full_name,
+            'gender': person.gender,
+            'profile_photo': photo_url(person.profile_photo.name, request),
+            **branches(person.pk, 0),
+        }
+
+    @classmethod
+    def build_compact(cls, person, request=None, generations=1):
+        """Build the compact tree representation.
+
+        Every person appears once in ``people``; ``spouses`` rows are
+        ``[index, index, marriage_date, divorce_date]`` and ``children`` rows
+        are ``[parent_index, child_index]``.
+        """
+        tree = collect_tree(person.pk, generations, PERSON_SUMMARY_FIELDS)
+        index = {}
+        people = []
+
+        def ref(person_id):
+            if person_id not in index:
+                index[person_id] = len(people)
+                people.append(person_summary(tree.rows[person_id], request))
+            return index[person_id]
+
+        ref(person.pk)
+        spouses = []
+        children = []
+        seen_spouses = set()
+        seen_children = set()
+
+        def add_child_edge(parent_id, child_id):
+            if (parent_id, child_id) not in seen_children:
+                seen_children.add((parent_id, child_id))
+                children.append([ref(parent_id), ref(child_id)])
+
+        for person_id in tree.expanded:
+            for child_id in tree.children.get(person_id, []):
+                add_child_edge(person_id, child_id)
+
+        for person_id in tree.expanded:
+            for spouse_id, couple in tree.spouses.get(person_id, []):
+                pair = frozenset((person_id, spouse_id))
+                if pair not in seen_spouses:
+                    seen_spouses.add(pair)
+                    spouses.append([
+                        ref(person_id), ref(spouse_id), couple['marriage_date'], couple['divorce_date']
+                    ])
+                for child_id in tree.children[person_id]:
+                    if child_id in couple['children']:
+                        add_child_edge(spouse_id, child_id)
+
+        return {'root': 0, 'people': people, 'spouses': spouses, 'children': children}
+
+    def to_representation(self, instance):
+        return self.build(instance, request=self.context.get('request'))
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Read-only serializer for background job status."""
 
-        spouses_data = []
-        for rel in spouse_relationships:
-            spouse = rel.person2 if rel.person1 == obj else rel.person1
-            # Get children from this specific spouse
-            children = FamilyRelationship.objects.filter(
-                relationship_type='parent_child',
-                person1=obj,
-                person2__in=FamilyRelationship.objects.filter(
-                    relationship_type='parent_child',
-                    person1=spouse
-                ).values_list('person2', flat=True)
-            )
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'task', 'payload', 'status', 'attempts', 'max_attempts', 'run_after',
+            'result', 'error', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
 
-            spouses_data.append({
-                'id': spouse.id,
-                'full_name': spouse.full_name,
-                'gender': spouse.gender,
-                'date_of_birth': spouse.date_of_birth,
-                'date_of_death': spouse.date_of_death,
-                'profile_photo': spouse.profile_photo.url if spouse.profile_photo else None,
-                'age': spouse.age,
-                'is_alive': spouse.is_alive,
-                'marriage_date': rel.marriage_date,
-                'divorce_date': rel.divorce_date,
-                'active_marriage_status': rel.active_marriage_status,
-                'children': [{
-                    'id': rel.person2.id,
-                    'full_name': rel.person2.full_name,
-                    'gender': rel.person2.gender,
-                    'date_of_birth': rel.person2.date_of_birth,
-                    'date_of_death': rel.person2.date_of_death,
-                    'profile_photo': rel.person2.profile_photo.url if rel.person2.profile_photo else None,
-                    'age': rel.person2.age,
-                    'is_alive': rel.person2.is_alive,
-                } for rel in children]
-            })
 
-        return spouses_data
+class PhotoUploadSerializer(serializers.ModelSerializer):
+    """Serializer for a resumable profile photo upload."""
 
-    def get_children(self, obj):
-        """Get all children for this person."""
-        children_relationships = FamilyRelationship.objects.filter(
-            relationship_type='parent_child',
-            person1=obj
-        )
+    def validate_filename(self, value):
+        return os.path.basename(value)
 
-        children_data = []
-        for rel in children_relationships:
-            child = rel.person2
-            children_data.append({
-                'id': child.id,
-                'full_name': child.full_name,
-                'gender': child.gender,
-                'date_of_birth': child.date_of_birth,
-                'date_of_death': child.date_of_death,
-                'profile_photo': child.profile_photo.url if child.profile_photo else None,
-                'age': child.age,
-                'is_alive': child.is_alive,
-            })
+    def validate_size(self, value):
+        maximum = settings.FAMILY_PHOTO_UPLOAD_MAX_BYTES
+        if not 0 < value <= maximum:
+            raise serializers.ValidationError(f'size must be between 1 and {maximum} bytes')
+        return value
+
+    def validate_person(self, value):
+        tree = self.context.get('tree')
+        if tree is not None and value.tree_id != tree.pk:
+            raise serializers.ValidationError('Person must belong to this family tree')
+        return value
+
+    class Meta:
+        model = PhotoUpload
+        fields = ['id', 'person', 'filename', 'size', 'received', 'completed_at', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'received', 'completed_at', 'created_at', 'updated_at']
 
-        return children_data
\ No newline at end of file
+
+class LifeEventSerializer(serializers.ModelSerializer):
+    """Serializer for LifeEvent model."""
+
+    person_name = serializers.CharField(source='person.full_name', read_only=True)
+    spouse_name = serializers.CharField(source='spouse.full_name', read_only=True, default=None)
+
+    class Meta:
+        model = LifeEvent
+        fields = [
+            'id', 'event_type', 'date', 'person', 'person_name', 'spouse', 'spouse_name', 'relationship'
+        ]
+        read_only_fields = fields
@@ -0,0 +1,151 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import uploads
+from .models import ChangeLog, FamilyRelationship, FamilyTree, LifeEvent, Person, PhotoUpload, Union
+from .serializers import PERSON_SUMMARY_FIELDS
+
+CHANGE_LOG_MODELS = {
+    Person: 'person',
+    FamilyRelationship: 'relationship',
+}
+
+
+@receiver(post_save, sender=Person)
+@receiver(post_save, sender=FamilyRelationship)
+def log_save(sender, instance, created, raw=False, **kwargs):
+    """Append a create/update entry to the change log."""
+    if raw:
+        return
+    ChangeLog.objects.create(
+        tree_id=instance.tree_id,
+        model=CHANGE_LOG_MODELS[sender],
+        object_id=instance.pk,
+        action='create' if created else 'update',
+    )
+
+
+@receiver(post_delete, sender=Person)
+@receiver(post_delete, sender=FamilyRelationship)
+def log_delete(sender, instance, origin=None, **kwargs):
+    """Append a delete entry to the change log."""
+    if isinstance(origin, FamilyTree):
+        # Recorded all at once by log_tree_delete.
+        return
+    ChangeLog.objects.create(
+        tree_id=instance.tree_id,
+        model=CHANGE_LOG_MODELS[sender],
+        object_id=instance.pk,
+        action='delete',
+    )
+
+
+@receiver(pre_delete, sender=FamilyTree)
+def log_tree_delete(sender, instance, **kwargs):
+    """Append delete entries for everything in a tree that is being deleted.
+
+    The tree's own change log goes with it, so the entries are recorded
+    without a tree and clients of the unscoped feed still see the deletes.
+    """
+    for model, name in CHANGE_LOG_MODELS.items():
+        ChangeLog.record(name, model.objects.filter(tree=instance).values_list('pk', flat=True), 'delete')
+
+
+@receiver(post_save, sender=Person)
+def sync_person_events(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Keep birth and death events in step with the person's dates."""
+    if raw:
+        return
+    if update_fields is not None and not {'date_of_birth', 'date_of_death'} & set(update_fields):
+        return
+    LifeEvent.sync_person(instance)
+
+
+@receiver(post_save, sender=FamilyRelationship)
+def sync_relationship_events(sender, instance, raw=False, **kwargs):
+    """Keep marriage and divorce events in step with a spouse relationship."""
+    if raw:
+        return
+    LifeEvent.sync_relationship(instance)
+
+
+@receiver(pre_save, sender=FamilyRelationship)
+def remember_previous_persons(sender, instance, raw=False, **kwargs):
+    """Note the stored persons of an edited relationship, whose unions and snapshots may change."""
+    instance._previous_child_id = None
+    instance._previous_person_ids = ()
+    if raw or instance._state.adding:
+        return
+    previous = FamilyRelationship.objects.filter(pk=instance.pk).values_list(
+        'relationship_type', 'person1', 'person2'
+    ).first()
+    if previous is not None:
+        relationship_type, person1_id, person2_id = previous
+        instance._previous_person_ids = (person1_id, person2_id)
+        if relationship_type == 'parent_child':
+            instance._previous_child_id = person2_id
+
+
+@receiver(post_save, sender=FamilyRelationship)
+def sync_unions(sender, instance, created, raw=False, **kwargs):
+    """Keep couples and their shared children in step with the relationship."""
+    if raw:
+        return
+    child_ids = {getattr(instance, '_previous_child_id', None)}
+    if instance.relationship_type == 'parent_child':
+        child_ids.add(instance.person2_id)
+    child_ids.discard(None)
+    if child_ids:
+        Union.sync_children(child_ids)
+    if instance.relationship_type == 'spouse' or not created:
+        Union.sync_relationship(instance)
+
+
+@receiver(post_delete, sender=FamilyRelationship)
+def prune_unions(sender, instance, origin=None, **kwargs):
+    """Drop the child from its parents' union, or a couple's union once nothing else links them."""
+    if isinstance(origin, FamilyTree):
+        return
+    if instance.relationship_type == 'parent_child':
+        Union.sync_children([instance.person2_id])
+    elif instance.person1_id != instance.person2_id:
+        partner1_id, partner2_id = Union.ordered(instance.person1_id, instance.person2_id)
+        Union.prune(Union.objects.filter(partner1=partner1_id, partner2=partner2_id).values('id'))
+
+
+@receiver(post_save, sender=Person)
+@receiver(pre_delete, sender=Person)
+def invalidate_person_snapshots(sender, instance, update_fields=None, raw=False, origin=None, **kwargs):
+    """Queue rebuilds of the tree snapshots that show the person.
+
+    On delete this has to run before the cascade removes the person from
+    the snapshots' ``persons``.
+    """
+    if raw or isinstance(origin, FamilyTree):
+        return
+    if update_fields is not None and not set(PERSON_SUMMARY_FIELDS) & set(update_fields):
+        return
+    from . import snapshots
+
+    snapshots.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=FamilyRelationship)
+@receiver(post_delete, sender=FamilyRelationship)
+def invalidate_relationship_snapshots(sender, instance, raw=False, origin=None, **kwargs):
+    """Queue rebuilds of the tree snapshots that show either person, before or after the change."""
+    if raw or isinstance(origin, FamilyTree):
+        return
+    from . import snapshots
+
+    snapshots.invalidate({
+        instance.person1_id, instance.person2_id, *getattr(instance, '_previous_person_ids', ())
+    })
+
+
+@receiver(post_delete, sender=PhotoUpload)
+def remove_upload_part(sender, instance, **kwargs):
+    """Delete the temporary file of a cancelled, rejected or expired upload."""
+    path = uploads.part_path(instance.pk)
+    transaction.on_commit(lambda: path.unlink(missing_ok=True))
@@ -0,0 +1,193 @@
+"""Persisted snapshots of the ``family_tree`` payload for popular roots.
+
+Every ``family_tree`` request counts a hit for its root, generations and host in a
+per-process counter that is written to ``TreeSnapshot`` rows every
+``FAMILY_SNAPSHOT_FLUSH_SECONDS``. Once a root reaches
+``FAMILY_SNAPSHOT_MIN_HITS``, and while fewer than
+``FAMILY_SNAPSHOT_MAX_COUNT`` unpinned snapshots exist, a background job
+renders its payload and stores it gzip-compressed together with the persons
+it contains. Ready snapshots are served with a single read and no traversal.
+A write to any of those persons or their relationships queues a rebuild;
+until it finishes requests are computed as usual.
+"""
+import gzip
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.middleware.gzip import re_accepts_gzip
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+
+from . import tasks
+from .models import ChangeLog, TreeSnapshot
+from .renderers import FastJSONRenderer
+from .serializers import FamilyTreeSerializer
+
+
+class HitCounter:
+    """Thread-safe per-process hit counts, handed out in batches for flushing."""
+
+    def __init__(self, flush_seconds):
+        self.flush_seconds = flush_seconds
+        self._counts = {}
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, key):
+        """Count a hit; returns all pending counts when a flush is due, else ``None``."""
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+            if time.monotonic() - self._flushed_at < self.flush_seconds:
+                return None
+            return self._take()
+
+    def take(self):
+        with self._lock:
+            return self._take()
+
+    def _take(self):
+        counts, self._counts = self._counts, {}
+        self._flushed_at = time.monotonic()
+        return counts
+
+
+hit_counter = HitCounter(settings.FAMILY_SNAPSHOT_FLUSH_SECONDS)
+
+
+class BaseURLRequest:
+    """Stands in for a request when building absolute photo URLs outside one."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def build_absolute_uri(self, location):
+        return urljoin(self.base_url, location) if self.base_url else location
+
+
+def base_url(request):
+    return request.build_absolute_uri('/')
+
+
+def get_snapshot(root_id, generations, request):
+    """Gzipped payload of a ready snapshot built for this request's host, or ``None``."""
+    content = TreeSnapshot.objects.filter(
+        root=root_id, generations=generations, status='ready', base_url=base_url(request)
+    ).values_list('content', flat=True).first()
+    return bytes(content) if content is not None else None
+
+
+def snapshot_response(content, request):
+    """Serve a gzipped snapshot as is, or decompressed for clients that don't accept gzip."""
+    if re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        response = HttpResponse(content, content_type='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(gzip.decompress(content), content_type='application/json')
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    return response
+
+
+def record_hit(person, generations, request):
+    """Count a ``family_tree`` request, flushing the counts to the database when due."""
+    counts = hit_counter.add((person.tree_id, person.pk, generations, base_url(request)))
+    if counts:
+        flush_hits(counts)
+
+
+def flush_hits(counts):
+    """Add ``{(tree_id, root_id, generations, base_url): hits}`` to the snapshot rows.
+
+    Candidates that reached ``FAMILY_SNAPSHOT_MIN_HITS`` are queued for
+    building while there is room for them.
+    """
+    now = timezone.now()
+    for (tree_id, root_id, generations, url), hits in counts.items():
+        rows = TreeSnapshot.objects.filter(root=root_id, generations=generations, base_url=url)
+        if rows.update(hits=F('hits') + hits, updated_at=now):
+            continue
+        try:
+            with transaction.atomic():
+                TreeSnapshot.objects.create(
+                    tree_id=tree_id, root_id=root_id, generations=generations, base_url=url, hits=hits
+                )
+        except IntegrityError:
+            # Another process created the row first.
+            rows.update(hits=F('hits') + hits, updated_at=now)
+
+    room = settings.FAMILY_SNAPSHOT_MAX_COUNT - TreeSnapshot.objects.filter(pinned=False).exclude(
+        status='candidate'
+    ).count()
+    if room <= 0:
+        return
+    promoted = list(TreeSnapshot.objects.filter(
+        status='candidate',
+        hits__gte=settings.FAMILY_SNAPSHOT_MIN_HITS,
+        root__in={root_id for _, root_id, _, _ in counts},
+    ).values_list('id', flat=True)[:room])
+    queue(promoted)
+
+
+def queue(snapshot_ids):
+    """Mark snapshots as queued and start a build job for each once the transaction commits."""
+    snapshot_ids = list(snapshot_ids)
+    if not snapshot_ids:
+        return
+    TreeSnapshot.objects.filter(pk__in=snapshot_ids).update(status='queued', updated_at=timezone.now())
+    transaction.on_commit(lambda: [
+        tasks.enqueue('build_tree_snapshot', {'snapshot_id': snapshot_id}) for snapshot_id in snapshot_ids
+    ])
+
+
+def invalidate(person_ids):
+    """Queue a rebuild of every ready snapshot containing one of ``person_ids``."""
+    # Queued ones already have a build job, which will see the write.
+    queue(TreeSnapshot.objects.filter(
+        persons__in=list(person_ids), status='ready'
+    ).values_list('id', flat=True).distinct())
+
+
+def person_ids(data):
+    """Ids of every person in a ``family_tree`` payload."""
+    found = {data['id']}
+    for key in ('spouses', 'children'):
+        for related in data.get(key, ()):
+            found |= person_ids(related)
+    return found
+
+
+def build(snapshot_id):
+    """Render and store a queued snapshot.
+
+    If anything in the tree was written while it was being built, nothing
+    is stored and the build is queued again: until the snapshot has its
+    persons, writes to them cannot queue it themselves.
+    """
+    snapshot = TreeSnapshot.objects.filter(pk=snapshot_id, status='queued').select_related('root').first()
+    if snapshot is None:
+        return {'built': False}
+    changes = ChangeLog.objects.filter(tree_id=snapshot.tree_id)
+    version = ChangeLog.latest_cursor(changes)
+
+    data = FamilyTreeSerializer.build(
+        snapshot.root, request=BaseURLRequest(snapshot.base_url), generations=snapshot.generations
+    )
+    rendered = FastJSONRenderer().render(data)
+    content = gzip.compress(rendered, compresslevel=9)
+    members = person_ids(data)
+
+    with transaction.atomic():
+        built = ChangeLog.latest_cursor(changes) == version and TreeSnapshot.objects.filter(
+            pk=snapshot_id, status='queued'
+        ).update(content=content, size=len(rendered), status='ready', built_at=timezone.now())
+        if built:
+            snapshot.persons.set(members)
+    if not built:
+        tasks.enqueue('build_tree_snapshot', {'snapshot_id': snapshot_id}, delay=timedelta(seconds=10))
+        return {'built': False}
+    return {'built': True, 'size': len(rendered), 'compressed': len(content), 'persons': len(members)}
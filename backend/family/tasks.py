@@ -0,0 +1,185 @@
+"""Database-backed background jobs.
+
+Tasks are plain functions registered with ``@task``; ``enqueue`` stores a
+``Job`` row and ``manage.py run_worker`` claims and runs pending jobs.
+"""
+import io
+import logging
+import os
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job, Person
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def task(name):
+    """Register a function as a background task under ``name``."""
+    def decorator(func):
+        registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(task_name, payload=None, max_attempts=3, delay=None):
+    """Create a pending job for ``task_name``, optionally delayed by a ``timedelta``."""
+    if task_name not in registry:
+        raise ValueError(f"Unknown task: {task_name}")
+
+    run_after = timezone.now() + delay if delay else timezone.now()
+    return Job.objects.create(
+        task=task_name,
+        payload=payload or {},
+        max_attempts=max_attempts,
+        run_after=run_after,
+    )
+
+
+def claim_next(worker_id):
+    """Atomically move the next due job to ``running`` and return it, or ``None``.
+
+    Uses a compare-and-set update rather than row locks so it works the same
+    on SQLite and PostgreSQL.
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(
+        status='pending', run_after__lte=now
+    ).order_by('run_after').values_list('id', flat=True)[:10]
+
+    for job_id in candidates:
+        claimed = Job.objects.filter(pk=job_id, status='pending').update(
+            status='running',
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def requeue_stale(lock_timeout):
+    """Return jobs whose worker died mid-run to the queue."""
+    cutoff = timezone.now() - timedelta(seconds=lock_timeout)
+    return Job.objects.filter(status='running', locked_at__lt=cutoff).update(
+        status='pending', locked_by='', locked_at=None, updated_at=timezone.now()
+    )
+
+
+def run_job(job_id, worker_id):
+    """Run a job claimed by ``worker_id`` and record its outcome, scheduling a retry on failure.
+
+    The outcome is only written while the job still carries this worker's
+    claim; if ``requeue_stale`` handed it to another worker in the meantime,
+    that worker's claim is left alone.
+    """
+    close_old_connections()
+    job = Job.objects.get(pk=job_id)
+    if job.status != 'running' or job.locked_by != worker_id:
+        logger.warning("Job %s (%s) is no longer claimed by %s, not running it", job.pk, job.task, worker_id)
+        return job.status
+
+    outcome = {'locked_by': '', 'locked_at': None}
+    try:
+        result = registry[job.task](**job.payload)
+    except Exception:
+        outcome['error'] = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            outcome['status'] = 'pending'
+            outcome['run_after'] = timezone.now() + timedelta(seconds=2 ** job.attempts)
+        else:
+            outcome['status'] = 'failed'
+        logger.warning("Job %s (%s) failed on attempt %s", job.pk, job.task, job.attempts)
+    else:
+        outcome.update(status='succeeded', result=result, error='')
+
+    finished = Job.objects.filter(
+        pk=job.pk, status='running', locked_by=worker_id, attempts=job.attempts
+    ).update(updated_at=timezone.now(), **outcome)
+    close_old_connections()
+    if not finished:
+        logger.warning(
+            "Job %s (%s) was requeued while %s ran it; its outcome was discarded", job.pk, job.task, worker_id
+        )
+    return outcome['status']
+
+
+def init_worker_process():
+    """Process pool initializer: set Django up in spawned children."""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+# Tasks
+
+ORIENTATION_TAG = 0x0112
+
+
+@task('process_profile_photo')
+def process_profile_photo(person_id):
+    """Apply EXIF orientation and cap the size of an uploaded profile photo."""
+    from PIL import Image, ImageOps
+
+    person = Person.objects.filter(pk=person_id).first()
+    if person is None or not person.profile_photo:
+        return {'processed': False}
+
+    max_dimension = settings.FAMILY_PHOTO_MAX_DIMENSION
+    with person.profile_photo.open('rb') as photo:
+        image = Image.open(photo)
+        image.load()
+
+    orientation = image.getexif().get(ORIENTATION_TAG, 1)
+    if orientation == 1 and max(image.size) <= max_dimension:
+        return {'processed': False}
+
+    processed = ImageOps.exif_transpose(image)
+    processed.thumbnail((max_dimension, max_dimension))
+    buffer = io.BytesIO()
+    processed.save(buffer, format=image.format or 'PNG')
+
+    old_name = person.profile_photo.name
+    with transaction.atomic():
+        person.profile_photo.save(os.path.basename(old_name), ContentFile(buffer.getvalue()), save=False)
+        person.save(update_fields=['profile_photo', 'updated_at'])
+    transaction.on_commit(lambda: person.profile_photo.storage.delete(old_name))
+
+    return {'processed': True, 'width': processed.width, 'height': processed.height}
+
+
+@task('build_tree_snapshot')
+def build_tree_snapshot(snapshot_id):
+    """Render and store the family tree payload of a popular or pinned root."""
+    from . import snapshots
+
+    return snapshots.build(snapshot_id)
+
+
+@task('find_duplicates')
+def find_duplicates(threshold=0.8, year_window=2, limit=1000, tree_id=None):
+    """Search for likely duplicate persons, optionally in one tree, and return the best-scoring pairs."""
+    from . import dedupe
+
+    queryset = Person.objects.filter(tree_id=tree_id) if tree_id else None
+    pairs, skipped = dedupe.find_duplicates(queryset, threshold=threshold, year_window=year_window)
+    return {
+        'total': len(pairs),
+        'skipped_undated': skipped,
+        'pairs': [
+            {'person1': str(pair.person1), 'person2': str(pair.person2), 'score': pair.score}
+            for pair in pairs[:limit]
+        ],
+    }
@@ -1,3 +1,887 @@
-from django.test import TestCase
+import asyncio
+import io
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.admin.sites import site
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import UnreadablePostError
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import dedupe, graph, loadtest, replicas, snapshots, tasks, uploads
+from .models import (
+    ChangeLog, FamilyRelationship, FamilyTree, Job, LifeEvent, Person, PhotoUpload, TreeSnapshot, Union,
+)
+from .querybudget import QueryBudgetExceeded, QueryRecorder, assert_query_budget
+
+
+def make_family(children=4, grandchildren=2):
+    """A root couple with ``children`` children, each with ``grandchildren`` children."""
+    root = Person.objects.create(full_name='Root Parent', gender='M')
+    spouse = Person.objects.create(full_name='Root Spouse', gender='F')
+    FamilyRelationship.objects.create(relationship_type='spouse', person1=root, person2=spouse)
+    leaves = []
+    for i in range(children):
+        child = Person.objects.create(full_name=f'Child {i}', gender='F')
+        FamilyRelationship.objects.create(relationship_type='parent_child', person1=root, person2=child)
+        FamilyRelationship.objects.create(relationship_type='parent_child', person1=spouse, person2=child)
+        for j in range(grandchildren):
+            grandchild = Person.objects.create(full_name=f'Grandchild {i}.{j}', gender='M')
+            FamilyRelationship.objects.create(
+                relationship_type='parent_child', person1=child, person2=grandchild
+            )
+            leaves.append(grandchild)
+    return root, leaves
+
+
+class QueryBudgetTests(TestCase):
+    """The query budget helper itself."""
+
+    def setUp(self):
+        self.person = Person.objects.create(full_name='Solo', gender='O')
+
+    def test_repeated_query_is_reported_with_its_location(self):
+        with self.assertRaises(QueryBudgetExceeded) as caught:
+            with assert_query_budget(max_repeats=2):
+                for _ in range(3):
+                    Person.objects.filter(pk=self.person.pk).exists()
+        message = str(caught.exception)
+        self.assertIn('Same query run 3 times (limit 2), likely N+1', message)
+        self.assertIn('family/tests.py', message)
+
+    def test_repeats_within_limit_pass(self):
+        with assert_query_budget(max_repeats=2) as recorder:
+            for _ in range(2):
+                Person.objects.filter(pk=self.person.pk).exists()
+        self.assertEqual(len(recorder.queries), 2)
+
+    def test_queries_with_different_sql_are_not_repeats(self):
+        with QueryRecorder() as recorder:
+            Person.objects.filter(pk=self.person.pk).exists()
+            Person.objects.filter(full_name='Solo').exists()
+        self.assertEqual(recorder.problems(max_repeats=1), [])
+
+    def test_total_budget(self):
+        with QueryRecorder() as recorder:
+            Person.objects.count()
+            FamilyRelationship.objects.count()
+        problems = recorder.problems(max_queries=1)
+        self.assertEqual(len(problems), 1)
+        self.assertIn('2 queries, budget is 1', problems[0])
+
+
+class EndpointQueryCountTests(TestCase):
+    """Query counts of endpoints that used to issue a query per row or per person."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.root, self.leaves = make_family()
+
+    def test_relationship_list(self):
+        # Page count and page rows, with both persons joined in.
+        with assert_query_budget(max_queries=2) as recorder:
+            response = self.client.get('/api/relationships/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(recorder.queries), 2)
+        self.assertEqual(response.json()['count'], 17)
+
+    def test_descendants_query_per_generation(self):
+        # Person lookup, one query per generation (children, grandchildren and
+        # the empty level below them), then the serialized rows.
+        with assert_query_budget(max_queries=5, max_repeats=3) as recorder:
+            response = self.client.get(f'/api/persons/{self.root.pk}/descendants/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(recorder.queries), 5)
+        self.assertEqual(len(response.json()), 12)
+
+    def test_descendants_query_count_does_not_grow_with_the_family(self):
+        root, _ = make_family(children=10, grandchildren=5)
+        with assert_query_budget(max_queries=5, max_repeats=3):
+            response = self.client.get(f'/api/persons/{root.pk}/descendants/')
+        self.assertEqual(len(response.json()), 60)
+
+    def test_ancestors_query_per_generation(self):
+        # Person lookup, parents, grandparents, the empty level above, rows.
+        with assert_query_budget(max_queries=5, max_repeats=3) as recorder:
+            response = self.client.get(f'/api/persons/{self.leaves[0].pk}/ancestors/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(recorder.queries), 5)
+        self.assertEqual(
+            sorted(person['full_name'] for person in response.json()),
+            ['Child 0', 'Root Parent', 'Root Spouse'],
+        )
+
+
+calls = []
+
+
+@tasks.task('test_record')
+def record_call(value):
+    calls.append(value)
+    return {'value': value}
+
+
+@tasks.task('test_fail')
+def always_fail():
+    raise RuntimeError('broken')
+
+
+@tasks.task('test_requeued_while_running')
+def requeued_while_running():
+    # The job outlives the lock timeout and another worker takes it over.
+    Job.objects.filter(status='running').update(locked_at=timezone.now() - timedelta(minutes=5))
+    tasks.requeue_stale(lock_timeout=60)
+    tasks.claim_next('worker-b')
+
+
+class JobQueueTests(TestCase):
+    """Claiming, retrying and requeueing of background jobs."""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_a_job_is_claimed_by_one_worker_only(self):
+        job = tasks.enqueue('test_record', {'value': 1})
+        claimed = tasks.claim_next('worker-a')
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual((claimed.status, claimed.locked_by, claimed.attempts), ('running', 'worker-a', 1))
+        self.assertIsNone(tasks.claim_next('worker-b'))
+
+    def test_delayed_job_is_not_claimed_early(self):
+        tasks.enqueue('test_record', {'value': 1}, delay=timedelta(minutes=5))
+        self.assertIsNone(tasks.claim_next('worker-a'))
+
+    def test_success(self):
+        job = tasks.enqueue('test_record', {'value': 7})
+        tasks.claim_next('worker-a')
+        self.assertEqual(tasks.run_job(job.pk, 'worker-a'), 'succeeded')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result, job.locked_by), ('succeeded', {'value': 7}, ''))
+        self.assertEqual(calls, [7])
+
+    def test_retry_then_fail(self):
+        job = tasks.enqueue('test_fail', max_attempts=2)
+        tasks.claim_next('worker-a')
+        with self.assertLogs('family.tasks', 'WARNING'):
+            self.assertEqual(tasks.run_job(job.pk, 'worker-a'), 'pending')
+        job.refresh_from_db()
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn('RuntimeError: broken', job.error)
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        tasks.claim_next('worker-a')
+        with self.assertLogs('family.tasks', 'WARNING'):
+            self.assertEqual(tasks.run_job(job.pk, 'worker-a'), 'failed')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), ('failed', 2, ''))
+
+    def test_stale_job_is_requeued(self):
+        job = tasks.enqueue('test_record', {'value': 1})
+        tasks.claim_next('worker-a')
+        self.assertEqual(tasks.requeue_stale(lock_timeout=60), 0)
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(tasks.requeue_stale(lock_timeout=60), 1)
+        self.assertEqual(tasks.claim_next('worker-b').pk, job.pk)
+
+    def test_outcome_of_a_requeued_job_does_not_overwrite_the_new_claim(self):
+        job = tasks.enqueue('test_requeued_while_running')
+        tasks.claim_next('worker-a')
+        with self.assertLogs('family.tasks', 'WARNING'):
+            tasks.run_job(job.pk, 'worker-a')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by, job.attempts), ('running', 'worker-b', 2))
+
+    def test_job_claimed_by_another_worker_is_not_run(self):
+        job = tasks.enqueue('test_record', {'value': 1})
+        tasks.claim_next('worker-b')
+        with self.assertLogs('family.tasks', 'WARNING'):
+            self.assertEqual(tasks.run_job(job.pk, 'worker-a'), 'running')
+        self.assertEqual(calls, [])
+
+
+class AdminNameSearchTests(TestCase):
+    """Prefix name search in the admin, with ``*`` for substring search."""
+
+    def setUp(self):
+        names = ['John Smith', 'Smithers Ann', 'Anne Smith']
+        self.persons = {name: Person.objects.create(full_name=name, gender='O') for name in names}
+        FamilyRelationship.objects.create(
+            relationship_type='spouse', person1=self.persons['John Smith'], person2=self.persons['Smithers Ann']
+        )
+        self.request = RequestFactory().get('/')
+
+    def search(self, model, term):
+        queryset, may_have_duplicates = site._registry[model].get_search_results(
+            self.request, model.objects.all(), term
+        )
+        return queryset
+
+    def test_prefix_search_ignores_case(self):
+        names = self.search(Person, 'SMITH').values_list('full_name', flat=True)
+        self.assertEqual(list(names), ['Smithers Ann'])
+
+    def test_star_searches_anywhere_in_the_name(self):
+        names = self.search(Person, '*smith').values_list('full_name', flat=True)
+        self.assertEqual(sorted(names), ['Anne Smith', 'John Smith', 'Smithers Ann'])
+
+    def test_relationship_search_matches_either_person(self):
+        self.assertEqual(self.search(FamilyRelationship, 'smithers').count(), 1)
+        self.assertEqual(self.search(FamilyRelationship, 'john').count(), 1)
+        self.assertEqual(self.search(FamilyRelationship, 'anne').count(), 0)
+
+    def test_prefix_search_uses_the_name_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('query plan checked on SQLite')
+        self.assertIn('family_person_name_lower', self.search(Person, 'smi').explain())
+
+
+class CandidatePairTests(TestCase):
+    """Which persons the duplicate search compares."""
+
+    def candidate(self, name, born=None):
+        return dedupe.Candidate(name, dedupe.normalize_name(name), 'M', born, None)
+
+    def pairs(self, candidates, skipped=None):
+        return {
+            frozenset((first.id, second.id))
+            for first, second in dedupe.candidate_pairs(candidates, 2, skipped)
+        }
+
+    def test_undated_persons_are_compared_within_their_first_name_group(self):
+        candidates = [
+            self.candidate('John Smith'), self.candidate('Jon Smith'),
+            self.candidate('John Smith Sr', born=date(1900, 1, 1)), self.candidate('Mary Smith'),
+        ]
+        self.assertEqual(self.pairs(candidates), {
+            frozenset(('John Smith', 'Jon Smith')),
+            frozenset(('John Smith', 'John Smith Sr')),
+            frozenset(('Jon Smith', 'John Smith Sr')),
+        })
+
+    def test_large_surname_block_still_compares_undated_persons(self):
+        candidates = [
+            self.candidate(f'Person{index} Smith', born=date(1800 + index % 200, 1, 1))
+            for index in range(dedupe.MAX_UNDATED_GROUP_SIZE + 50)
+        ]
+        candidates += [self.candidate('Ann Smith'), self.candidate('Anne Smith')]
+        skipped = []
+        self.assertIn(frozenset(('Ann Smith', 'Anne Smith')), self.pairs(candidates, skipped))
+        self.assertEqual(skipped, [])
+
+    def test_oversized_undated_group_is_reported(self):
+        candidates = [self.candidate('John Smith') for _ in range(dedupe.MAX_UNDATED_GROUP_SIZE + 1)]
+        candidates.append(self.candidate('Mary Smith'))
+        skipped = []
+        self.assertEqual(self.pairs(candidates, skipped), set())
+        self.assertEqual(len(skipped), dedupe.MAX_UNDATED_GROUP_SIZE + 1)
+
+
+class MergePersonsTests(TestCase):
+    """Re-pointing, de-duplicating and logging relationships when persons merge."""
+
+    def setUp(self):
+        self.keep = Person.objects.create(full_name='John Smith', gender='M')
+        self.duplicate = Person.objects.create(
+            full_name='Jon Smith', gender='M', date_of_birth=date(1950, 3, 1), notes='From the census'
+        )
+        self.spouse = Person.objects.create(full_name='Mary Smith', gender='F')
+        self.parent = Person.objects.create(full_name='Old Smith', gender='M')
+        self.child = Person.objects.create(full_name='Young Smith', gender='F')
+
+    def relate(self, relationship_type, person1, person2, **fields):
+        return FamilyRelationship.objects.create(
+            relationship_type=relationship_type, person1=person1, person2=person2, **fields
+        )
+
+    def edges(self):
+        return set(FamilyRelationship.objects.values_list('relationship_type', 'person1', 'person2'))
+
+    def test_edges_are_repointed_to_the_kept_person(self):
+        as_parent = self.relate('parent_child', self.duplicate, self.child)
+        as_child = self.relate('parent_child', self.parent, self.duplicate)
+        cursor = ChangeLog.objects.latest('pk').pk
+
+        kept = dedupe.merge_persons(self.keep.pk, self.duplicate.pk)
+
+        self.assertFalse(Person.objects.filter(pk=self.duplicate.pk).exists())
+        self.assertEqual(self.edges(), {
+            ('parent_child', self.keep.pk, self.child.pk),
+            ('parent_child', self.parent.pk, self.keep.pk),
+        })
+        logged = set(ChangeLog.objects.filter(pk__gt=cursor, model='relationship', action='update')
+                     .values_list('object_id', flat=True))
+        self.assertEqual(logged, {as_parent.pk, as_child.pk})
+        # Blank fields are filled from the duplicate.
+        self.assertEqual((kept.date_of_birth, kept.notes), (date(1950, 3, 1), 'From the census'))
+
+    def test_spouse_edge_repeating_one_of_the_kept_person_is_deleted(self):
+        self.relate('spouse', self.keep, self.spouse)
+        repeated = self.relate('spouse', self.spouse, self.duplicate, marriage_date=date(1975, 6, 1))
+
+        dedupe.merge_persons(self.keep.pk, self.duplicate.pk)
+
+        self.assertEqual(self.edges(), {('spouse', self.keep.pk, self.spouse.pk)})
+        self.assertFalse(LifeEvent.objects.filter(relationship=repeated.pk).exists())
+
+    def test_marriage_events_follow_a_repointed_spouse_edge(self):
+        marriage = self.relate('spouse', self.duplicate, self.spouse, marriage_date=date(1975, 6, 1))
+
+        dedupe.merge_persons(self.keep.pk, self.duplicate.pk)
+
+        self.assertEqual(
+            list(LifeEvent.objects.filter(relationship=marriage).values_list('person', 'spouse')),
+            [(self.keep.pk, self.spouse.pk)],
+        )
+
+    def test_edge_between_the_merged_persons_is_deleted(self):
+        self.relate('spouse', self.keep, self.duplicate)
+        self.relate('parent_child', self.duplicate, self.child)
+
+        dedupe.merge_persons(self.keep.pk, self.duplicate.pk)
+
+        self.assertEqual(self.edges(), {('parent_child', self.keep.pk, self.child.pk)})
+
+    def test_persons_from_different_trees_are_not_merged(self):
+        other = FamilyTree.objects.create(name='Other')
+        stranger = Person.objects.create(full_name='John Smith', gender='M', tree=other)
+        with self.assertRaises(ValueError):
+            dedupe.merge_persons(self.keep.pk, stranger.pk)
+        self.assertTrue(Person.objects.filter(pk=stranger.pk).exists())
+
+    def test_merge_endpoint_rejects_a_list_body(self):
+        response = APIClient().post('/api/persons/merge/', [str(self.keep.pk)], format='json')
+        self.assertEqual(response.status_code, 400)
+        response = APIClient().post('/api/persons/find_duplicates/', [], format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(FAMILY_CHANGE_FEED_SETTLE_SECONDS=0)
+class TreeScopingTests(TestCase):
+    """Routes under ``/api/trees/<tree_id>/`` only see and write that tree."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.tree_a = FamilyTree.objects.create(name='A')
+        self.tree_b = FamilyTree.objects.create(name='B')
+        self.person_a = Person.objects.create(tree=self.tree_a, full_name='Anna A', gender='F')
+        self.person_b = Person.objects.create(tree=self.tree_b, full_name='Bert B', gender='M')
+        self.other_b = Person.objects.create(tree=self.tree_b, full_name='Beth B', gender='F')
+        self.relationship_b = FamilyRelationship.objects.create(
+            relationship_type='spouse', person1=self.person_b, person2=self.other_b
+        )
+
+    def url(self, tree, path):
+        return f'/api/trees/{tree.pk}/{path}'
+
+    def test_objects_of_another_tree_are_not_found(self):
+        self.assertEqual(self.client.get(self.url(self.tree_a, f'persons/{self.person_a.pk}/')).status_code, 200)
+        self.assertEqual(self.client.get(self.url(self.tree_a, f'persons/{self.person_b.pk}/')).status_code, 404)
+        self.assertEqual(
+            self.client.get(self.url(self.tree_a, f'relationships/{self.relationship_b.pk}/')).status_code, 404
+        )
+        self.assertEqual(
+            self.client.delete(self.url(self.tree_a, f'persons/{self.person_b.pk}/')).status_code, 404
+        )
+        self.assertTrue(Person.objects.filter(pk=self.person_b.pk).exists())
+
+    def test_lists_only_show_the_tree(self):
+        response = self.client.get(self.url(self.tree_a, 'persons/'))
+        self.assertEqual([person['id'] for person in response.json()['results']], [str(self.person_a.pk)])
+        response = self.client.get(self.url(self.tree_a, 'relationships/'))
+        self.assertEqual(response.json()['results'], [])
+
+    def test_unknown_tree_is_not_found(self):
+        response = self.client.get(f'/api/trees/{uuid.uuid4()}/persons/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_created_person_is_forced_into_the_route_tree(self):
+        response = self.client.post(
+            self.url(self.tree_a, 'persons/'),
+            {'full_name': 'New Person', 'gender': 'O', 'tree': str(self.tree_b.pk)},
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Person.objects.get(pk=response.json()['id']).tree_id, self.tree_a.pk)
+
+    def test_relationship_between_persons_of_another_tree_is_rejected(self):
+        response = self.client.post(
+            self.url(self.tree_a, 'relationships/'),
+            {'relationship_type': 'parent_child', 'person1': str(self.person_b.pk), 'person2': str(self.other_b.pk)},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(FamilyRelationship.objects.count(), 1)
+
+    def test_scoped_change_feed_excludes_other_trees(self):
+        cursor = self.client.get(self.url(self.tree_a, 'changes/')).json()['cursor']
+        unscoped_cursor = self.client.get('/api/changes/').json()['cursor']
+        Person.objects.create(tree=self.tree_b, full_name='Later B', gender='M')
+        later_a = Person.objects.create(tree=self.tree_a, full_name='Later A', gender='F')
+
+        response = self.client.get(self.url(self.tree_a, 'changes/'), {'since': cursor}).json()
+        self.assertEqual([person['id'] for person in response['persons']['upserted']], [str(later_a.pk)])
+        response = self.client.get('/api/changes/', {'since': unscoped_cursor}).json()
+        self.assertEqual(len(response['persons']['upserted']), 2)
+
+
+class LoadTestClientTests(SimpleTestCase):
+    """The load generator's HTTP client and request paths."""
+
+    def test_create_uses_the_configured_prefix(self):
+        tree_id = uuid.uuid4()
+        paths = []
+
+        async def send(label, method, path, body=None, form=False):
+            paths.append(path)
+            return 201, b'{"id": "child"}'
+
+        scenarios = loadtest.Scenarios([(uuid.uuid4(), 'Ann Smith', tree_id)], prefix='/v2/api/')
+        asyncio.run(scenarios.create(send))
+        self.assertEqual(paths, [
+            f'/v2/api/trees/{tree_id}/persons/',
+            f'/v2/api/trees/{tree_id}/relationships/create_parent_child_relationship/',
+        ])
+        scoped = loadtest.Scenarios([(uuid.uuid4(), 'Ann Smith', tree_id)], prefix='/v2/api', tree=tree_id)
+        self.assertEqual(scoped.prefix, f'/v2/api/trees/{tree_id}')
+
+    def test_reconnects_once_when_the_server_closed_a_kept_alive_connection(self):
+        connections = []
+
+        async def handle(reader, writer):
+            # Answer one request per connection, then close without saying so.
+            connections.append(writer)
+            await reader.readuntil(b'\r\n\r\n')
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok')
+            await writer.drain()
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            connection = loadtest.HTTPConnection('127.0.0.1', port)
+            try:
+                first = await connection.request('GET', '/')
+                # Let the server's close reach the client before reusing the connection.
+                await asyncio.sleep(0.05)
+                second = await connection.request('GET', '/')
+            finally:
+                await connection.close()
+                server.close()
+                await server.wait_closed()
+            return first, second
+
+        self.assertEqual(asyncio.run(run()), ((200, b'ok'), (200, b'ok')))
+        self.assertEqual(len(connections), 2)
+
+
+class UnionTests(TestCase):
+    """Unions follow relationship writes, and the tree and sibling views read them."""
+
+    def setUp(self):
+        self.persons = {
+            name: Person.objects.create(full_name=name, gender='O')
+            for name in ('Ann', 'Bob', 'Cal', 'Dee', 'Eve', 'Fay', 'Gus', 'Hal')
+        }
+
+    def relate(self, relationship_type, person1, person2):
+        return FamilyRelationship.objects.create(
+            relationship_type=relationship_type, person1=self.persons[person1], person2=self.persons[person2]
+        )
+
+    def unions(self):
+        names = {person.pk: name for name, person in self.persons.items()}
+        return {
+            (
+                frozenset((names[union.partner1_id], names[union.partner2_id])),
+                union.relationship_id,
+                frozenset(names[child.pk] for child in union.children.all()),
+            )
+            for union in Union.objects.prefetch_related('children')
+        }
+
+    def assertUnions(self, expected):
+        expected = {(frozenset(partners), relationship, frozenset(children))
+                    for partners, relationship, children in expected}
+        self.assertEqual(self.unions(), expected)
+        # Rebuilding from the relationships gives the same table.
+        call_command('rebuild_unions', stdout=io.StringIO())
+        self.assertEqual(self.unions(), expected)
+
+    def test_unions_follow_creates_edits_and_deletes(self):
+        marriage = self.relate('spouse', 'Ann', 'Bob')
+        self.relate('parent_child', 'Ann', 'Cal')
+        self.relate('parent_child', 'Bob', 'Cal')
+        self.relate('parent_child', 'Ann', 'Dee')
+        other_parent = self.relate('parent_child', 'Eve', 'Dee')
+        self.assertUnions([
+            ({'Ann', 'Bob'}, marriage.pk, {'Cal'}),
+            ({'Ann', 'Eve'}, None, {'Dee'}),
+        ])
+
+        # Another parent for Dee: the old couple goes, the new one takes the child.
+        other_parent.person1 = self.persons['Fay']
+        other_parent.save()
+        self.assertUnions([
+            ({'Ann', 'Bob'}, marriage.pk, {'Cal'}),
+            ({'Ann', 'Fay'}, None, {'Dee'}),
+        ])
+
+        # A different spouse: the relationship moves, the old couple keeps its child.
+        marriage.person2 = self.persons['Gus']
+        marriage.save()
+        self.assertUnions([
+            ({'Ann', 'Bob'}, None, {'Cal'}),
+            ({'Ann', 'Gus'}, marriage.pk, set()),
+            ({'Ann', 'Fay'}, None, {'Dee'}),
+        ])
+
+        # A spouse relationship turned into a parent-child one.
+        marriage.relationship_type = 'parent_child'
+        marriage.save()
+        self.assertUnions([
+            ({'Ann', 'Bob'}, None, {'Cal'}),
+            ({'Ann', 'Fay'}, None, {'Dee'}),
+        ])
+
+        # And back: Gus is no longer Ann's child.
+        marriage.relationship_type = 'spouse'
+        marriage.save()
+        self.assertUnions([
+            ({'Ann', 'Bob'}, None, {'Cal'}),
+            ({'Ann', 'Gus'}, marriage.pk, set()),
+            ({'Ann', 'Fay'}, None, {'Dee'}),
+        ])
+
+        FamilyRelationship.objects.filter(
+            person1=self.persons['Bob'], person2=self.persons['Cal']
+        ).get().delete()
+        marriage.delete()
+        self.assertUnions([({'Ann', 'Fay'}, None, {'Dee'})])
+
+    def test_self_spouse_relationship_has_no_union(self):
+        self.relate('spouse', 'Ann', 'Ann')
+        self.assertUnions([])
+
+    def test_family_tree_lists_the_children_of_each_marriage(self):
+        self.relate('spouse', 'Ann', 'Bob')
+        self.relate('spouse', 'Ann', 'Eve')
+        for parent, child in [('Ann', 'Cal'), ('Bob', 'Cal'), ('Ann', 'Dee'), ('Eve', 'Dee'), ('Ann', 'Fay')]:
+            self.relate('parent_child', parent, child)
+
+        tree = APIClient().get(f"/api/persons/{self.persons['Ann'].pk}/family_tree/").json()
+        self.assertEqual(sorted(child['full_name'] for child in tree['children']), ['Cal', 'Dee', 'Fay'])
+        self.assertEqual(
+            {spouse['full_name']: [child['full_name'] for child in spouse['children']] for spouse in tree['spouses']},
+            {'Bob': ['Cal'], 'Eve': ['Dee']},
+        )
+
+    def test_full_and_half_siblings(self):
+        for parent, child in [
+            ('Ann', 'Cal'), ('Bob', 'Cal'), ('Ann', 'Dee'), ('Bob', 'Dee'),
+            ('Ann', 'Eve'), ('Gus', 'Eve'), ('Ann', 'Fay'), ('Ann', 'Hal'),
+        ]:
+            self.relate('parent_child', parent, child)
+
+        def names(ids):
+            return sorted(Person.objects.filter(pk__in=ids).values_list('full_name', flat=True))
+
+        full, half = graph.siblings(self.persons['Cal'].pk)
+        self.assertEqual((names(full), names(half)), (['Dee'], ['Eve', 'Fay', 'Hal']))
+        groups, _, _ = graph.neighborhood(self.persons['Cal'].pk, 2, 100)
+        self.assertEqual(
+            (names(groups['siblings']), names(groups['half_siblings'])), (['Dee'], ['Eve', 'Fay', 'Hal'])
+        )
+
+        # Fay and Hal both have Ann as their only recorded parent.
+        full, half = graph.siblings(self.persons['Fay'].pk)
+        self.assertEqual((names(full), names(half)), (['Hal'], ['Cal', 'Dee', 'Eve']))
+        self.assertEqual(graph.siblings(self.persons['Ann'].pk), ([], []))
+
+
+def png_bytes():
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), 'red').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class InterruptedStream:
+    """Request body whose client disconnects after ``data``."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, size):
+        if not self.data:
+            raise UnreadablePostError('client went away')
+        data, self.data = self.data[:size], self.data[size:]
+        return data
+
+
+class PhotoUploadTests(TestCase):
+    """Offsets, claims, resuming and cleanup of chunked photo uploads."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        overrides = override_settings(
+            FAMILY_PHOTO_UPLOAD_DIR=Path(directory) / 'uploads', MEDIA_ROOT=Path(directory) / 'media'
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.client = APIClient()
+        self.person = Person.objects.create(full_name='Pat Photo', gender='O')
+        self.image = png_bytes()
+        response = self.client.post('/api/photo_uploads/', {
+            'person': str(self.person.pk), 'filename': 'pat.png', 'size': len(self.image),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.upload = PhotoUpload.objects.get(pk=response.json()['id'])
+
+    def put_chunk(self, data, offset):
+        return self.client.put(
+            f'/api/photo_uploads/{self.upload.pk}/chunk/', data,
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_chunks_in_order_attach_the_photo(self):
+        half = len(self.image) // 2
+        self.assertEqual(self.put_chunk(self.image[:half], 0).json()['received'], half)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.put_chunk(self.image[half:], half)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.json()['completed_at'])
+
+        self.person.refresh_from_db()
+        with self.person.profile_photo.open('rb') as photo:
+            self.assertEqual(photo.read(), self.image)
+        # The part file was moved into storage, not copied.
+        self.assertFalse(uploads.part_path(self.upload.pk).exists())
+        self.assertTrue(Job.objects.filter(task='process_profile_photo').exists())
+
+    def test_out_of_order_or_repeated_offset_is_a_conflict(self):
+        response = self.put_chunk(self.image[10:20], 10)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['received'], 0)
+
+        self.assertEqual(self.put_chunk(self.image[:10], 0).status_code, 200)
+        response = self.put_chunk(self.image[:10], 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['received'], 10)
+
+    def test_chunk_past_the_declared_size_is_rejected(self):
+        response = self.put_chunk(self.image + b'extra', 0)
+        self.assertEqual(response.status_code, 400)
+
+    def test_chunk_is_rejected_while_another_is_being_written(self):
+        uploads.claim(self.upload, 0)
+        response = self.put_chunk(self.image[:10], 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('Another chunk is being written', response.json()['error'])
+
+        # A claim left behind by a request that died is taken over after the timeout.
+        PhotoUpload.objects.filter(pk=self.upload.pk).update(
+            writing_since=timezone.now() - uploads.CLAIM_TIMEOUT - timedelta(seconds=1)
+        )
+        self.assertEqual(self.put_chunk(self.image[:10], 0).status_code, 200)
+
+    def test_resume_after_a_partial_chunk(self):
+        upload = uploads.write_chunk(self.upload, 0, InterruptedStream(self.image[:25]), len(self.image))
+        self.assertEqual((upload.received, upload.writing_since, upload.completed_at), (25, None, None))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.put_chunk(self.image[25:], 25)
+        self.assertEqual(response.status_code, 200)
+        self.person.refresh_from_db()
+        with self.person.profile_photo.open('rb') as photo:
+            self.assertEqual(photo.read(), self.image)
+
+    def test_failed_write_releases_the_claim(self):
+        class BrokenStream:
+            def read(self, size):
+                raise OSError('disk on fire')
+
+        with self.assertRaises(OSError):
+            uploads.write_chunk(self.upload, 0, BrokenStream(), 10)
+        self.upload.refresh_from_db()
+        self.assertIsNone(self.upload.writing_since)
+        self.assertEqual(self.put_chunk(self.image[:10], 0).status_code, 200)
+
+    def test_delete_removes_the_part_file(self):
+        self.put_chunk(self.image[:10], 0)
+        path = uploads.part_path(self.upload.pk)
+        self.assertTrue(path.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/photo_uploads/{self.upload.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(path.exists())
+
+    def test_invalid_image_is_rejected_and_cleaned_up(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.put_chunk(b'x' * len(self.image), 0)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PhotoUpload.objects.filter(pk=self.upload.pk).exists())
+        self.assertFalse(uploads.part_path(self.upload.pk).exists())
+
+
+@override_settings(FAMILY_SNAPSHOT_MIN_HITS=1)
+class TreeSnapshotTests(TestCase):
+    """Snapshots are kept per host and queued for a rebuild by writes to their persons."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.root, self.leaves = make_family(children=2, grandchildren=1)
+        self.child = Person.objects.get(full_name='Child 0')
+
+    def build_snapshot(self, host='testserver'):
+        url = f'http://{host}/'
+        snapshots.flush_hits({(self.root.tree_id, self.root.pk, 2, url): 1})
+        snapshot = TreeSnapshot.objects.get(root=self.root, generations=2, base_url=url)
+        self.assertEqual(snapshot.status, 'queued')
+        self.assertTrue(snapshots.build(snapshot.pk)['built'])
+        snapshot.refresh_from_db()
+        return snapshot
+
+    def assertQueued(self, snapshot):
+        snapshot.refresh_from_db()
+        self.assertEqual(snapshot.status, 'queued')
+
+    def test_each_host_gets_its_own_snapshot(self):
+        Person.objects.filter(pk=self.root.pk).update(profile_photo='profile_photos/root.jpg')
+        first = self.build_snapshot('localhost')
+        second = self.build_snapshot('127.0.0.1')
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertEqual(first.status, 'ready')
+
+        snapshots.flush_hits({(self.root.tree_id, self.root.pk, 2, 'http://localhost/'): 2})
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.hits, second.hits), (3, 1))
+
+        url = f'/api/persons/{self.root.pk}/family_tree/?generations=2'
+        response = self.client.get(url, HTTP_HOST='127.0.0.1', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(bytes(response.content), bytes(second.content))
+        # A host without a snapshot of its own is computed, not served another host's URLs.
+        response = self.client.get(url, HTTP_HOST='testserver')
+        self.assertEqual(response.json()['profile_photo'], 'http://testserver/media/profile_photos/root.jpg')
+
+    def test_person_edit_queues_a_rebuild(self):
+        snapshot = self.build_snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.child.full_name = 'Renamed Child'
+            self.child.save()
+        self.assertQueued(snapshot)
+        self.assertTrue(Job.objects.filter(task='build_tree_snapshot').exists())
+
+    def test_person_delete_queues_a_rebuild(self):
+        snapshot = self.build_snapshot()
+        self.leaves[0].delete()
+        self.assertQueued(snapshot)
+        snapshots.build(snapshot.pk)
+        self.assertNotIn(self.leaves[0].pk, set(snapshot.persons.values_list('pk', flat=True)))
+
+    def test_relationship_edit_queues_a_rebuild(self):
+        snapshot = self.build_snapshot()
+        marriage = FamilyRelationship.objects.get(relationship_type='spouse', person1=self.root)
+        marriage.marriage_date = date(1980, 6, 1)
+        marriage.save()
+        self.assertQueued(snapshot)
+
+    def test_moving_a_relationship_out_of_the_tree_queues_a_rebuild(self):
+        snapshot = self.build_snapshot()
+        parent = Person.objects.create(full_name='Other Parent', gender='O')
+        child = Person.objects.create(full_name='Other Child', gender='O')
+        edge = FamilyRelationship.objects.get(relationship_type='parent_child', person2=self.leaves[0])
+        # Neither new person is in the snapshot; the previous ones are.
+        edge.person1, edge.person2 = parent, child
+        edge.save()
+        self.assertQueued(snapshot)
+
+    def test_relationship_delete_queues_a_rebuild(self):
+        snapshot = self.build_snapshot()
+        FamilyRelationship.objects.get(relationship_type='parent_child', person2=self.leaves[1]).delete()
+        self.assertQueued(snapshot)
+
+
+@override_settings(FAMILY_REPLICA_DATABASE='replica')
+class ReplicaRoutingTests(TestCase):
+    """Which alias reads go to, inside and outside replica requests."""
+
+    def setUp(self):
+        # Stands in for a replica configured with 'TEST': {'MIRROR': 'default'}, but shares the
+        # test case's transaction so the replica sees the rows created here.
+        connections['replica'] = connections['default']
+        self.addCleanup(connections.__delitem__, 'replica')
+
+        self.reads = []
+        route = replicas.ReplicaRouter.db_for_read
+
+        def db_for_read(router, model, **hints):
+            alias = route(router, model, **hints)
+            self.reads.append((model._meta.label, alias or 'default'))
+            return alias
+
+        patcher = mock.patch.object(replicas.ReplicaRouter, 'db_for_read', db_for_read)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.client = APIClient()
+        self.root, _ = make_family(children=1, grandchildren=1)
+        self.url = f'/api/persons/{self.root.pk}/family_tree/'
+
+    def aliases(self, label):
+        return {alias for read_label, alias in self.reads if read_label == label}
+
+    def test_router(self):
+        router = replicas.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Person))
+        with replicas.use_replica():
+            self.assertEqual(router.db_for_read(Person), 'replica')
+            self.assertEqual(router.db_for_read(TreeSnapshot), 'default')
+            self.assertEqual(router.db_for_read(TreeSnapshot.persons.through), 'default')
+            self.assertEqual(router.db_for_write(Person), 'default')
+
+    def test_get_reads_from_the_replica(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.aliases('family.Person'), {'replica'})
+        self.assertEqual(self.aliases('family.TreeSnapshot'), {'default'})
+
+    def test_write_pins_the_client_to_the_primary(self):
+        response = self.client.patch(
+            f'/api/persons/{self.root.pk}/', {'notes': 'Edited'}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(settings.FAMILY_REPLICA_PIN_COOKIE, response.cookies)
+        pinned_until = response.headers[replicas.PIN_HEADER]
+
+        # The test client sends the cookie back.
+        self.reads.clear()
+        self.client.get(self.url)
+        self.assertEqual(self.aliases('family.Person'), {'default'})
+
+        # A cross-origin client echoes the header instead.
+        self.reads.clear()
+        APIClient().get(self.url, HTTP_X_PRIMARY_UNTIL=pinned_until)
+        self.assertEqual(self.aliases('family.Person'), {'default'})
+
+    def test_expired_pin_reads_from_the_replica(self):
+        APIClient().get(self.url, HTTP_X_PRIMARY_UNTIL=str(time.time() - 1))
+        self.assertEqual(self.aliases('family.Person'), {'replica'})
+
+    def test_snapshot_hits_are_flushed_against_the_primary(self):
+        with replicas.use_replica():
+            snapshots.flush_hits({(self.root.tree_id, self.root.pk, 1, 'http://testserver/'): 1})
+        self.assertEqual(self.aliases('family.TreeSnapshot'), {'default'})
+        self.assertEqual(TreeSnapshot.objects.get(root=self.root).hits, 1)
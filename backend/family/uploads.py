@@ -0,0 +1,161 @@
+"""Resumable profile photo uploads received in chunks.
+
+A client creates a ``PhotoUpload`` with the file's name and size, then sends
+the file in any number of chunks, each with the offset it starts at. Chunks
+are streamed from the request straight into a temporary part file, so
+neither the whole file nor a whole chunk is held in memory, and a short
+request per chunk keeps a slow upload from holding a worker throughout. If a
+request fails, the client asks for ``received`` and carries on from there.
+When the last byte arrives the part file is moved into storage and attached
+to the person in one transaction.
+"""
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.http import UnreadablePostError
+from django.utils import timezone
+
+from . import tasks
+from .models import PhotoUpload
+
+READ_SIZE = 64 * 1024
+
+# A chunk claim older than this belongs to a request that died; it may be taken over.
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+class UploadError(Exception):
+    """A chunk that cannot be accepted; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class ReceivedFile(File):
+    """A finished part file.
+
+    Storages that check for ``temporary_file_path`` (like the default
+    ``FileSystemStorage``) move it into place instead of copying it.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def part_path(upload_id):
+    """Location of the temporary file an upload's chunks are written to."""
+    return Path(settings.FAMILY_PHOTO_UPLOAD_DIR) / f'{upload_id}.part'
+
+
+def start(upload):
+    """Create the empty part file for a new upload."""
+    path = part_path(upload.pk)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+
+
+def write_chunk(upload, offset, stream, length):
+    """Write ``length`` bytes from ``stream`` into the upload at ``offset``.
+
+    ``offset`` must equal the bytes received so far. The request first
+    claims the upload, so a retry at the same offset cannot overwrite a
+    chunk that is still streaming. If the client disconnects part way, what
+    did arrive is kept, so the next chunk resumes from there. Attaches the
+    photo once the upload is complete. Returns the refreshed upload.
+    """
+    if upload.completed_at is not None:
+        raise UploadError('Upload is already complete', status=409)
+    if offset != upload.received:
+        raise UploadError(f'Upload-Offset must be {upload.received}', status=409)
+    if length <= 0:
+        raise UploadError('Chunk is empty')
+    if offset + length > upload.size:
+        raise UploadError(f'Chunk runs past the declared size of {upload.size} bytes')
+
+    claimed_at = claim(upload, offset)
+    written = 0
+    try:
+        with open(part_path(upload.pk), 'r+b') as part:
+            part.seek(offset)
+            # Drop any bytes left behind by an earlier chunk that was not recorded.
+            part.truncate()
+            try:
+                while written < length:
+                    data = stream.read(min(READ_SIZE, length - written))
+                    if not data:
+                        break
+                    part.write(data)
+                    written += len(data)
+            except UnreadablePostError:
+                # The client went away; keep what was written.
+                pass
+        # Closing flushed the file, so ``written`` bytes are on disk.
+    except FileNotFoundError:
+        release(upload, claimed_at)
+        raise UploadError('Upload has expired; start a new one', status=410)
+    except BaseException:
+        release(upload, claimed_at)
+        raise
+
+    if not PhotoUpload.objects.filter(pk=upload.pk, received=offset, writing_since=claimed_at).update(
+        received=offset + written, writing_since=None, updated_at=timezone.now()
+    ):
+        # Only possible if the claim timed out and another request took it over.
+        raise UploadError('Another chunk was written at the same offset', status=409)
+
+    upload.refresh_from_db()
+    if upload.received == upload.size:
+        attach(upload)
+    return upload
+
+
+def claim(upload, offset):
+    """Mark the upload as being written at ``offset``; returns the claim's timestamp."""
+    now = timezone.now()
+    if not PhotoUpload.objects.filter(
+        Q(writing_since__isnull=True) | Q(writing_since__lt=now - CLAIM_TIMEOUT),
+        pk=upload.pk, received=offset, completed_at__isnull=True,
+    ).update(writing_since=now):
+        upload.refresh_from_db()
+        if upload.received != offset:
+            raise UploadError(f'Upload-Offset must be {upload.received}', status=409)
+        raise UploadError('Another chunk is being written to this upload', status=409)
+    return now
+
+
+def release(upload, claimed_at):
+    """Give up a claim without recording any bytes."""
+    PhotoUpload.objects.filter(pk=upload.pk, writing_since=claimed_at).update(writing_since=None)
+
+
+def attach(upload):
+    """Check the received file is an image and make it the person's profile photo."""
+    from PIL import Image
+
+    path = part_path(upload.pk)
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception:
+        upload.delete()
+        raise UploadError('Upload is not a valid image')
+
+    person = upload.person
+    old_name = person.profile_photo.name
+    with transaction.atomic():
+        with open(path, 'rb') as part:
+            person.profile_photo.save(os.path.basename(upload.filename), ReceivedFile(part), save=False)
+        person.save(update_fields=['profile_photo', 'updated_at'])
+        upload.completed_at = timezone.now()
+        upload.save(update_fields=['completed_at', 'updated_at'])
+        transaction.on_commit(
+            lambda: tasks.enqueue('process_profile_photo', {'person_id': str(person.pk)})
+        )
+    if old_name:
+        transaction.on_commit(lambda: person.profile_photo.storage.delete(old_name))
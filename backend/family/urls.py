@@ -1,11 +1,28 @@
 from django.urls import path, include
-from rest_framework.routers import DefaultRouter
-from .views import PersonViewSet, FamilyRelationshipViewSet
+from rest_framework.routers import DefaultRouter, SimpleRouter
+from .views import (
+    FamilyTreeViewSet, PersonViewSet, FamilyRelationshipViewSet, LifeEventViewSet,
+    ChangeFeedViewSet, JobViewSet, PhotoUploadViewSet
+)
 
 router = DefaultRouter()
+router.register(r'trees', FamilyTreeViewSet)
 router.register(r'persons', PersonViewSet)
 router.register(r'relationships', FamilyRelationshipViewSet)
+router.register(r'events', LifeEventViewSet)
+router.register(r'changes', ChangeFeedViewSet, basename='change')
+router.register(r'jobs', JobViewSet)
+router.register(r'photo_uploads', PhotoUploadViewSet)
+
+# The same endpoints restricted to a single family tree.
+tree_router = SimpleRouter()
+tree_router.register(r'persons', PersonViewSet, basename='tree-person')
+tree_router.register(r'relationships', FamilyRelationshipViewSet, basename='tree-relationship')
+tree_router.register(r'events', LifeEventViewSet, basename='tree-event')
+tree_router.register(r'changes', ChangeFeedViewSet, basename='tree-change')
+tree_router.register(r'photo_uploads', PhotoUploadViewSet, basename='tree-photo-upload')
 
 urlpatterns = [
     path('api/', include(router.urls)),
+    path('api/trees/<uuid:tree_id>/', include(tree_router.urls)),
 ]
\ No newline at end of file
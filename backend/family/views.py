@@ -1,22 +1,141 @@
+import uuid
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.http import HttpResponse
 from django.shortcuts import render
-from rest_framework import viewsets, status
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+from rest_framework.settings import api_settings
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
-from .models import Person, FamilyRelationship
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_date
+from . import graph, replicas, tasks, uploads
+from .graph import RelationshipIndex
+from .models import Person, FamilyRelationship, FamilyTree, ChangeLog, Job, LifeEvent, PhotoUpload
+from .renderers import CompactJSONRenderer, FastJSONRenderer
 from .serializers import (
     PersonSerializer, PersonListSerializer, PersonDetailSerializer,
-    FamilyRelationshipSerializer, FamilyTreeSerializer
+    FamilyRelationshipSerializer, FamilyTreeSerializer, JobSerializer, LifeEventSerializer,
+    PhotoUploadSerializer, TreeSerializer, person_unions
 )
 
 
-class PersonViewSet(viewsets.ModelViewSet):
+MAX_TREE_GENERATIONS = 5
+MAX_LAYOUT_GENERATIONS = 10
+MAX_LINEAGE_GENERATIONS = 25
+MAX_BATCH_SIZE = 100
+MAX_NEIGHBORHOOD_RADIUS = 8
+MAX_NEIGHBORHOOD_SIZE = 2000
+
+
+def parse_person_ids(values):
+    """Parse person ids from a list or comma-separated string, keeping order and dropping repeats.
+
+    Returns ``None`` if any id is not a valid UUID.
+    """
+    if isinstance(values, str):
+        values = values.split(',')
+    try:
+        return list(dict.fromkeys(uuid.UUID(str(value).strip()) for value in values if str(value).strip()))
+    except ValueError:
+        return None
+
+
+def parse_generations(request, default, maximum):
+    """Read the ``generations`` query parameter; returns ``None`` unless it is within 1..maximum."""
+    try:
+        generations = int(request.query_params.get('generations', default))
+    except ValueError:
+        return None
+    return generations if 1 <= generations <= maximum else None
+
+
+def parse_date_param(request, name):
+    """Read an optional ``YYYY-MM-DD`` query parameter, raising a validation error if malformed."""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({'error': f'{name} must be a date in YYYY-MM-DD format'})
+    return parsed
+
+
+class TreeScopedMixin:
+    """Scope a viewset to one family tree when routed under ``/api/trees/<tree_id>/``.
+
+    On the unscoped ``/api/`` routes ``tree`` is ``None`` and every tree is visible.
+    """
+
+    tree_lookup = 'tree'
+
+    def dispatch(self, request, *args, **kwargs):
+        # Taken out of the URL kwargs so that actions don't receive it.
+        self.tree_id = kwargs.pop('tree_id', None)
+        self.tree = None
+        return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.tree_id is not None:
+            self.tree = get_object_or_404(FamilyTree, pk=self.tree_id)
+
+    def scope(self, queryset, lookup=None):
+        """Restrict ``queryset`` to the current tree, if any."""
+        if self.tree is None:
+            return queryset
+        return queryset.filter(**{lookup or self.tree_lookup: self.tree})
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['tree'] = self.tree
+        return context
+
+
+class ReadReplicaMixin:
+    """Run read-only actions declared with ``read_replica=True`` against the read replica.
+
+    Clients pinned to the primary after a write keep reading from ``default``.
+    """
+
+    read_replica = False
+
+    def dispatch(self, request, *args, **kwargs):
+        if (
+            not self.read_replica
+            or request.method not in ('GET', 'HEAD')
+            or replicas.pinned_to_primary(request)
+        ):
+            return super().dispatch(request, *args, **kwargs)
+        with replicas.use_replica():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class FamilyTreeViewSet(viewsets.ModelViewSet):
+    """ViewSet for FamilyTree model; deleting a tree deletes everything in it."""
+
+    queryset = FamilyTree.objects.all()
+    serializer_class = TreeSerializer
+
+
+class PersonViewSet(ReadReplicaMixin, TreeScopedMixin, viewsets.ModelViewSet):
     """ViewSet for Person model with CRUD operations."""
 
     queryset = Person.objects.all()
     parser_classes = (MultiPartParser, FormParser)
+    # Set per action for the expensive tree queries; see DEFAULT_THROTTLE_RATES.
+    throttle_scope = None
 
     def get_serializer_class(self):
         """Return appropriate serializer class based on action."""
@@ -30,7 +149,7 @@ class PersonViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """Filter queryset based on query parameters."""
-        queryset = Person.objects.all()
+        queryset = self.scope(Person.objects.all())
 
         # Filter by name
         name = self.request.query_params.get('name', None)
@@ -44,90 +163,452 @@ class PersonViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    def perform_create(self, serializer):
+        # Persons created on the unscoped routes go to the default tree.
+        person = serializer.save(tree=self.tree)
+        self._enqueue_photo_processing(person)
+
+    def perform_update(self, serializer):
+        person = serializer.save()
+        self._enqueue_photo_processing(person)
+
+    def _enqueue_photo_processing(self, person):
+        """Process a newly uploaded profile photo in the background."""
+        if 'profile_photo' in self.request.FILES:
+            transaction.on_commit(
+                lambda: tasks.enqueue('process_profile_photo', {'person_id': str(person.pk)})
+            )
+
+    def list(self, request, *args, **kwargs):
+        """List persons straight from ``.values()`` rows."""
+        return self._list_rows(self.filter_queryset(self.get_queryset()))
+
+    def _list_rows(self, queryset):
+        """Paginate and serialize a person queryset as ``PersonListSerializer`` rows."""
+        request = self.request
+        queryset = queryset.values(*PersonListSerializer.Meta.fields)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(PersonListSerializer.from_rows(page, request))
+
+        return Response(PersonListSerializer.from_rows(queryset, request))
+
     def retrieve(self, request, *args, **kwargs):
         person = self.get_object()
         serializer = self.get_serializer(person)
         return Response(serializer.data)
 
-    @action(detail=True, methods=['get'])
+    @action(detail=False, methods=['get', 'post'], parser_classes=[JSONParser])
+    def batch(self, request):
+        """Get detail payloads for many persons at once.
+
+        Takes ``?ids=a,b,c`` or a JSON body ``{"ids": [...]}``. Relationships
+        for the whole batch are loaded together, so the number of queries does
+        not grow with the batch size.
+        """
+        if request.method == 'POST':
+            raw_ids = request.data.get('ids', []) if isinstance(request.data, dict) else None
+        else:
+            raw_ids = request.query_params.get('ids', '')
+
+        person_ids = parse_person_ids(raw_ids) if isinstance(raw_ids, (list, str)) else None
+        if not person_ids:
+            return Response(
+                {'error': 'ids must be a non-empty list of person ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(person_ids) > MAX_BATCH_SIZE:
+            return Response(
+                {'error': f'At most {MAX_BATCH_SIZE} ids can be requested at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        persons = self.scope(Person.objects.all()).in_bulk(person_ids)
+        found_ids = [person_id for person_id in person_ids if person_id in persons]
+        serializer = PersonDetailSerializer(
+            [persons[person_id] for person_id in found_ids],
+            many=True,
+            context={
+                **self.get_serializer_context(),
+                'relationship_index': RelationshipIndex(found_ids),
+            },
+        )
+
+        return Response({
+            'results': serializer.data,
+            'missing': [person_id for person_id in person_ids if person_id not in persons],
+        })
+
+    @action(detail=False, methods=['patch'], parser_classes=[JSONParser], throttle_scope='bulk_write')
+    def bulk_update(self, request):
+        """Apply partial updates to many persons in one transaction.
+
+        Takes a JSON list ``[{"id": ..., "full_name": ...}, ...]``. Nothing is
+        written unless every item is valid. Only changed columns are written
+        and persons whose values did not change are not saved at all.
+        """
+        items = request.data
+        if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+            return Response(
+                {'error': 'Body must be a non-empty list of objects with an id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > MAX_BATCH_SIZE:
+            return Response(
+                {'error': f'At most {MAX_BATCH_SIZE} persons can be updated at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        person_ids = parse_person_ids([item.get('id', '') for item in items])
+        if person_ids is None or len(person_ids) != len(items):
+            return Response(
+                {'error': 'Every item needs a different, valid person id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        persons = self.scope(Person.objects.all()).in_bulk(person_ids)
+        missing = [person_id for person_id in person_ids if person_id not in persons]
+        if missing:
+            return Response(
+                {'error': 'One or more persons not found', 'missing': missing},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        context = self.get_serializer_context()
+        updates = [
+            PersonSerializer(
+                persons[person_id],
+                data={key: value for key, value in item.items() if key != 'id'},
+                partial=True,
+                context=context,
+            )
+            for person_id, item in zip(person_ids, items)
+        ]
+        if not all([serializer.is_valid() for serializer in updates]):
+            return Response(
+                {'errors': [serializer.errors for serializer in updates]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        with transaction.atomic():
+            for serializer in updates:
+                serializer.save()
+
+        return Response({
+            'updated': [serializer.instance.pk for serializer in updates if serializer.changed_fields],
+            'unchanged': [serializer.instance.pk for serializer in updates if not serializer.changed_fields],
+        })
+
+    @action(
+        detail=True,
+        methods=['get'],
+        renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, CompactJSONRenderer],
+        throttle_scope='tree',
+        read_replica=True,
+    )
     def family_tree(self, request, pk=None):
-        """Get family tree data for a specific person."""
+        """Get family tree data for a specific person.
+
+        ``?generations=N`` expands children down to N generations. Clients that
+        accept ``application/vnd.familytree.compact+json`` (or pass
+        ``?format=compact``) get each person once with index-based edges.
+        JSON responses for frequently viewed roots come from ``family.snapshots``.
+        """
         person = self.get_object()
-        serializer = self.get_serializer(person)
-        return Response(serializer.data)
+
+        generations = parse_generations(request, 1, MAX_TREE_GENERATIONS)
+        if generations is None:
+            return Response(
+                {'error': f'generations must be between 1 and {MAX_TREE_GENERATIONS}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if request.accepted_renderer.format == CompactJSONRenderer.format:
+            data = FamilyTreeSerializer.build_compact(person, request=request, generations=generations)
+        else:
+            # Popular roots are served from a stored snapshot when one is up to date. Snapshots
+            # hold the plain rendering, so media type parameters such as indent skip them.
+            if request.accepted_renderer.format == FastJSONRenderer.format and ';' not in request.accepted_media_type:
+                # Imported here, like the other modules only some endpoints need.
+                from . import snapshots
+
+                snapshots.record_hit(person, generations, request)
+                content = snapshots.get_snapshot(person.pk, generations, request)
+                if content is not None:
+                    return snapshots.snapshot_response(content, request)
+            data = FamilyTreeSerializer.build(person, request=request, generations=generations)
+
+        response = Response(data)
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+    @action(detail=True, methods=['get'], throttle_scope='tree', read_replica=True)
+    def layout(self, request, pk=None):
+        """Get precomputed x/y node positions for a person's descendant tree.
+
+        Layouts are cached per process until the next write to persons or
+        relationships.
+        """
+        person = self.get_object()
+
+        generations = parse_generations(request, 3, MAX_LAYOUT_GENERATIONS)
+        if generations is None:
+            return Response(
+                {'error': f'generations must be between 1 and {MAX_LAYOUT_GENERATIONS}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Imported here: only this endpoint needs the layout code and its cache.
+        from .layout import get_layout
+
+        content = get_layout(person.pk, generations, person.tree_id)
+        return HttpResponse(content, content_type='application/json')
 
     @action(detail=True, methods=['get'])
+    def unions(self, request, pk=None):
+        """Get a person's couples with marriage dates and the children of each couple."""
+        person = self.get_object()
+        return Response(person_unions(person.pk, request=request))
+
+    @action(detail=True, methods=['get'])
+    def siblings(self, request, pk=None):
+        """Get a person's full siblings (same parents) and half siblings (some parents in common)."""
+        person = self.get_object()
+        full_ids, half_ids = graph.siblings(person.pk)
+        return Response({
+            'full': self._serialize_person_ids(full_ids),
+            'half': self._serialize_person_ids(half_ids),
+        })
+
+    @action(detail=True, methods=['get'], throttle_scope='tree', read_replica=True)
+    def neighborhood(self, request, pk=None):
+        """Get everyone within ``radius`` relationship steps of a person, grouped by relation.
+
+        Each spouse or parent-child link is one step: siblings and parents-in-law
+        are two steps away, first cousins four. ``limit`` caps the number of
+        relatives returned.
+        """
+        person = self.get_object()
+
+        try:
+            radius = int(request.query_params.get('radius', 2))
+            limit = int(request.query_params.get('limit', 500))
+        except ValueError:
+            radius = limit = 0
+        if not 1 <= radius <= MAX_NEIGHBORHOOD_RADIUS:
+            return Response(
+                {'error': f'radius must be between 1 and {MAX_NEIGHBORHOOD_RADIUS}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 1 <= limit <= MAX_NEIGHBORHOOD_SIZE:
+            return Response(
+                {'error': f'limit must be between 1 and {MAX_NEIGHBORHOOD_SIZE}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        groups, distances, truncated = graph.neighborhood(person.pk, radius, limit)
+        rows = {row['id']: row for row in self._serialize_person_ids(distances)}
+        relatives = {}
+        for group, relative_ids in groups.items():
+            relatives[group] = [rows[relative_id] for relative_id in relative_ids if relative_id in rows]
+            for row in relatives[group]:
+                row['distance'] = distances[row['id']]
+
+        return Response({
+            'person': person.pk,
+            'radius': radius,
+            'truncated': truncated,
+            'relatives': relatives,
+        })
+
+    @action(detail=True, methods=['get'], throttle_scope='tree', read_replica=True)
     def descendants(self, request, pk=None):
         """Get all descendants of a person (patrilineal by default)."""
         person = self.get_object()
 
         # Get all descendants recursively
-        descendants = self._get_descendants(person)
+        descendant_ids = self._get_descendants(person.pk)
 
         # Serialize the descendants
-        serializer = PersonListSerializer(descendants, many=True)
-        return Response(serializer.data)
+        return Response(self._serialize_person_ids(descendant_ids))
 
-    @action(detail=True, methods=['get'])
+    @action(detail=True, methods=['get'], throttle_scope='tree', read_replica=True)
     def ancestors(self, request, pk=None):
         """Get all ancestors of a person."""
         person = self.get_object()
 
         # Get all ancestors recursively
-        ancestors = self._get_ancestors(person)
+        ancestor_ids = self._get_ancestors(person.pk)
 
         # Serialize the ancestors
-        serializer = PersonListSerializer(ancestors, many=True)
-        return Response(serializer.data)
+        return Response(self._serialize_person_ids(ancestor_ids))
 
-    def _get_descendants(self, person, max_generations=5, current_generation=0):
-        """Recursively get all descendants of a person."""
-        if current_generation >= max_generations:
-            return []
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser])
+    def find_duplicates(self, request):
+        """Start a background search for duplicate persons; poll the returned job for pairs."""
+        if not isinstance(request.data, dict):
+            return Response(
+                {'error': 'Body must be a JSON object'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            threshold = float(request.data.get('threshold', 0.8))
+            year_window = int(request.data.get('year_window', 2))
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'threshold must be a number and year_window an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        descendants = []
-        children_relationships = FamilyRelationship.objects.filter(
-            relationship_type='parent_child',
-            person1=person
-        )
+        payload = {'threshold': threshold, 'year_window': year_window}
+        if self.tree is not None:
+            payload['tree_id'] = str(self.tree.pk)
+        job = tasks.enqueue('find_duplicates', payload)
+        return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser])
+    def merge(self, request):
+        """Merge the ``duplicate`` person into ``keep``, re-pointing its relationships."""
+        if not isinstance(request.data, dict):
+            return Response(
+                {'error': 'Body must be a JSON object'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        person_ids = parse_person_ids([request.data.get('keep', ''), request.data.get('duplicate', '')])
+        if person_ids is None or len(person_ids) != 2:
+            return Response(
+                {'error': 'keep and duplicate must be two different person ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if self.scope(Person.objects.filter(pk__in=person_ids)).count() != 2:
+            return Response(
+                {'error': 'One or both persons not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
 
-        for rel in children_relationships:
-            child = rel.person2
-            descendants.append(child)
+        # Imported here: only merges need the duplicate matching code.
+        from . import dedupe
 
-            # Recursively get descendants of this child
-            child_descendants = self._get_descendants(
-                child, max_generations, current_generation + 1
+        try:
+            person = dedupe.merge_persons(*person_ids)
+        except Person.DoesNotExist:
+            return Response(
+                {'error': 'One or both persons not found'},
+                status=status.HTTP_404_NOT_FOUND
             )
-            descendants.extend(child_descendants)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        return descendants
+        serializer = PersonSerializer(person, context=self.get_serializer_context())
+        return Response(serializer.data)
 
-    def _get_ancestors(self, person, max_generations=5, current_generation=0):
-        """Recursively get all ancestors of a person."""
-        if current_generation >= max_generations:
-            return []
+    @action(detail=False, methods=['get'])
+    def alive(self, request):
+        """List persons alive on ``?on=YYYY-MM-DD`` or at any time during ``?year=YYYY``.
+
+        Reads birth and death dates from the indexed life event table; persons
+        without a recorded birth date are not included.
+        """
+        on = parse_date_param(request, 'on')
+        year = request.query_params.get('year')
+        if on:
+            start = end = on
+        elif year and year.isdigit() and 1 <= int(year) <= 9999:
+            start, end = date(int(year), 1, 1), date(int(year), 12, 31)
+        else:
+            return Response(
+                {'error': 'Either on (YYYY-MM-DD) or year is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        ancestors = []
-        parent_relationships = FamilyRelationship.objects.filter(
-            relationship_type='parent_child',
-            person2=person
-        )
+        born = LifeEvent.objects.filter(event_type='birth', date__lte=end).values('person_id')
+        died = LifeEvent.objects.filter(event_type='death', date__lt=start).values('person_id')
+        queryset = self.filter_queryset(self.get_queryset()).filter(pk__in=born).exclude(pk__in=died)
+        return self._list_rows(queryset)
+
+    @action(detail=False, methods=['get'], throttle_scope='tree', read_replica=True)
+    def common_ancestors(self, request):
+        """Get the most recent common ancestors of two or more persons (``?ids=a,b``)."""
+        return self._lineage_intersection(request, graph.common_ancestors, 'common_ancestors')
+
+    @action(detail=False, methods=['get'], throttle_scope='tree', read_replica=True)
+    def shared_descendants(self, request):
+        """Get the descendants shared by two or more founders (``?ids=a,b``)."""
+        return self._lineage_intersection(request, graph.shared_descendants, 'shared_descendants')
+
+    def _lineage_intersection(self, request, query, key):
+        """Run a lineage set query and serialize its persons with their generation distances."""
+        person_ids = parse_person_ids(request.query_params.get('ids', ''))
+        if person_ids is None or len(person_ids) < 2:
+            return Response(
+                {'error': 'ids must list at least two person ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(person_ids) > MAX_BATCH_SIZE:
+            return Response(
+                {'error': f'At most {MAX_BATCH_SIZE} ids can be requested at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        for rel in parent_relationships:
-            parent = rel.person1
-            ancestors.append(parent)
+        generations = parse_generations(request, 10, MAX_LINEAGE_GENERATIONS)
+        if generations is None:
+            return Response(
+                {'error': f'generations must be between 1 and {MAX_LINEAGE_GENERATIONS}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-            # Recursively get ancestors of this parent
-            parent_ancestors = self._get_ancestors(
-                parent, max_generations, current_generation + 1
+        if self.scope(Person.objects.filter(pk__in=person_ids)).count() != len(person_ids):
+            return Response(
+                {'error': 'One or more persons not found'},
+                status=status.HTTP_404_NOT_FOUND
             )
-            ancestors.extend(parent_ancestors)
 
-        return ancestors
+        matches = query(person_ids, generations)
+        # Closest relatives first.
+        ordered_ids = sorted(matches, key=lambda match_id: sum(matches[match_id].values()))
+        results = self._serialize_person_ids(ordered_ids)
+        for result in results:
+            # String keys, since the stdlib JSON encoder rejects UUID keys.
+            result['generations'] = {
+                str(person_id): distance for person_id, distance in matches[result['id']].items()
+            }
+
+        return Response({'persons': person_ids, key: results})
+
+    def _serialize_person_ids(self, person_ids):
+        """Serialize persons in the given order using a single ``.values()`` query."""
+        rows = {
+            row['id']: row for row in Person.objects.filter(
+                pk__in=set(person_ids)
+            ).values(*PersonListSerializer.Meta.fields)
+        }
+        return PersonListSerializer.from_rows(
+            rows[person_id] for person_id in person_ids if person_id in rows
+        )
+
+    def _get_descendants(self, person_id, max_generations=5):
+        """Get the ids of all descendants of a person, depth first."""
+        return self._depth_first(graph.load_child_map([person_id], max_generations), person_id, max_generations)
+
+    def _get_ancestors(self, person_id, max_generations=5):
+        """Get the ids of all ancestors of a person, depth first."""
+        return self._depth_first(graph.load_parent_map([person_id], max_generations), person_id, max_generations)
+
+    def _depth_first(self, edges, person_id, max_generations):
+        """Walk a preloaded edge map depth first, so each generation costs one query, not one per person."""
+        if max_generations <= 0:
+            return []
+
+        related_ids = []
+        for related_id in edges.get(person_id, ()):
+            related_ids.append(related_id)
+            related_ids.extend(self._depth_first(edges, related_id, max_generations - 1))
+        return related_ids
 
 
-class FamilyRelationshipViewSet(viewsets.ModelViewSet):
+class FamilyRelationshipViewSet(TreeScopedMixin, viewsets.ModelViewSet):
     """ViewSet for FamilyRelationship model."""
 
     queryset = FamilyRelationship.objects.all()
@@ -135,7 +616,7 @@ class FamilyRelationshipViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """Filter queryset based on query parameters."""
-        queryset = FamilyRelationship.objects.all()
+        queryset = self.scope(FamilyRelationship.objects.select_related('person1', 'person2'))
 
         # Filter by relationship type
         relationship_type = self.request.query_params.get('type', None)
@@ -164,15 +645,22 @@ class FamilyRelationshipViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        persons = self.scope(Person.objects.all())
         try:
-            person1 = Person.objects.get(id=person1_id)
-            person2 = Person.objects.get(id=person2_id)
+            person1 = persons.get(id=person1_id)
+            person2 = persons.get(id=person2_id)
         except Person.DoesNotExist:
             return Response(
                 {'error': 'One or both persons not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
 
+        if person1.tree_id != person2.tree_id:
+            return Response(
+                {'error': 'Both persons must belong to the same family tree'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         # Check if relationship already exists
         existing_relationship = FamilyRelationship.objects.filter(
             relationship_type='spouse',
@@ -212,15 +700,22 @@ class FamilyRelationshipViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        persons = self.scope(Person.objects.all())
         try:
-            parent = Person.objects.get(id=parent_id)
-            child = Person.objects.get(id=child_id)
+            parent = persons.get(id=parent_id)
+            child = persons.get(id=child_id)
         except Person.DoesNotExist:
             return Response(
                 {'error': 'Parent or child not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
 
+        if parent.tree_id != child.tree_id:
+            return Response(
+                {'error': 'Both persons must belong to the same family tree'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         # Check if relationship already exists
         existing_relationship = FamilyRelationship.objects.filter(
             relationship_type='parent_child',
@@ -242,3 +737,243 @@ class FamilyRelationshipViewSet(viewsets.ModelViewSet):
 
         serializer = self.get_serializer(relationship)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class LifeEventViewSet(ReadReplicaMixin, TreeScopedMixin, viewsets.ReadOnlyModelViewSet):
+    """Read-only access to births, deaths, marriages and divorces by date."""
+
+    queryset = LifeEvent.objects.all()
+    serializer_class = LifeEventSerializer
+    tree_lookup = 'person__tree'
+    bucket_sizes = {'year': 1, 'decade': 10, 'century': 100}
+
+    def get_queryset(self):
+        """Filter queryset based on query parameters."""
+        queryset = self.scope(LifeEvent.objects.select_related('person', 'spouse'))
+
+        # Filter by event type
+        event_type = self.request.query_params.get('type', None)
+        if event_type:
+            queryset = queryset.filter(event_type=event_type)
+
+        # Filter by person
+        person_id = self.request.query_params.get('person', None)
+        if person_id:
+            queryset = queryset.filter(Q(person_id=person_id) | Q(spouse_id=person_id))
+
+        # Filter by date range
+        start = parse_date_param(self.request, 'start')
+        if start:
+            queryset = queryset.filter(date__gte=start)
+        end = parse_date_param(self.request, 'end')
+        if end:
+            queryset = queryset.filter(date__lte=end)
+
+        return queryset
+
+    @action(detail=False, methods=['get'], read_replica=True)
+    def timeline(self, request):
+        """Count events per ``bucket`` (year, decade or century), with the same filters as the list."""
+        bucket = request.query_params.get('bucket', 'decade')
+        size = self.bucket_sizes.get(bucket)
+        if size is None:
+            return Response(
+                {'error': 'bucket must be one of year, decade or century'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        counts = self.get_queryset().order_by().annotate(
+            year=ExtractYear('date')
+        ).values('year', 'event_type').annotate(count=Count('id'))
+
+        buckets = {}
+        for row in counts:
+            bucket_start = row['year'] // size * size
+            bucket_counts = buckets.setdefault(
+                bucket_start, dict.fromkeys(dict(LifeEvent.EVENT_TYPES), 0)
+            )
+            bucket_counts[row['event_type']] += row['count']
+
+        return Response({
+            'bucket': bucket,
+            'results': [
+                {'start': bucket_start, 'end': bucket_start + size - 1, **buckets[bucket_start]}
+                for bucket_start in sorted(buckets)
+            ],
+        })
+
+
+class PhotoUploadViewSet(
+    TreeScopedMixin,
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    """Resumable, chunked profile photo uploads.
+
+    Create an upload with ``person``, ``filename`` and ``size``, then ``PUT``
+    the file's bytes to ``chunk/`` in order, each request with an
+    ``Upload-Offset`` header. ``GET`` the upload to find where to resume.
+    """
+
+    queryset = PhotoUpload.objects.all()
+    serializer_class = PhotoUploadSerializer
+    parser_classes = (JSONParser,)
+    tree_lookup = 'person__tree'
+
+    def get_queryset(self):
+        return self.scope(PhotoUpload.objects.all())
+
+    def perform_create(self, serializer):
+        upload = serializer.save()
+        uploads.start(upload)
+
+    @action(detail=True, methods=['put'], parser_classes=[])
+    def chunk(self, request, pk=None):
+        """Stream the raw request body into the upload at ``Upload-Offset``."""
+        upload = self.get_object()
+
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'Upload-Offset and Content-Length headers are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            upload = uploads.write_chunk(upload, offset, request.stream, length)
+        except uploads.UploadError as e:
+            return Response({'error': str(e), 'received': upload.received}, status=e.status)
+
+        serializer = self.get_serializer(upload)
+        return Response(serializer.data)
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Read-only status endpoints for background jobs."""
+
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+
+    def get_queryset(self):
+        """Filter queryset based on query parameters."""
+        queryset = Job.objects.all()
+
+        # Filter by status
+        job_status = self.request.query_params.get('status', None)
+        if job_status:
+            queryset = queryset.filter(status=job_status)
+
+        # Filter by task name
+        task = self.request.query_params.get('task', None)
+        if task:
+            queryset = queryset.filter(task=task)
+
+        return queryset
+
+    @action(detail=True, methods=['post'])
+    def retry(self, request, pk=None):
+        """Requeue a failed job with a fresh set of attempts."""
+        job = self.get_object()
+
+        if job.status != 'failed':
+            return Response(
+                {'error': 'Only failed jobs can be retried'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        job.status = 'pending'
+        job.attempts = 0
+        job.run_after = timezone.now()
+        job.save(update_fields=['status', 'attempts', 'run_after', 'updated_at'])
+
+        serializer = self.get_serializer(job)
+        return Response(serializer.data)
+
+
+class ChangeFeedViewSet(TreeScopedMixin, viewsets.ViewSet):
+    """Incremental change feed backed by the append-only ``ChangeLog`` table."""
+
+    default_limit = 500
+    max_limit = 1000
+
+    def list(self, request):
+        """Return the persons and relationships changed after the ``since`` cursor.
+
+        Without ``since`` only the current cursor is returned, so a client can
+        do one full fetch and then poll for deltas from that point. Several
+        changes to the same object within a batch collapse into one entry.
+
+        Ids are assigned on insert but become visible on commit, so an entry
+        can appear after one with a higher id. The cursor therefore never
+        moves past entries younger than ``FAMILY_CHANGE_FEED_SETTLE_SECONDS``:
+        every change whose transaction commits within that time of the write
+        is delivered.
+        """
+        changes = self.scope(ChangeLog.objects.all())
+        settled_before = timezone.now() - timedelta(seconds=settings.FAMILY_CHANGE_FEED_SETTLE_SECONDS)
+        since = request.query_params.get('since')
+        if since is None:
+            return Response({
+                'cursor': ChangeLog.latest_cursor(changes.filter(created_at__lte=settled_before)),
+                'has_more': False,
+            })
+
+        try:
+            since = int(since)
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            return Response(
+                {'error': 'since and limit must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if limit < 1:
+            return Response(
+                {'error': 'limit must be positive'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        entries = list(changes.filter(id__gt=since).values_list(
+            'id', 'model', 'object_id', 'action', 'created_at'
+        )[:limit + 1])
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        # Stop at the first entry that has not settled; it is delivered by a later poll.
+        for position, entry in enumerate(entries):
+            if entry[4] > settled_before:
+                entries = entries[:position]
+                has_more = False
+                break
+
+        # Keep only the last action per object; anything but a delete is an upsert.
+        latest_actions = {}
+        for _, model, object_id, action, _ in entries:
+            latest_actions[(model, object_id)] = action
+        deleted = {'person': [], 'relationship': []}
+        upserted = {'person': [], 'relationship': []}
+        for (model, object_id), action in latest_actions.items():
+            (deleted if action == 'delete' else upserted)[model].append(object_id)
+
+        # Upserts are read at their current state; an object deleted after the
+        # batch was read shows up as a delete in a later batch.
+        persons = Person.objects.filter(pk__in=upserted['person'])
+        relationships = FamilyRelationship.objects.filter(
+            pk__in=upserted['relationship']
+        ).select_related('person1', 'person2')
+        context = {'request': request, 'tree': self.tree}
+
+        return Response({
+            'cursor': entries[-1][0] if entries else since,
+            'has_more': has_more,
+            'persons': {
+                'upserted': PersonSerializer(persons, many=True, context=context).data,
+                'deleted': deleted['person'],
+            },
+            'relationships': {
+                'upserted': FamilyRelationshipSerializer(relationships, many=True, context=context).data,
+                'deleted': deleted['relationship'],
+            },
+        })
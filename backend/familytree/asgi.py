@@ -9,8 +9,17 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
+from django.urls import get_resolver
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'familytree.settings')
 
 application = get_asgi_application()
+
+# With FAMILY_PRELOAD_URLCONF, import the URLconf, views and DRF now instead
+# of on the first request. That only pays off when the app is loaded before
+# forking (e.g. gunicorn --preload), where it is done once for all workers;
+# otherwise it just moves the cost from the first request to worker start.
+if settings.FAMILY_PRELOAD_URLCONF:
+    url_patterns = get_resolver().url_patterns
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import logging
+import os
 import traceback
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +47,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'family.middleware.CompressionMiddleware',
+    'family.middleware.QueryBudgetMiddleware',
+    'family.middleware.ReadYourWritesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,6 +78,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'familytree.wsgi.application'
+ASGI_APPLICATION = 'familytree.asgi.application'
 
 
 # Database
@@ -83,9 +88,19 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # A read replica for the heavy read-only endpoints; enable it with
+    # FAMILY_REPLICA_DATABASE = 'replica'. For local testing a copy of the
+    # primary works (python manage.py refresh_replica).
+    # 'replica': {
+    #     'ENGINE': 'django.db.backends.sqlite3',
+    #     'NAME': BASE_DIR / 'db.replica.sqlite3',
+    #     'TEST': {'MIRROR': 'default'},
+    # },
 }
 
+DATABASE_ROUTERS = ['family.replicas.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -140,11 +155,23 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'family.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.FormParser',
     ],
+    # Only views and actions that set a throttle_scope are throttled, per client address.
+    'DEFAULT_THROTTLE_CLASSES': [
+        'rest_framework.throttling.ScopedRateThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'tree': '300/min',
+        'bulk_write': '60/min',
+    },
     # 'EXCEPTION_HANDLER': 'familytree.settings.custom_exception_handler',
 }
 
@@ -175,8 +202,62 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'upload-offset',
+    'x-primary-until',
+]
+
+# Read-your-writes pin after a write (family.replicas), echoed back by the frontend.
+CORS_EXPOSE_HEADERS = [
+    'x-primary-until',
 ]
 
+# Family app settings
+
+# Uploaded profile photos are downscaled in the background to fit this box.
+FAMILY_PHOTO_MAX_DIMENSION = 1024
+
+# Resumable photo uploads are written here chunk by chunk until complete.
+# Keep it on the same filesystem as MEDIA_ROOT so finished files are moved, not copied.
+FAMILY_PHOTO_UPLOAD_DIR = BASE_DIR / 'uploads'
+FAMILY_PHOTO_UPLOAD_MAX_BYTES = 50 * 1024 * 1024
+
+# Tree snapshots: the family_tree payload of a root is stored once it has been
+# requested this many times, for up to this many roots besides pinned ones.
+# Hit counts are written to the database every FAMILY_SNAPSHOT_FLUSH_SECONDS.
+FAMILY_SNAPSHOT_MIN_HITS = 100
+FAMILY_SNAPSHOT_MAX_COUNT = 200
+FAMILY_SNAPSHOT_FLUSH_SECONDS = 30
+
+# Development guard against query regressions: requests to family views that
+# run more than FAMILY_QUERY_BUDGET queries, or the same query more than
+# FAMILY_QUERY_REPEAT_LIMIT times (an N+1 loop), are logged with the code
+# location of each query, or fail when the action is 'raise'.
+FAMILY_QUERY_BUDGET_ENABLED = DEBUG
+FAMILY_QUERY_BUDGET = 30
+FAMILY_QUERY_REPEAT_LIMIT = 5
+FAMILY_QUERY_BUDGET_ACTION = 'log'
+
+# Database alias that tree traversals and reports read from (family.replicas),
+# or None to read everything from default. After a write, a client reads from
+# default for FAMILY_REPLICA_PIN_SECONDS so it sees its own changes; set this
+# above the replica's usual replication lag.
+FAMILY_REPLICA_DATABASE = None
+FAMILY_REPLICA_PIN_SECONDS = 5
+FAMILY_REPLICA_PIN_COOKIE = 'family_primary_until'
+
+# The change feed only hands out entries at least this old, so that writes
+# still committing when a client polls are not skipped by its cursor. Keep it
+# above the longest transaction that writes persons or relationships.
+FAMILY_CHANGE_FEED_SETTLE_SECONDS = 5
+
+# Memory budget for the per-process cache of computed tree layouts.
+FAMILY_LAYOUT_CACHE_BYTES = 32 * 1024 * 1024
+
+# Import the URLconf when the WSGI/ASGI application loads rather than on the
+# first request. Enable it (FAMILY_PRELOAD_URLCONF=1) only for servers that
+# load the application before forking workers, such as gunicorn --preload.
+FAMILY_PRELOAD_URLCONF = os.environ.get('FAMILY_PRELOAD_URLCONF') == '1'
+
 def custom_exception_handler(exc, context):
     """Custom exception handler to return JSON responses instead of HTML debug pages."""
     from rest_framework.views import exception_handler
@@ -54,15 +54,23 @@ export interface PaginatedResponse<T> {
 }
 
 class ApiService {
+  // Set by the API after a write when reads may come from a lagging replica;
+  // sending it back keeps this client's reads on the primary until then.
+  private primaryUntil: string | null = null;
+
   private async request<T>(endpoint: string, options: RequestInit = {}): Promise<T> {
     const url = `${API_BASE_URL}${endpoint}`;
-    const response = await fetch(url, {
-      headers: {
-        'Content-Type': 'application/json',
-        ...options.headers,
-      },
-      ...options,
-    });
+    // Requests that pass their own headers (e.g. FormData uploads) replace the default ones.
+    const headers = new Headers(options.headers ?? { 'Content-Type': 'application/json' });
+    if (this.primaryUntil) {
+      headers.set('X-Primary-Until', this.primaryUntil);
+    }
+    const response = await fetch(url, { ...options, headers });
+
+    const primaryUntil = response.headers.get('X-Primary-Until');
+    if (primaryUntil) {
+      this.primaryUntil = primaryUntil;
+    }
 
     if (!response.ok) {
       throw new Error(`API request failed: ${response.status} ${response.statusText}`);